@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem
+from .models import Order, OrderItem, DailySalesStat
 
 # 在後台admin資料庫中建立顯示訂單的資料表
 class OrderAdmin(admin.ModelAdmin):
@@ -17,5 +17,9 @@ class OrderItemAdmin(admin.ModelAdmin):
     def __str__(self):
         return f"{self.order.user.username} ({self.order.client_name})"
 
+class DailySalesStatAdmin(admin.ModelAdmin):
+    list_display = ('date', 'category', 'product_name', 'total_quantity', 'total_amount')
+
 admin.site.register(Order, OrderAdmin)
 admin.site.register(OrderItem, OrderItemAdmin)
+admin.site.register(DailySalesStat, DailySalesStatAdmin)
@@ -0,0 +1,82 @@
+import csv
+import json
+
+from django.utils import timezone
+
+from .models import Order, OrderItem
+from .stats import filter_by_date
+
+# 每次從資料庫讀取的筆數
+CHUNK_SIZE = 1000
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+ORDER_FIELDS = ('id', 'order_id', 'user_id', 'client_name', 'email', 'address', 'phone', 'created_at', 'paid_amount')
+ITEM_FIELDS = ('item_id', 'product_id', 'product_name', 'product_category', 'price', 'quantity')
+
+
+def format_value(value):
+    if hasattr(value, 'tzinfo'):
+        return timezone.localtime(value).isoformat()
+    if value is None or isinstance(value, (int, str)):
+        return value
+    return str(value)
+
+
+# 每筆訂單一列，商品項放在 items 中
+def iter_orders(start=None, end=None):
+    orders = filter_by_date(Order.objects.order_by('id'), 'created_at', start, end)
+    orders = orders.prefetch_related('items__product')
+
+    for order in orders.iterator(chunk_size=CHUNK_SIZE):
+        row = {field: format_value(getattr(order, field)) for field in ORDER_FIELDS}
+        row['items'] = [
+            {
+                'item_id': item.id,
+                'product_id': item.product_id,
+                'product_name': item.product.name,
+                'product_category': item.product.category,
+                'price': format_value(item.price),
+                'quantity': item.quantity,
+            }
+            for item in order.items.all()
+        ]
+        yield row
+
+
+# 每個商品項一列，並附上訂單欄位
+def iter_order_items(start=None, end=None):
+    items = filter_by_date(OrderItem.objects.order_by('order_id', 'id'), 'order__created_at', start, end)
+    items = items.values_list(
+        *[f'order__{field}' if field != 'id' else 'order_id' for field in ORDER_FIELDS],
+        'id', 'product_id', 'product__name', 'product__category', 'price', 'quantity',
+    )
+
+    columns = ORDER_FIELDS + ITEM_FIELDS
+    for values in items.iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip(columns, map(format_value, values)))
+
+
+class Echo:
+    # 給 csv.writer 使用，直接回傳寫入的內容
+    def write(self, value):
+        return value
+
+
+# 依格式產生輸出內容 (一次一列)，CSV 只支援攤平的商品項
+def iter_export(export_format='csv', flat=False, start=None, end=None):
+    if export_format == 'csv' or flat:
+        rows = iter_order_items(start, end)
+        columns = ORDER_FIELDS + ITEM_FIELDS
+    else:
+        rows = iter_orders(start, end)
+        columns = None
+
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([row[column] for column in columns])
+    else:
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
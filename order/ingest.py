@@ -0,0 +1,285 @@
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+
+from product.models import Product
+from .models import Order, OrderItem
+from .stats import record_order_items
+
+logger = logging.getLogger(__name__)
+
+
+# 建立一筆訂單與商品項 (需在交易中呼叫)
+# cart 為 [(product_id, price, quantity), ...]，products 為 {product_id: Product}
+def write_order(user_id, order_fields, cart, products, order_id=None):
+    order = Order(user_id=user_id, **order_fields)
+    if order_id is not None:
+        order.order_id = order_id
+    order.save()
+
+    order_items = OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=products[product_id],
+            price=price,
+            quantity=quantity,
+        )
+        for product_id, price, quantity in cart
+    ])
+
+    # 更新每日銷售統計
+    record_order_items(order, order_items)
+    return order, order_items
+
+
+# 訂單排隊寫入 (ORDER_INGEST_MODE = 'queued')
+# 請求只把訂單寫入本機日誌檔就回傳，背景執行緒再把多筆訂單放在同一個交易中寫入資料庫。
+# 日誌檔採用群組提交：同時送出的訂單由日誌執行緒一次寫入並 fsync，同步到磁碟後才回覆請求。
+# 每個 worker 使用自己的日誌檔 (檔名含行程編號)，啟動時會接手已結束行程留下的日誌檔；
+# 訂單狀態存放在快取中，多個 worker 時需設定共用的快取 (CACHES) 才能在任一 worker 查詢。
+# 日誌檔在每批寫入後清空，程式重啟時會把尚未寫入資料庫的訂單重新排入。
+class OrderIngestQueue:
+    # 訂單狀態保留的秒數
+    STATUS_TIMEOUT = 24 * 60 * 60
+
+    def __init__(self, journal_path, batch_size=200, flush_interval=0.05):
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # lock 保護日誌檔 (寫入與清空)，condition 保護等待寫入日誌檔的訂單
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.journal_buffer = []
+        self.journal_thread = None
+        self.queue = queue.Queue()
+        self.thread = None
+        self.pid = os.getpid()
+
+    # 寫入日誌檔並排入佇列，回傳暫時的訂單編號
+    # 等待日誌執行緒把這筆訂單連同同時送出的訂單一起 fsync 後才回傳
+    def submit(self, user_id, order_fields, cart):
+        entry = {
+            'order_id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'order': order_fields,
+            'items': cart,
+        }
+        ticket = {'entry': entry, 'done': False, 'error': None}
+
+        with self.condition:
+            if self.journal_thread is None:
+                self.journal_thread = threading.Thread(target=self.run_journal, name='order-journal', daemon=True)
+                self.journal_thread.start()
+            self.journal_buffer.append(ticket)
+            self.condition.notify_all()
+            while not ticket['done']:
+                self.condition.wait()
+
+        if ticket['error'] is not None:
+            raise ticket['error']
+        return entry['order_id']
+
+    # 日誌執行緒：取出目前等待中的所有訂單，寫入日誌檔後只 fsync 一次
+    def run_journal(self):
+        while True:
+            with self.condition:
+                while not self.journal_buffer:
+                    self.condition.wait()
+                tickets, self.journal_buffer = self.journal_buffer, []
+
+            error = None
+            try:
+                self.write_journal([ticket['entry'] for ticket in tickets])
+            except Exception as exception:
+                logger.exception('訂單日誌檔寫入失敗')
+                error = exception
+
+            with self.condition:
+                for ticket in tickets:
+                    ticket['done'] = True
+                    ticket['error'] = error
+                self.condition.notify_all()
+
+    def write_journal(self, entries):
+        lines = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+
+        with self.lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as journal:
+                journal.write(lines)
+                journal.flush()
+                os.fsync(journal.fileno())
+            cache.set_many({status_key(entry['order_id']): ('pending', None) for entry in entries},
+                           self.STATUS_TIMEOUT)
+            for entry in entries:
+                self.queue.put(entry)
+
+    # 啟動背景寫入執行緒 (會先接手已結束行程的日誌檔，再把日誌檔中尚未寫入的訂單重新排入)
+    def start(self, orphan_journals=()):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='order-ingest', daemon=True)
+        for path in orphan_journals:
+            self.adopt(path)
+        self.recover()
+        self.thread.start()
+
+    # 接手其他行程的日誌檔：先改名取得 (多個 worker 同時啟動時只有一個能成功)，再附加到自己的日誌檔
+    def adopt(self, path):
+        claimed = f'{path}.{os.getpid()}.claim'
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            return
+
+        with open(claimed, encoding='utf-8') as orphan:
+            lines = orphan.read()
+        with self.lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as journal:
+                journal.write(lines)
+                journal.flush()
+                os.fsync(journal.fileno())
+        os.remove(claimed)
+        logger.info('接手訂單日誌檔 %s', path)
+
+    def recover(self):
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path, encoding='utf-8') as journal:
+            entries = [json.loads(line) for line in journal if line.strip()]
+
+        written = set(
+            str(order_id) for order_id in
+            Order.objects.filter(order_id__in=[entry['order_id'] for entry in entries])
+            .values_list('order_id', flat=True)
+        )
+        pending = [entry for entry in entries if entry['order_id'] not in written]
+        cache.set_many({status_key(entry['order_id']): ('pending', None) for entry in pending},
+                       self.STATUS_TIMEOUT)
+        for entry in pending:
+            self.queue.put(entry)
+        logger.info('訂單日誌檔重新排入 %s 筆訂單', len(pending))
+
+    def run(self):
+        while True:
+            try:
+                self.drain(block=True)
+            except Exception:
+                logger.exception('訂單批次寫入失敗')
+                time.sleep(1)
+            finally:
+                close_old_connections()
+
+    # 取出一批訂單並在同一個交易中寫入，回傳處理的筆數
+    def drain(self, block=False):
+        try:
+            entries = [self.queue.get(block=block)]
+        except queue.Empty:
+            return 0
+
+        while len(entries) < self.batch_size:
+            try:
+                entries.append(self.queue.get(timeout=self.flush_interval) if block else self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        failed = {}
+        try:
+            self.write_batch(entries, failed)
+        except Exception:
+            # 整批寫入失敗 (例如資料庫被鎖住)，訂單仍在日誌檔中，重新排入稍後再試
+            for entry in entries:
+                self.queue.put(entry)
+            raise
+
+        cache.delete_many([status_key(entry['order_id']) for entry in entries if entry['order_id'] not in failed])
+        cache.set_many({status_key(order_id): ('failed', message) for order_id, message in failed.items()},
+                       self.STATUS_TIMEOUT)
+
+        with self.lock:
+            # 佇列都寫入後清空日誌檔
+            if self.queue.empty():
+                open(self.journal_path, 'w').close()
+
+        return len(entries)
+
+    def write_batch(self, entries, failed):
+        products = Product.objects.in_bulk({item[0] for entry in entries for item in entry['items']})
+
+        with transaction.atomic():
+            for entry in entries:
+                missing_ids = sorted({item[0] for item in entry['items']} - products.keys())
+                if missing_ids:
+                    failed[entry['order_id']] = f'找不到商品 {missing_ids}'
+                    continue
+                try:
+                    # 每筆訂單使用 savepoint，單筆失敗不影響同一批的其他訂單
+                    with transaction.atomic():
+                        write_order(entry['user_id'], entry['order'], entry['items'], products,
+                                    order_id=entry['order_id'])
+                except Exception as error:
+                    logger.exception('訂單 %s 寫入失敗', entry['order_id'])
+                    failed[entry['order_id']] = str(error)
+
+
+def status_key(order_id):
+    return f'order-ingest:{order_id}'
+
+
+# 查詢排隊中的訂單狀態，回傳 ('pending' | 'failed' | None, 訊息)
+def ingest_status(order_id):
+    return cache.get(status_key(order_id), (None, None))
+
+
+# 已結束行程留下的日誌檔 (ORDER_INGEST_JOURNAL 中的 {pid} 換成其他行程編號)
+def orphan_journals(template):
+    template = str(template)
+    if '{pid}' not in template:
+        return []
+
+    prefix, suffix = template.split('{pid}', 1)
+    orphans = []
+    for path in glob.glob(glob.escape(prefix) + '*' + glob.escape(suffix)):
+        pid = path[len(prefix):len(path) - len(suffix)]
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            orphans.append(path)
+        except OSError:
+            # 行程存在但屬於其他使用者
+            pass
+    return orphans
+
+
+_ingest_queue = None
+_ingest_lock = threading.Lock()
+
+
+# 取得這個行程的訂單佇列 (第一次使用時啟動背景寫入)
+# fork 出來的 worker 不沿用父行程的佇列，改用自己行程編號的日誌檔
+def get_ingest_queue():
+    global _ingest_queue
+
+    with _ingest_lock:
+        if _ingest_queue is None or _ingest_queue.pid != os.getpid():
+            template = str(settings.ORDER_INGEST_JOURNAL)
+            _ingest_queue = OrderIngestQueue(
+                template.format(pid=os.getpid()),
+                batch_size=settings.ORDER_INGEST_BATCH_SIZE,
+                flush_interval=settings.ORDER_INGEST_FLUSH_INTERVAL,
+            )
+            _ingest_queue.start(orphan_journals(template))
+    return _ingest_queue
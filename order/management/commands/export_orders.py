@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from order.export import EXPORT_FORMATS, iter_export
+
+
+# 匯出訂單
+# python manage.py export_orders --type csv --start 2023-01-01 --end 2023-12-31 --output orders.csv
+class Command(BaseCommand):
+    help = '串流匯出訂單與商品項 (CSV / NDJSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', default='csv', choices=EXPORT_FORMATS, help='匯出格式')
+        parser.add_argument('--flat', action='store_true', help='每個商品項一列 (CSV 一律攤平)')
+        parser.add_argument('--start', help='開始日期 YYYY-MM-DD')
+        parser.add_argument('--end', help='結束日期 YYYY-MM-DD')
+        parser.add_argument('--output', help='輸出檔案 (預設輸出到畫面)')
+
+    def handle(self, *args, **options):
+        start = self.parse_date(options['start'])
+        end = self.parse_date(options['end'])
+        lines = iter_export(options['type'], options['flat'], start, end)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+
+    def parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'日期格式錯誤: {value}')
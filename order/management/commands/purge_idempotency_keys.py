@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from order.models import IdempotencyKey
+
+
+# 刪除過期的訂單冪等鍵
+# python manage.py purge_idempotency_keys
+class Command(BaseCommand):
+    help = '刪除過期的訂單 Idempotency-Key'
+
+    def handle(self, *args, **options):
+        count, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(self.style.SUCCESS(f'已刪除 {count} 筆過期的 Idempotency-Key'))
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from order.stats import rebuild_daily_stats
+
+
+# 重新計算每日銷售統計
+# python manage.py rebuild_order_stats --start 2023-01-01 --end 2023-12-31
+class Command(BaseCommand):
+    help = '依訂單商品項重新計算每日銷售統計'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='開始日期 YYYY-MM-DD (預設為最早的訂單)')
+        parser.add_argument('--end', help='結束日期 YYYY-MM-DD (預設為最新的訂單)')
+
+    def handle(self, *args, **options):
+        start = self.parse_date(options['start'])
+        end = self.parse_date(options['end'])
+        if start and end and start > end:
+            raise CommandError('開始日期不可晚於結束日期')
+
+        count = rebuild_daily_stats(start, end)
+        self.stdout.write(self.style.SUCCESS(f'已重新計算 {count} 筆每日銷售統計'))
+
+    def parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'日期格式錯誤: {value}')
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum, F, ExpressionWrapper, IntegerField
+from django.db.models.functions import TruncDate
+
+
+# 以既有訂單建立每日銷售統計
+def build_daily_stats(apps, schema_editor):
+    OrderItem = apps.get_model('order', 'OrderItem')
+    DailySalesStat = apps.get_model('order', 'DailySalesStat')
+
+    daily_stats = (
+        OrderItem.objects
+        .annotate(order_date=TruncDate('order__created_at'))
+        .values('order_date', 'product_id', 'product__category', 'product__name')
+        .annotate(
+            total_quantity=Sum('quantity'),
+            total_amount=Sum(ExpressionWrapper(
+                F('quantity') * F('price'),
+                output_field=IntegerField()
+            ))
+        )
+        .order_by()
+    )
+
+    DailySalesStat.objects.bulk_create([
+        DailySalesStat(
+            date=stat['order_date'],
+            product_id=stat['product_id'],
+            category=stat['product__category'],
+            product_name=stat['product__name'],
+            total_quantity=stat['total_quantity'],
+            total_amount=stat['total_amount'],
+        )
+        for stat in daily_stats
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0001_initial'),
+        ('order', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('category', models.CharField(max_length=50)),
+                ('product_name', models.CharField(max_length=50)),
+                ('total_quantity', models.IntegerField(default=0)),
+                ('total_amount', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='product.product')),
+            ],
+            options={
+                'ordering': ['date', 'category', 'product_name'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesstat',
+            constraint=models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_sales_stat'),
+        ),
+        migrations.RunPython(build_daily_stats, migrations.RunPython.noop),
+    ]
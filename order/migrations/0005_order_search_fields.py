@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:09
+
+from django.db import migrations, models
+import re
+
+
+# 為既有訂單產生查詢欄位
+def fill_search_fields(apps, schema_editor):
+    Order = apps.get_model('order', 'Order')
+
+    batch = []
+    for order in Order.objects.only('id', 'order_id', 'client_name', 'phone').iterator(chunk_size=1000):
+        order.search_order_id = str(order.order_id).replace('-', '').lower()
+        order.search_name = (order.client_name or '').strip().lower()
+        order.search_phone = re.sub(r'\D', '', order.phone or '')
+        batch.append(order)
+        if len(batch) >= 1000:
+            Order.objects.bulk_update(batch, ['search_order_id', 'search_name', 'search_phone'])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ['search_order_id', 'search_name', 'search_phone'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='search_order_id',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='search_phone',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_search_fields, migrations.RunPython.noop),
+    ]
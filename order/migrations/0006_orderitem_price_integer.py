@@ -0,0 +1,78 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:20
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+# 將字串價格轉成整數，無法轉換的資料列出後停止
+def parse_price(value):
+    try:
+        price = Decimal(str(value).strip().replace(',', ''))
+    except InvalidOperation:
+        return None
+    if price != price.to_integral_value() or price < 0:
+        return None
+    return int(price)
+
+
+def copy_prices(apps, schema_editor):
+    OrderItem = apps.get_model('order', 'OrderItem')
+
+    invalid = []
+    batch = []
+    for item in OrderItem.objects.only('id', 'price').iterator(chunk_size=1000):
+        item.price_int = parse_price(item.price)
+        if item.price_int is None:
+            invalid.append(f'{item.id}: {item.price!r}')
+            continue
+        batch.append(item)
+        if len(batch) >= 1000:
+            OrderItem.objects.bulk_update(batch, ['price_int'])
+            batch = []
+
+    if invalid:
+        raise ValueError('訂單商品項價格無法轉換為整數 - ' + ', '.join(invalid))
+
+    OrderItem.objects.bulk_update(batch, ['price_int'])
+
+
+def copy_prices_back(apps, schema_editor):
+    OrderItem = apps.get_model('order', 'OrderItem')
+    OrderItem.objects.update(price=Cast('price_int', models.CharField(max_length=10)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_order_search_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='price_int',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='price',
+            field=models.CharField(max_length=10, null=True),
+        ),
+        migrations.RunPython(copy_prices, copy_prices_back),
+        migrations.RemoveField(
+            model_name='orderitem',
+            name='price',
+        ),
+        migrations.RenameField(
+            model_name='orderitem',
+            old_name='price_int',
+            new_name='price',
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(),
+        ),
+    ]
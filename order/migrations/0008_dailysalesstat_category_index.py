@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailysalesstat',
+            index=models.Index(fields=['category', 'date'], name='daily_sales_category_date_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0009_idempotencykey_request_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailysalesstat',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='dailysalesstat',
+            index=models.Index(fields=['updated'], name='daily_sales_updated_idx'),
+        ),
+    ]
@@ -1,8 +1,32 @@
 from django.db import models
 from simple_jwt.models import Staff
 from product.models import Product
+import re
 import uuid
 
+
+# 查詢用的正規化字串
+def normalize_phone(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def normalize_name(value):
+    return (value or '').strip().lower()
+
+
+def normalize_order_id(value):
+    return str(value or '').replace('-', '').lower()
+
+
+class OrderQuerySet(models.QuerySet):
+    # 批次建立訂單時也要填入查詢欄位
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.fill_search_fields()
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class Order(models.Model):
     user = models.ForeignKey(Staff, related_name='orders', on_delete=models.CASCADE)
     order_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -12,19 +36,89 @@ class Order(models.Model):
     phone = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
     paid_amount = models.IntegerField()
+
+    # 訂單查詢索引 (儲存時自動產生)
+    search_order_id = models.CharField(max_length=32, db_index=True, editable=False, default='')
+    search_name = models.CharField(max_length=100, db_index=True, editable=False, default='')
+    search_phone = models.CharField(max_length=100, db_index=True, editable=False, default='')
+
+    objects = OrderQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at',]
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='order_created_at_id_idx'),
+            models.Index(fields=['user', '-created_at'], name='order_user_created_at_idx'),
+        ]
     
     def __str__(self):
         return self.client_name
 
+    def fill_search_fields(self):
+        self.search_order_id = normalize_order_id(self.order_id)
+        self.search_name = normalize_name(self.client_name)
+        self.search_phone = normalize_phone(self.phone)
+
+    def save(self, *args, **kwargs):
+        self.fill_search_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'search_order_id', 'search_name', 'search_phone'}
+        super().save(*args, **kwargs)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, related_name='items', on_delete=models.CASCADE)
-    price = models.CharField(max_length=10)
+    price = models.PositiveIntegerField()
     quantity = models.IntegerField(default=1)
 
     def __str__(self):
         return '%s' % self.id
+
+
+# 每日商品銷售統計 (訂單建立、刪除時更新，統計 API 直接讀取)
+class DailySalesStat(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, related_name='daily_stats', on_delete=models.CASCADE)
+    category = models.CharField(max_length=50)
+    product_name = models.CharField(max_length=50)
+    total_quantity = models.IntegerField(default=0)
+    total_amount = models.IntegerField(default=0)
+    # 最後更新時間，統計的 ETag 依此判斷資料是否變動
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date', 'category', 'product_name']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_daily_sales_stat'),
+        ]
+        # 依分類統計；日期區間的查詢使用 unique_daily_sales_stat
+        indexes = [
+            models.Index(fields=['category', 'date'], name='daily_sales_category_date_idx'),
+            models.Index(fields=['updated'], name='daily_sales_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product_name}"
+
+
+# 訂單冪等鍵 (同一個 Idempotency-Key 重送時回傳第一次的結果)
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(Staff, related_name='idempotency_keys', on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    order = models.ForeignKey(Order, related_name='idempotency_keys', on_delete=models.CASCADE)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+    # 第一次請求內容的 SHA-256，同一個鍵送出不同內容時拒絕 (舊資料為空字串)
+    request_hash = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,42 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# 訂單列表分頁 (依建立時間新到舊，使用 cursor 不受新增訂單影響)
+# 每頁筆數可用 settings.ORDER_PAGE_SIZE 設定，或以 ?page_size= 指定
+class OrderCursorPagination(CursorPagination):
+    ordering = ('-created_at', 'id')
+    page_size = getattr(settings, 'ORDER_PAGE_SIZE', 20)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'ORDER_MAX_PAGE_SIZE', 100)
+
+
+# 訂單查詢分頁 (?limit=&offset=)，多取一筆判斷是否有下一頁，不另外計算總筆數
+class OrderSearchPagination(LimitOffsetPagination):
+    default_limit = 20
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+        return results[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
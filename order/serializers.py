@@ -1,17 +1,45 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
+from product.models import Product
+from product.serializers import PriceField
 from .models import Order, OrderItem
 
 
+# 商品摘要 (訂單商品項使用 ?expand=product 時附上)
+class ProductSummarySerializer(serializers.ModelSerializer):
+    image = serializers.ImageField(use_url=True, read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ('id', 'name', 'category', 'image')
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
+    price = PriceField()
+
     class Meta:
         model = OrderItem
         fields = "__all__"
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+
+        request = self.context.get('request')
+        if request is not None and 'product' in request.query_params.get('expand', '').split(','):
+            data['product_summary'] = ProductSummarySerializer(instance.product, context=self.context).data
+
+        return data
+
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
     
     class Meta:
         model = Order
-        fields = "__all__"
+        exclude = ('search_order_id', 'search_name', 'search_phone')
 
+    # 一次取得訂單的商品項與商品，避免每筆訂單各查詢一次
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product')))
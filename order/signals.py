@@ -0,0 +1,11 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import Order
+from .stats import record_order_items
+
+
+# 刪除訂單時(包含刪除會員連帶刪除的訂單)扣除每日銷售統計
+@receiver(pre_delete, sender=Order)
+def remove_order_from_daily_stats(sender, instance, **kwargs):
+    record_order_items(instance, instance.items.select_related('product'), sign=-1)
@@ -0,0 +1,163 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Sum, F
+from django.db.models.functions import TruncDate, TruncDay, TruncWeek, TruncMonth, TruncYear
+from django.utils import timezone
+
+from .models import OrderItem, DailySalesStat
+
+
+# 依訂單商品項更新每日銷售統計 (sign=-1 代表扣除，例如刪除訂單)
+def record_order_items(order, items, sign=1):
+    day = timezone.localdate(order.created_at)
+
+    totals = defaultdict(lambda: {'total_quantity': 0, 'total_amount': 0})
+    products = {}
+    for item in items:
+        products[item.product_id] = item.product
+        totals[item.product_id]['total_quantity'] += sign * item.quantity
+        totals[item.product_id]['total_amount'] += sign * item.quantity * item.price
+
+    if not totals:
+        return
+
+    # 加上目前已存在的統計數字，一次寫回 (新增或覆蓋)
+    existing = (
+        DailySalesStat.objects
+        .select_for_update()
+        .filter(date=day, product_id__in=totals.keys())
+        .values('product_id', 'total_quantity', 'total_amount')
+    )
+    for stat in existing:
+        totals[stat['product_id']]['total_quantity'] += stat['total_quantity']
+        totals[stat['product_id']]['total_amount'] += stat['total_amount']
+
+    DailySalesStat.objects.bulk_create(
+        [
+            DailySalesStat(
+                date=day,
+                product_id=product_id,
+                category=products[product_id].category,
+                product_name=products[product_id].name,
+                **total,
+            )
+            for product_id, total in totals.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['date', 'product'],
+        update_fields=['category', 'product_name', 'total_quantity', 'total_amount', 'updated'],
+    )
+
+    if sign < 0:
+        DailySalesStat.objects.filter(
+            date=day, product_id__in=totals.keys(), total_quantity__lte=0).delete()
+
+
+# 當地日期的開始時間
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+# 依當地日期篩選時間欄位 (start、end 皆包含，可省略)
+# 轉成時間區間比較，查詢才能使用時間欄位的索引 (__date 會逐筆轉換時區)
+def filter_by_date(queryset, field, start=None, end=None):
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': day_start(start)})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lt': day_start(end + timedelta(days=1))})
+    return queryset
+
+
+# 從訂單商品項重新計算每日銷售統計 (start、end 為當地日期，可省略)
+def rebuild_daily_stats(start=None, end=None):
+    stats = DailySalesStat.objects.all()
+    if start:
+        stats = stats.filter(date__gte=start)
+    if end:
+        stats = stats.filter(date__lte=end)
+    items = filter_by_date(OrderItem.objects.all(), 'order__created_at', start, end)
+
+    daily_stats = (
+        items
+        .annotate(order_date=TruncDate('order__created_at'))
+        .values('order_date', 'product_id', 'product__category', 'product__name')
+        .annotate(
+            total_quantity=Sum('quantity'),
+            total_amount=Sum(F('quantity') * F('price'))
+        )
+        .order_by()
+    )
+
+    rows = [
+        DailySalesStat(
+            date=stat['order_date'],
+            product_id=stat['product_id'],
+            category=stat['product__category'],
+            product_name=stat['product__name'],
+            total_quantity=stat['total_quantity'],
+            total_amount=stat['total_amount'],
+        )
+        for stat in daily_stats
+    ]
+
+    with transaction.atomic():
+        stats.delete()
+        DailySalesStat.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+# 統計的時間區間 (以當地日期分組)
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+
+# 將分組日期轉成當地時區的時間字串，例如 2023-11-01T00:00:00+0800
+def format_bucket(day):
+    return day_start(day).strftime('%Y-%m-%dT%H:%M:%S%z')
+
+
+# 依時間區間統計每個分類、商品的總數量與總金額
+# 回傳格式: [{'order_date': ..., 'items': [{'product_category', 'product_name', 'total_quantity', 'total_amount'}]}]
+def aggregate_sales(granularity='day', start=None, end=None, category=None, descending=False):
+    trunc = GRANULARITIES[granularity]
+
+    stats = DailySalesStat.objects.all()
+    if start:
+        stats = stats.filter(date__gte=start)
+    if end:
+        stats = stats.filter(date__lte=end)
+    if category:
+        stats = stats.filter(category=category)
+
+    bucket_order = '-bucket' if descending else 'bucket'
+    rows = (
+        stats
+        .annotate(bucket=trunc('date'))
+        .values('bucket', 'category', 'product_name')
+        .annotate(
+            total_quantity=Sum('total_quantity'),
+            total_amount=Sum('total_amount')
+        )
+        .order_by(bucket_order, 'category', 'product_name')
+    )
+
+    # 以字典依時間區間分組，每一筆資料只處理一次
+    buckets = {}
+    for row in rows:
+        buckets.setdefault(row['bucket'], []).append({
+            'product_category': row['category'],
+            'product_name': row['product_name'],
+            'total_quantity': row['total_quantity'],
+            'total_amount': row['total_amount'],
+        })
+
+    return [
+        {'order_date': format_bucket(day), 'items': items}
+        for day, items in buckets.items()
+    ]
@@ -1,3 +1,707 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from simple_jwt.models import Staff
+from product.models import Product
+from .ingest import OrderIngestQueue, orphan_journals
+from .views import prefix_upper_bound
+from .models import Order, OrderItem, DailySalesStat, IdempotencyKey
+
+
+class OrderCreateTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = [
+            Product.objects.create(category='粽子', name=f'粽子{i}', price=100, complete=True)
+            for i in range(40)
+        ]
+
+    def order_data(self, products):
+        return {
+            'client_name': '王小明',
+            'email': 'client@example.com',
+            'address': '台北市',
+            'phone': '0912345678',
+            'paid_amount': 100 * len(products),
+            'items': [{'id': product.id, 'price': product.price, 'quantity': 1} for product in products],
+        }
+
+    def post_order(self, products):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/front_order/', self.order_data(products), format='json')
+        return response, len(queries)
+
+    def test_create_order(self):
+        response, _ = self.post_order(self.products[:3])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['order']['items']), 3)
+        self.assertEqual(OrderItem.objects.filter(order__user=self.user).count(), 3)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        _, small_cart = self.post_order(self.products[:1])
+        _, large_cart = self.post_order(self.products)
+
+        self.assertEqual(small_cart, large_cart)
+
+    def test_unknown_product_creates_nothing(self):
+        data = self.order_data(self.products[:2])
+        data['items'].append({'id': 999999, 'price': '100', 'quantity': 1})
+
+        response = self.client.post('/api/v1/front_order/', data, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['product_ids'], [999999])
+        self.assertFalse(Order.objects.exists())
+
+    def test_negative_price_is_rejected(self):
+        data = self.order_data(self.products[:2])
+        data['items'][0]['price'] = -5
+
+        response = self.client.post('/api/v1/front_order/', data, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_non_positive_quantity_is_rejected(self):
+        for quantity in (-3, 0):
+            data = self.order_data(self.products[:2])
+            data['items'][1]['quantity'] = quantity
+
+            response = self.client.post('/api/v1/front_order/', data, format='json')
+
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(DailySalesStat.objects.exists())
+
+    def test_out_of_range_values_are_rejected(self):
+        for field, value in (('quantity', 10 ** 20), ('price', 10 ** 20), ('id', 10 ** 20), ('paid_amount', 10 ** 20)):
+            data = self.order_data(self.products[:2])
+            if field == 'paid_amount':
+                data[field] = value
+            else:
+                data['items'][0][field] = value
+
+            response = self.client.post('/api/v1/front_order/', data, format='json')
+
+            self.assertEqual(response.status_code, 400, field)
+        self.assertFalse(Order.objects.exists())
+
+
+class DailySalesStatTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(category='粽子', name='鮮肉粽', price=100, complete=True)
+
+    def create_order(self, quantity):
+        data = {
+            'client_name': '王小明',
+            'email': 'client@example.com',
+            'address': '台北市',
+            'phone': '0912345678',
+            'paid_amount': 100 * quantity,
+            'items': [{'id': self.product.id, 'price': '100', 'quantity': quantity}],
+        }
+        response = self.client.post('/api/v1/front_order/', data, format='json')
+        return Order.objects.get(pk=response.data['order']['id'])
+
+    def test_stats_follow_order_create_and_delete(self):
+        first = self.create_order(2)
+        self.create_order(3)
+
+        stat = DailySalesStat.objects.get(product=self.product)
+        self.assertEqual((stat.total_quantity, stat.total_amount), (5, 500))
+
+        self.client.delete(f'/api/v1/delete_order/{first.id}/')
+        stat.refresh_from_db()
+        self.assertEqual((stat.total_quantity, stat.total_amount), (3, 300))
+
+    def test_daily_stats_endpoint_reads_rollup(self):
+        self.create_order(2)
+
+        response = self.client.get('/api/v1/daily_order_stats/')
+
+        self.assertEqual(response.data[0]['items'], [{
+            'product_category': '粽子',
+            'product_name': '鮮肉粽',
+            'total_quantity': 2,
+            'total_amount': 200,
+        }])
+
+    def test_rebuild_matches_incremental_stats(self):
+        self.create_order(2)
+        self.create_order(4)
+        DailySalesStat.objects.update(total_quantity=0, total_amount=0)
+
+        call_command('rebuild_order_stats', stdout=StringIO())
+
+        stat = DailySalesStat.objects.get(product=self.product)
+        self.assertEqual((stat.total_quantity, stat.total_amount), (6, 600))
+
+
+class OrderStatsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cake = Product.objects.create(category='鬆糕', name='桂花鬆糕', price=400)
+        dumpling = Product.objects.create(category='粽子', name='鮮肉粽', price=100)
+        for day, product, quantity in [
+            (date(2023, 6, 20), dumpling, 3),
+            (date(2023, 6, 21), dumpling, 2),
+            (date(2023, 6, 21), cake, 1),
+            (date(2023, 7, 1), cake, 2),
+        ]:
+            DailySalesStat.objects.create(
+                date=day, product=product, category=product.category, product_name=product.name,
+                total_quantity=quantity, total_amount=quantity * product.price)
+
+    def test_monthly_buckets(self):
+        response = self.client.get('/api/v1/order_stats/', {'granularity': 'month', 'start': '2023-06-01'})
+
+        self.assertEqual([stat['order_date'] for stat in response.data],
+                         ['2023-06-01T00:00:00+0800', '2023-07-01T00:00:00+0800'])
+        self.assertEqual(response.data[0]['items'], [
+            {'product_category': '粽子', 'product_name': '鮮肉粽', 'total_quantity': 5, 'total_amount': 500},
+            {'product_category': '鬆糕', 'product_name': '桂花鬆糕', 'total_quantity': 1, 'total_amount': 400},
+        ])
+
+    def test_category_and_date_range(self):
+        response = self.client.get('/api/v1/order_stats/', {
+            'granularity': 'day', 'start': '2023-06-21', 'end': '2023-06-30', 'category': '粽子'})
+
+        self.assertEqual(response.data, [{
+            'order_date': '2023-06-21T00:00:00+0800',
+            'items': [{'product_category': '粽子', 'product_name': '鮮肉粽', 'total_quantity': 2, 'total_amount': 200}],
+        }])
+
+    def test_invalid_granularity(self):
+        response = self.client.get('/api/v1/order_stats/', {'granularity': 'hour'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_date_without_orders(self):
+        response = self.client.post('/api/v1/search_date_order_stats/', {'search': '2023-01-01'}, format='json')
+
+        self.assertEqual(response.data, [{'order_date': '2023-01-01T00:00:00+0800', 'items': []}])
+
+    def test_search_date_invalid_type(self):
+        for search in (5, None, ['2023-01-01'], 'abc'):
+            response = self.client.post('/api/v1/search_date_order_stats/', {'search': search}, format='json')
+            self.assertEqual(response.status_code, 400, search)
+
+
+# 統計由唯讀的統計資料庫讀取，不查詢主資料庫
+class OrderStatsAnalyticsTests(TransactionTestCase):
+    databases = {'default', 'analytics'}
+
+    def setUp(self):
+        self.client = APIClient()
+        dumpling = Product.objects.create(category='粽子', name='鮮肉粽', price=100)
+        DailySalesStat.objects.create(
+            date=date(2023, 6, 20), product=dumpling, category=dumpling.category, product_name=dumpling.name,
+            total_quantity=3, total_amount=300)
+
+    def test_stats_read_from_analytics_database(self):
+        with mock.patch('server.analytics.analytics_alias', return_value='analytics'), \
+                CaptureQueriesContext(connection) as primary_queries, \
+                CaptureQueriesContext(connections['analytics']) as analytics_queries:
+            response = self.client.get('/api/v1/order_stats/', {'granularity': 'month', 'start': '2023-06-01'})
+
+        self.assertEqual(response.data[0]['items'][0]['total_quantity'], 3)
+        self.assertEqual(len(primary_queries), 0)
+        self.assertGreater(len(analytics_queries), 0)
+
+    def test_export_streams_from_analytics_database(self):
+        self.client.force_authenticate(Staff.objects.create_user(
+            username='admin', password='pass', email='admin@example.com'))
+
+        with mock.patch('server.analytics.analytics_alias', return_value='analytics'), \
+                CaptureQueriesContext(connection) as primary_queries, \
+                CaptureQueriesContext(connections['analytics']) as analytics_queries:
+            response = self.client.get('/api/v1/order_export/')
+            b''.join(response.streaming_content)
+
+        self.assertEqual(len(primary_queries), 0)
+        self.assertGreater(len(analytics_queries), 0)
+
+
+class OrderPaginationTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for _ in range(25):
+            self.create_order()
+
+    def create_order(self):
+        return Order.objects.create(user=self.user, client_name='王小明', address='台北市',
+                                    phone='0912345678', paid_amount=100)
+
+    def test_cursor_pages_are_stable_under_inserts(self):
+        seen = []
+        url = '/api/v1/all_orders/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            seen += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+            # 翻頁期間有新訂單建立，不應出現重複或遺漏
+            self.create_order()
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_user_orders_are_paginated(self):
+        response = self.client.get(f'/api/v1/user_orders/{self.user.id}/', {'page_size': 5})
+
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['next'])
+
+
+class OrderConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.create_order()
+
+    def create_order(self):
+        return Order.objects.create(user=self.user, client_name='王小明', address='台北市',
+                                    phone='0912345678', paid_amount=100)
+
+    def test_not_modified_until_orders_change(self):
+        # 304 時只執行驗證值的查詢 (訂單列表另外查詢商品水位 (展開商品時使用)；統計另外查詢每日銷售統計與商品水位)
+        for url, query_count in [('/api/v1/all_orders/', 2), (f'/api/v1/user_orders/{self.user.id}/', 2),
+                                 ('/api/v1/order_stats/', 3), ('/api/v1/daily_order_stats/', 3),
+                                 ('/api/v1/yearly_order_stats/', 3)]:
+            response = self.client.get(url)
+            etag = response['ETag']
+
+            with CaptureQueriesContext(connection) as queries:
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(not_modified.status_code, 304, url)
+            self.assertEqual(len(queries), query_count, url)
+
+            order = self.create_order()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200, url)
+
+            etag = self.client.get(url)['ETag']
+            order.delete()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200, url)
+
+    def test_product_and_sales_changes_update_etag(self):
+        product = Product.objects.create(category='粽子', name='鮮肉粽', price=100, complete=True)
+        for url in ['/api/v1/all_orders/', f'/api/v1/user_orders/{self.user.id}/', '/api/v1/order_stats/']:
+            etag = self.client.get(url)['ETag']
+            product.name = f'{product.name}*'
+            product.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200, url)
+
+        etag = self.client.get('/api/v1/order_stats/')['ETag']
+        DailySalesStat.objects.create(date=timezone.localdate(), product=product, category=product.category,
+                                      product_name=product.name, total_quantity=1, total_amount=100)
+        self.assertEqual(self.client.get('/api/v1/order_stats/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleted_rows_are_not_hidden_by_last_modified(self):
+        # 刪除資料不會讓時間水位變大，所以不提供 Last-Modified，If-Modified-Since 不會回傳 304
+        for url in ['/api/v1/all_orders/', '/api/v1/daily_order_stats/']:
+            response = self.client.get(url)
+            self.assertNotIn('Last-Modified', response, url)
+
+            self.create_order().delete()
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_query_params_change_etag(self):
+        first = self.client.get('/api/v1/order_stats/', {'granularity': 'day'})
+        second = self.client.get('/api/v1/order_stats/', {'granularity': 'month'})
+
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+
+class OrderSerializationQueryTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(category='粽子', name='鮮肉粽', price=100, complete=True)
+
+    def seed_orders(self, count):
+        Order.objects.all().delete()
+        orders = Order.objects.bulk_create([
+            Order(user=self.user, client_name='王小明', address='台北市', phone='0912345678', paid_amount=100)
+            for _ in range(count)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.product, price=100, quantity=1) for order in orders
+        ])
+
+    def count_queries(self, url, count):
+        self.seed_orders(count)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_search_query_count_is_constant(self):
+        url = '/api/v1/order/search/?search=王小明&expand=product'
+        counts = [self.count_queries(url, count) for count in (1, 100, 1000)]
+
+        self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_user_orders_query_count_is_constant(self):
+        url = f'/api/v1/user_orders/{self.user.id}/?page_size=100&expand=product'
+        counts = [self.count_queries(url, count) for count in (1, 100, 1000)]
+
+        self.assertEqual(len(set(counts)), 1, counts)
+
+    def test_expand_product_summary(self):
+        self.seed_orders(1)
+
+        response = self.client.get('/api/v1/all_orders/?expand=product')
+
+        item = response.data['results'][0]['items'][0]
+        self.assertEqual(item['product_summary']['name'], '鮮肉粽')
+        self.assertEqual(item['product_summary']['category'], '粽子')
+
+
+class OrderSearchTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_order(self, client_name, phone):
+        return Order.objects.create(user=self.user, client_name=client_name, address='台北市',
+                                    phone=phone, paid_amount=100)
+
+    def search(self, term, **params):
+        response = self.client.get('/api/v1/order/search/', {'search': term, **params})
+        return [order['id'] for order in response.data['results']], response.data
+
+    def test_phone_prefix_ignores_formatting(self):
+        order = self.create_order('王小明', '0912-345-678')
+        self.create_order('李小華', '0988-000-111')
+
+        ids, _ = self.search('0912 345')
+
+        self.assertEqual(ids, [order.id])
+
+    def test_name_is_case_insensitive(self):
+        order = self.create_order('Amy Chen', '0912345678')
+
+        ids, _ = self.search('amy')
+
+        self.assertEqual(ids, [order.id])
+
+    def test_order_id_prefix_ranks_first(self):
+        by_name = self.create_order('abc', '0912345678')
+        by_id = self.create_order('王小明', '0988000111')
+        prefix = by_id.search_order_id[:6]
+        Order.objects.filter(pk=by_name.pk).update(search_name=prefix)
+
+        ids, _ = self.search(prefix.upper())
+
+        self.assertEqual(ids, [by_id.id, by_name.id])
+
+    def test_prefix_outside_basic_plane(self):
+        order = self.create_order('\U00020000小明', '0912345678')
+        self.create_order('\U00020001小華', '0988000111')
+
+        ids, _ = self.search('\U00020000')
+
+        self.assertEqual(ids, [order.id])
+
+    def test_prefix_upper_bound(self):
+        self.assertEqual(prefix_upper_bound('ab'), 'ac')
+        self.assertEqual(prefix_upper_bound('王\uffff'), '王\U00010000')
+        self.assertEqual(prefix_upper_bound('a\U0010ffff'), 'b')
+        self.assertEqual(prefix_upper_bound('\ud7ff'), '\ue000')
+        self.assertIsNone(prefix_upper_bound('\U0010ffff'))
+
+    def test_short_digits_do_not_match_phone(self):
+        self.create_order('王小明', '0912345678')
+
+        ids, _ = self.search('09')
+
+        self.assertEqual(ids, [])
+
+    def test_results_are_limited(self):
+        for _ in range(5):
+            self.create_order('王小明', '0912345678')
+
+        ids, data = self.search('王', limit=2)
+
+        self.assertEqual(len(ids), 2)
+        self.assertIsNotNone(data['next'])
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category='粽子', name='鮮肉粽', price=100)
+        self.order = Order.objects.create(user=self.user, client_name='王小明', address='台北市',
+                                          phone='0912345678', paid_amount=300)
+        OrderItem.objects.create(order=self.order, product=product, price=100, quantity=1)
+        OrderItem.objects.create(order=self.order, product=product, price=100, quantity=2)
+
+    def test_csv_export_streams_flat_items(self):
+        response = self.client.get('/api/v1/order_export/', {'type': 'csv'})
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('id,order_id,'))
+
+    def test_ndjson_export_nests_items(self):
+        response = self.client.get('/api/v1/order_export/', {'type': 'ndjson'})
+
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['order_id'], str(self.order.order_id))
+        self.assertEqual([item['quantity'] for item in rows[0]['items']], [1, 2])
+
+    def test_export_command_filters_by_date(self):
+        output = StringIO()
+
+        call_command('export_orders', '--type', 'ndjson', '--flat', '--end', '2000-01-01', stdout=output)
+
+        self.assertEqual(output.getvalue(), '')
+
+
+class OrderIdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        product = Product.objects.create(category='粽子', name='鮮肉粽', price=100, complete=True)
+        self.data = {
+            'client_name': '王小明',
+            'email': 'client@example.com',
+            'address': '台北市',
+            'phone': '0912345678',
+            'paid_amount': 100,
+            'items': [{'id': product.id, 'price': 100, 'quantity': 1}],
+        }
+
+    def post(self, key):
+        return self.client.post('/api/v1/front_order/', self.data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_original_order(self):
+        first = self.post('checkout-1')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.post('checkout-1')
+
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(len(queries), 1)
+
+    def test_expired_key_creates_new_order(self):
+        self.post('checkout-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.post('checkout-1')
+
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_reused_key_with_different_body_is_rejected(self):
+        self.post('checkout-1')
+        self.data['items'][0]['quantity'] = 2
+        response = self.post('checkout-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_different_keys_create_separate_orders(self):
+        self.post('checkout-1')
+        self.post('checkout-2')
+
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class OrderIngestQueueTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(category='粽子', name='鮮肉粽', price=100, complete=True)
+
+        journal_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(journal_dir.cleanup)
+        self.journal = os.path.join(journal_dir.name, 'orders.ndjson')
+        self.queue = OrderIngestQueue(self.journal)
+
+        patcher = mock.patch('order.views.get_ingest_queue', return_value=self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def order_fields(self):
+        return {'client_name': '王小明', 'email': '', 'address': '台北市', 'phone': '0912345678', 'paid_amount': 200}
+
+    @override_settings(ORDER_INGEST_MODE='queued')
+    def test_queued_order_is_written_in_batch(self):
+        data = {**self.order_fields(), 'items': [{'id': self.product.id, 'price': 100, 'quantity': 2}]}
+        responses = [self.client.post('/api/v1/front_order/', data, format='json') for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [202] * 3)
+        self.assertFalse(Order.objects.exists())
+        order_id = responses[0].data['order_id']
+        self.assertEqual(self.client.get(f'/api/v1/order_status/{order_id}/').data['status'], 'pending')
+
+        self.assertEqual(self.queue.drain(), 3)
+
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(self.client.get(f'/api/v1/order_status/{order_id}/').data['status'], 'created')
+        self.assertEqual(os.path.getsize(self.journal), 0)
+
+    @override_settings(ORDER_INGEST_MODE='queued')
+    def test_failed_order_reports_status(self):
+        order_id = self.queue.submit(self.user.id, self.order_fields(), [(self.product.id, 100, 1)])
+        self.product.delete()
+
+        self.queue.drain()
+
+        response = self.client.get(f'/api/v1/order_status/{order_id}/')
+        self.assertEqual(response.data['status'], 'failed')
+
+    def test_recover_requeues_unwritten_orders(self):
+        written = self.queue.submit(self.user.id, self.order_fields(), [(self.product.id, 100, 1)])
+        self.queue.drain()
+
+        # 模擬程式在寫入資料庫前中斷：日誌檔中有一筆已寫入、一筆尚未寫入的訂單
+        with open(self.journal, 'w', encoding='utf-8') as journal:
+            for order_id in (written, str(uuid.uuid4())):
+                entry = {'order_id': order_id, 'user_id': self.user.id, 'order': self.order_fields(),
+                         'items': [[self.product.id, 100, 1]]}
+                journal.write(json.dumps(entry) + '\n')
+
+        recovered = OrderIngestQueue(self.journal)
+        recovered.recover()
+
+        self.assertEqual(recovered.drain(), 1)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_concurrent_submits_share_one_fsync(self):
+        # 第一次 fsync 時讓其他請求送出，它們應該在下一次 fsync 一起寫入
+        started = threading.Event()
+        fsync = os.fsync
+
+        def slow_fsync(fd):
+            started.set()
+            time.sleep(0.2)
+            fsync(fd)
+
+        with mock.patch('order.ingest.os.fsync', side_effect=slow_fsync) as patched:
+            first = threading.Thread(target=self.queue.submit,
+                                     args=(self.user.id, self.order_fields(), [(self.product.id, 100, 1)]))
+            first.start()
+            started.wait()
+            others = [
+                threading.Thread(target=self.queue.submit,
+                                 args=(self.user.id, self.order_fields(), [(self.product.id, 100, 1)]))
+                for _ in range(5)
+            ]
+            for thread in others:
+                thread.start()
+            for thread in [first, *others]:
+                thread.join()
+
+        self.assertLess(patched.call_count, 6)
+        with open(self.journal, encoding='utf-8') as journal:
+            self.assertEqual(len(journal.readlines()), 6)
+        self.assertEqual(self.queue.drain(), 6)
+
+    @override_settings(ORDER_INGEST_MODE='queued')
+    def test_status_is_shared_between_workers(self):
+        order_id = self.queue.submit(self.user.id, self.order_fields(), [(self.product.id, 100, 1)])
+
+        # 其他 worker 的佇列 (不同的日誌檔) 也能查到訂單狀態
+        other = OrderIngestQueue(self.journal + '.other')
+        with mock.patch('order.views.get_ingest_queue', return_value=other):
+            response = self.client.get(f'/api/v1/order_status/{order_id}/')
+
+        self.assertEqual(response.data['status'], 'pending')
+
+    def test_start_adopts_journal_of_exited_worker(self):
+        template = os.path.join(os.path.dirname(self.journal), 'orders.{pid}.ndjson')
+        orphan = template.format(pid=4194305)
+        order_id = str(uuid.uuid4())
+        with open(orphan, 'w', encoding='utf-8') as journal:
+            entry = {'order_id': order_id, 'user_id': self.user.id, 'order': self.order_fields(),
+                     'items': [[self.product.id, 100, 1]]}
+            journal.write(json.dumps(entry) + '\n')
+
+        self.assertEqual(orphan_journals(template), [orphan])
+        for path in orphan_journals(template):
+            self.queue.adopt(path)
+        self.queue.recover()
+
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(self.queue.drain(), 1)
+        self.assertTrue(Order.objects.filter(order_id=order_id).exists())
+
+
+# 訂單商品項字串價格轉成整數的資料遷移 (order 0006)
+class OrderItemPriceMigrationTests(TransactionTestCase):
+    before = [('order', '0005_order_search_fields')]
+    after = [('order', '0006_orderitem_price_integer')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    # 只有 order 回到舊版本，員工與商品的資料表仍為目前的結構，使用目前的模型建立
+    def create_item(self, apps, price):
+        user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        product = Product.objects.create(category='粽子', name='鮮肉粽', price=100)
+        order = apps.get_model('order', 'Order').objects.create(
+            user_id=user.id, client_name='王小明', address='台北市', phone='0912345678', paid_amount=100)
+        return apps.get_model('order', 'OrderItem').objects.create(
+            order=order, product_id=product.id, price=price, quantity=1).id
+
+    def test_prices_are_converted_and_reverted(self):
+        item_id = self.create_item(self.migrate(self.before), '1,200')
+
+        apps = self.migrate(self.after)
+        self.assertEqual(apps.get_model('order', 'OrderItem').objects.get(id=item_id).price, 1200)
+
+        apps = self.migrate(self.before)
+        self.assertEqual(apps.get_model('order', 'OrderItem').objects.get(id=item_id).price, '1200')
+
+    def test_invalid_price_stops_migration(self):
+        apps = self.migrate(self.before)
+        item_id = self.create_item(apps, '-3')
+
+        with self.assertRaisesMessage(ValueError, '訂單商品項價格無法轉換為整數'):
+            self.migrate(self.after)
+
+        # 修正資料後可以重新執行
+        apps.get_model('order', 'OrderItem').objects.filter(id=item_id).update(price='3')
+        apps = self.migrate(self.after)
+        self.assertEqual(apps.get_model('order', 'OrderItem').objects.get(id=item_id).price, 3)
@@ -10,11 +10,17 @@ urlpatterns = [
     path('', include(router.urls)),
     path('user_orders/<int:user_id>/', views.OrderViewSet.as_view({'get': 'user_orders'}),
          name='user_orders'),
+    path('order_status/<uuid:order_id>/', views.OrderStatus.as_view(),
+         name='order_status'),                                             # 查詢訂單建立狀態
     path('delete_order/<int:pk>/', views.DeleteOrderViewSet.as_view({'delete': 'destroy'}),
          name='delete_order'),
     path('order/search/', views.SearchOrderViewSet.as_view({'get': 'search'}),
          name='order_search'),                                             # 查詢訂單
+    path('order_export/', views.ExportOrders.as_view(),
+         name='order_export'),                                             # 匯出訂單 (CSV / NDJSON)
 
+    path('order_stats/', views.OrderStats.as_view(),
+         name='order_stats'),                                              # 依查詢參數取得訂單統計
     path('daily_order_stats/', views.DailyOrderStats.as_view(),
          name='daily_order_stats'),                                        # 取得當日訂單統計
     path('monthly_order_stats/', views.MonthlyOrderStats.as_view(),
@@ -1,7 +1,12 @@
 from django.shortcuts import render
 from .serializers import OrderSerializer
-from .models import Order, OrderItem
+from .models import Order, DailySalesStat, IdempotencyKey, normalize_order_id, normalize_phone, normalize_name
+from .ingest import get_ingest_queue, ingest_status, write_order
+from .pagination import OrderCursorPagination, OrderSearchPagination
+from .export import EXPORT_FORMATS, iter_export
 from product.models import Product
+from server.conditional import conditional, watermarks
+from server.analytics import analytics_reads, iter_analytics
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -10,21 +15,53 @@ from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.exceptions import APIException
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
+from django.db.models import Q, Case, When, Value, IntegerField
+import hashlib
+import json
+import re
 
 # 統計訂單時使用
-from django.db.models.functions import TruncDay, TruncMonth, TruncYear
-from django.db.models import Sum, F, ExpressionWrapper, IntegerField
+from .stats import GRANULARITIES, aggregate_sales, format_bucket
 from django.utils import timezone
-from datetime import timedelta, datetime
-from collections import defaultdict
+from datetime import date, datetime
 
 
 # ======================  後台 API  ====================== #
 # 取得所有訂單
 class AllOrdersViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Order.objects.all()
+    queryset = OrderSerializer.setup_eager_loading(Order.objects.all())
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+
+    @conditional(lambda request: watermarks((Order.objects.all(), 'created_at'),
+                                            (Product.objects.all(), 'updated')))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+# 大於所有以 prefix 開頭字串的最小字串 (最後一個字元的 code point 加一)，沒有上限時回傳 None
+def prefix_upper_bound(prefix):
+    while prefix:
+        code_point = ord(prefix[-1]) + 1
+        # 略過 surrogate (無法以 UTF-8 儲存)
+        if 0xD800 <= code_point <= 0xDFFF:
+            code_point = 0xE000
+        if code_point <= 0x10FFFF:
+            return prefix[:-1] + chr(code_point)
+        prefix = prefix[:-1]
+    return None
+
+
+# 以前綴查詢索引欄位 (使用範圍條件，任何資料庫都能使用索引)
+def prefix_filter(field, prefix):
+    upper_bound = prefix_upper_bound(prefix)
+    if upper_bound is None:
+        return Q(**{f'{field}__gte': prefix})
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper_bound})
 
 
 # 取得查詢的訂單
@@ -32,29 +69,52 @@ class SearchOrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderSearchPagination
+
+    # 訂單編號、電話至少需要的前綴長度 (太短的前綴幾乎符合所有訂單，只依姓名查詢)
+    MIN_PREFIX_LENGTH = 4
 
-    # 查詢
+    # 查詢 - 依訂單編號、電話、姓名前綴查詢，排序為 訂單編號 > 電話 > 姓名
     @action(detail=False, methods=['GET'])
     def search(self, request):
         query_params = self.request.query_params
 
-        search = query_params.get('search').strip('/')
-
-        queryset = Order.objects.all()
-
-        order_id = queryset.filter(order_id__icontains=search)
-        client_name = queryset.filter(client_name__icontains=search)
-        phone = queryset.filter(phone__icontains=search)
-
-        if order_id:
-            queryset = order_id
-        elif client_name:
-            queryset = client_name
-        elif phone:
-            queryset = phone
+        search = query_params.get('search', '').strip().strip('/')
+        if not search:
+            return Response({"message": "請輸入查詢內容"}, status=status.HTTP_400_BAD_REQUEST)
+
+        order_id = normalize_order_id(search)
+        phone = normalize_phone(search)
+        name = normalize_name(search)
+
+        conditions = []
+        if len(order_id) >= self.MIN_PREFIX_LENGTH and re.fullmatch(r'[0-9a-f]+', order_id):
+            conditions.append((prefix_filter('search_order_id', order_id), 0))
+        if len(phone) >= self.MIN_PREFIX_LENGTH:
+            conditions.append((prefix_filter('search_phone', phone), 1))
+        conditions.append((prefix_filter('search_name', name), 2))
+
+        if len(conditions) == 1:
+            # 只依姓名查詢時不需排序名次
+            queryset = Order.objects.filter(conditions[0][0]).order_by('-created_at', 'id')
+        else:
+            matches = Q()
+            for condition, _ in conditions:
+                matches |= condition
+
+            queryset = (
+                Order.objects
+                .filter(matches)
+                .annotate(rank=Case(
+                    *[When(condition, then=Value(rank)) for condition, rank in conditions],
+                    output_field=IntegerField(),
+                ))
+                .order_by('rank', '-created_at', 'id')
+            )
+        page = self.paginate_queryset(OrderSerializer.setup_eager_loading(queryset))
 
-        serializer = OrderSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        serializer = OrderSerializer(page, many=True, context={'request': request})
+        return self.get_paginated_response(serializer.data)
 
 
 # 刪除一筆訂單
@@ -81,366 +141,285 @@ class DeleteOrderViewSet(viewsets.ViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+# 匯出訂單 (串流輸出) - type(csv/ndjson)、flat、start、end(YYYY-MM-DD)
+class ExportOrders(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query_params = request.query_params
+
+        export_format = query_params.get('type', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({"message": "匯出格式只能是 csv、ndjson"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start = parse_stats_date(query_params.get('start'))
+            end = parse_stats_date(query_params.get('end'))
+        except ValueError:
+            return Response({"message": "日期格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
+
+        flat = query_params.get('flat') in ('1', 'true')
+        content_type = 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson; charset=utf-8'
+
+        response = StreamingHttpResponse(
+            iter_analytics(iter_export(export_format, flat, start, end)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
+
 # ==========================  統計訂單 - 資料視覺化  ========================== #
-# 根據當日做統計 - 取得日期、分類、商品、總數量、總金額
-class DailyOrderStats(APIView):
+# 統計都由唯讀的統計資料庫讀取 (server/analytics.py)，驗證值也依統計資料庫的訂單水位產生
+# 訂單統計的驗證值 (依訂單、每日銷售統計與商品的水位，當日、當年度的統計也會隨日期改變)
+def order_stats_validators(request, *args, **kwargs):
+    version = watermarks(
+        (Order.objects.all(), 'created_at'),
+        (DailySalesStat.objects.all(), 'updated'),
+        (Product.objects.all(), 'updated'),
+    )
+    return f'{version}|{timezone.localdate()}'
+
+
+# 依查詢參數統計訂單 - granularity(day/week/month/year)、start、end(YYYY-MM-DD)、category
+class OrderStats(APIView):
+    @analytics_reads()
+    @conditional(order_stats_validators)
     def get(self, request):
-        # 取得目前日期
-        current_time = timezone.now()
-        today = current_time.astimezone(
-            timezone.get_current_timezone()).date() + timedelta(hours=8)
-
-        daily_stats = (
-            OrderItem.objects
-            .filter(order__created_at__date=today)
-            .values('order__created_at', 'product__category', 'product__name')
-            .annotate(
-                total_quantity=Sum('quantity'),
-                total_amount=Sum(ExpressionWrapper(
-                    F('quantity') * F('price'),
-                    output_field=IntegerField()
-                ))
-            )
-            .order_by('order__created_at', 'product__category', 'product__name')
-        )
-
-        # 初始化字典格式
-        stats_dict = {'order_date': today.strftime(
-            '%Y-%m-%dT00:00:00+0800'), 'items': []}
-
-        # 合併相同商品名稱的數據
-        product_data = defaultdict(
-            lambda: {'total_quantity': 0, 'total_amount': 0})
-        for stat in daily_stats:
-            product_category = stat['product__category']
-            product_name = stat['product__name']
-            total_quantity = stat['total_quantity']
-            total_amount = stat['total_amount']
-
-            # 檢查所有商品名稱和分類是否有相同的，有相同只要增加數量和金額
-            found = False
-            for item in stats_dict['items']:
-                if item['product_category'] == product_category and item['product_name'] == product_name:
-                    item['total_quantity'] += total_quantity
-                    item['total_amount'] += total_amount
-                    found = True
-                    break
-
-            if not found:
-                stats_dict['items'].append({
-                    'product_category': product_category,
-                    'product_name': product_name,
-                    'total_quantity': total_quantity,
-                    'total_amount': total_amount
-                })
-
-        formatted_data = [stats_dict]
+        query_params = request.query_params
+
+        granularity = query_params.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return Response({"message": "統計區間只能是 day、week、month、year"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start = parse_stats_date(query_params.get('start'))
+            end = parse_stats_date(query_params.get('end'))
+        except ValueError:
+            return Response({"message": "日期格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
 
+        formatted_data = aggregate_sales(granularity, start, end, query_params.get('category'))
         return Response(formatted_data)
 
 
+# 解析查詢日期 (YYYY-MM-DD)
+def parse_stats_date(value):
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+# 一天的統計，沒有訂單時仍回傳當天日期
+def one_day_stats(day):
+    formatted_data = aggregate_sales('day', day, day)
+    if not formatted_data:
+        formatted_data = [{'order_date': format_bucket(day), 'items': []}]
+    return formatted_data
+
+
+# 根據當日做統計 - 取得日期、分類、商品、總數量、總金額
+class DailyOrderStats(APIView):
+    @analytics_reads()
+    @conditional(order_stats_validators)
+    def get(self, request):
+        return Response(one_day_stats(timezone.localdate()))
+
+
 # 根據每月做統計 (當年度)
 class MonthlyOrderStats(APIView):
+    @analytics_reads()
+    @conditional(order_stats_validators)
     def get(self, request):
-        # 取得目前日期
-        current_time = timezone.now()
-        today = current_time + timezone.timedelta(hours=8)
-
-        monthly_stats = (
-            OrderItem.objects
-            .filter(order__created_at__year=today.year)             # 篩選今年的訂單
-            .annotate(order_month=TruncMonth('order__created_at'))  # 擷取至每月初的資料
-            .values('order_month', 'product__category', 'product__name')
-            .annotate(
-                total_quantity=Sum('quantity'),
-                total_amount=Sum(ExpressionWrapper(
-                    F('quantity') * F('price'),
-                    output_field=IntegerField()
-                ))
-            )
-            .order_by('order_month', 'product__category', 'product__name')
-        )
-
-        # 初始化字典格式
-        stats_dict = defaultdict(lambda: {'order_date': None, 'items': []})
-
-        # 合併相同商品名字和分類的數據
-        for stat in monthly_stats:
-            order_month = stat['order_month']
-            product_category = stat['product__category']
-            product_name = stat['product__name']
-            total_quantity = stat['total_quantity']
-            total_amount = stat['total_amount']
-
-            order_month_str = order_month.strftime('%Y-%m-%dT00:00:00+0800')
-
-            if stats_dict[order_month_str]['order_date'] is None:
-                stats_dict[order_month_str]['order_date'] = order_month_str
-                stats_dict[order_month_str]['items'] = []  # 增加 'items' 列表
-
-            # 檢查所有商品名字和分類是否有相同的，有相同只要增加數量和金額
-            found = False
-            for item in stats_dict[order_month_str]['items']:
-                if item['product_category'] == product_category and item['product_name'] == product_name:
-                    item['total_quantity'] += total_quantity
-                    item['total_amount'] += total_amount
-                    found = True
-                    break
-
-            if not found:
-                stats_dict[order_month_str]['items'].append({
-                    'product_category': product_category,
-                    'product_name': product_name,
-                    'total_quantity': total_quantity,
-                    'total_amount': total_amount
-                })
-
-        formatted_data = list(stats_dict.values())
-
-        return Response(formatted_data)
+        today = timezone.localdate()
+        return Response(aggregate_sales('month', date(today.year, 1, 1), date(today.year, 12, 31)))
 
 
 # 根據當年度統計所有訂單
 class YearlyOrderStats(APIView):
+    @analytics_reads()
+    @conditional(order_stats_validators)
     def get(self, request):
-        # 取得目前日期
-        current_time = timezone.now()
-        today = current_time + timezone.timedelta(hours=8)
-
-        yearly_stats = (
-            OrderItem.objects
-            .filter(order__created_at__year=today.year)           # 篩選今年的訂單
-            .annotate(order_year=TruncYear('order__created_at'))  # 擷取至年初的訂單
-            .values('order_year', 'product__category', 'product__name')
-            .annotate(
-                total_quantity=Sum('quantity'),
-                total_amount=Sum(ExpressionWrapper(
-                    F('quantity') * F('price'),
-                    output_field=IntegerField()
-                ))
-            )
-            .order_by('order_year', 'product__category', 'product__name')
-        )
-
-        # 初始化字典格式
-        stats_dict = defaultdict(lambda: {'order_date': None, 'items': []})
-
-        # 合併相同商品名字和分類的數據
-        for stat in yearly_stats:
-            order_year = stat['order_year']
-            product_category = stat['product__category']
-            product_name = stat['product__name']
-            total_quantity = stat['total_quantity']
-            total_amount = stat['total_amount']
-
-            order_year_str = order_year.strftime('%Y-%m-%dT00:00:00+0800')
-
-            if stats_dict[order_year_str]['order_date'] is None:
-                stats_dict[order_year_str]['order_date'] = order_year_str
-                stats_dict[order_year_str]['items'] = []  # 增加 'items' 列表
-
-            # 檢查所有商品名字和分類是否有相同的，有相同只要增加數量和金額
-            found = False
-            for item in stats_dict[order_year_str]['items']:
-                if item['product_category'] == product_category and item['product_name'] == product_name:
-                    item['total_quantity'] += total_quantity
-                    item['total_amount'] += total_amount
-                    found = True
-                    break
-
-            if not found:
-                stats_dict[order_year_str]['items'].append({
-                    'product_category': product_category,
-                    'product_name': product_name,
-                    'total_quantity': total_quantity,
-                    'total_amount': total_amount
-                })
-
-        formatted_data = list(stats_dict.values())
-
-        return Response(formatted_data)
+        today = timezone.localdate()
+        return Response(aggregate_sales('year', date(today.year, 1, 1), date(today.year, 12, 31)))
 
 
 # 搜尋日期取得訂單統計
 class SearchDateOrderStats(APIView):
+    @analytics_reads()
     def post(self, request):
-        # 取得查詢日期
-        search_time_str = request.data['search']
-        # 解析日期轉成日期格式
-        search_time = datetime.strptime(search_time_str, "%Y-%m-%d")
-        search_time = search_time + timedelta(hours=8)
-        today = search_time.date()
-
-        daily_stats = (
-            OrderItem.objects
-            .filter(order__created_at__date=today)
-            .values('order__created_at', 'product__category', 'product__name')
-            .annotate(
-                total_quantity=Sum('quantity'),
-                total_amount=Sum(ExpressionWrapper(
-                    F('quantity') * F('price'),
-                    output_field=IntegerField()
-                ))
-            )
-            .order_by('order__created_at', 'product__category', 'product__name')
-        )
-
-        # 初始化字典格式
-        stats_dict = {'order_date': today.strftime(
-            '%Y-%m-%dT00:00:00+0800'), 'items': []}
-
-        # 合併相同商品名稱的數據
-        product_data = defaultdict(
-            lambda: {'total_quantity': 0, 'total_amount': 0})
-        for stat in daily_stats:
-            product_category = stat['product__category']
-            product_name = stat['product__name']
-            total_quantity = stat['total_quantity']
-            total_amount = stat['total_amount']
-
-            # 檢查所有商品名稱和分類是否有相同的，有相同只要增加數量和金額
-            found = False
-            for item in stats_dict['items']:
-                if item['product_category'] == product_category and item['product_name'] == product_name:
-                    item['total_quantity'] += total_quantity
-                    item['total_amount'] += total_amount
-                    found = True
-                    break
-
-            if not found:
-                stats_dict['items'].append({
-                    'product_category': product_category,
-                    'product_name': product_name,
-                    'total_quantity': total_quantity,
-                    'total_amount': total_amount
-                })
-
-        formatted_data = [stats_dict]
+        # 取得查詢日期並解析成日期格式
+        try:
+            search_date = parse_stats_date(request.data['search'])
+        except (KeyError, TypeError, ValueError):
+            search_date = None
+        if search_date is None:
+            return Response({"message": "日期格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(formatted_data)
+        return Response(one_day_stats(search_date))
 
 
 # 根據“資料庫中的所有訂單”執行統計(所有訂單日期) - 取得日期、分類、商品、總數量、總金額
 class AllDailyOrderStats(APIView):
+    @analytics_reads()
+    @conditional(order_stats_validators)
     def get(self, request):
-        daily_stats = (
-            OrderItem.objects
-            .annotate(
-                order_date=TruncDay('order__created_at'),
-            )
-            .values('order_date', 'product__category', 'product__name')
-            .annotate(
-                total_quantity=Sum('quantity'),
-                total_amount=ExpressionWrapper(
-                    F('quantity') * F('price'),
-                    output_field=IntegerField()
-                )
-            )
-            .order_by('-order_date', 'product__category', 'product__name')
-        )
-
-        # 初始化字典格式
-        stats_dict = {}
-
-        # 組合資料格式
-        for stat in daily_stats:
-            order_date = stat['order_date'].strftime('%Y-%m-%dT%H:%M:%S%z')
-            product_category = stat['product__category']
-            product_name = stat['product__name']
-
-            if order_date not in stats_dict:
-                stats_dict[order_date] = []
-
-            found = False
-            # 檢查所有商品名稱是否有相同的，有相同只要增加數量和金額
-            for item in stats_dict[order_date]:
-                if item['product_category'] == product_category and item['product_name'] == product_name:
-                    item['total_quantity'] += stat['total_quantity']
-                    item['total_amount'] += stat['total_amount']
-                    found = True
-                    break
-
-            if not found:
-                stats_dict[order_date].append({
-                    'product_category': product_category,
-                    'product_name': product_name,
-                    'total_quantity': stat['total_quantity'],
-                    'total_amount': stat['total_amount']
-                })
-
-        # 轉換格式
-        formatted_data = [{'order_date': key, 'items': value}
-                          for key, value in stats_dict.items()]
-
-        # return Response({"order_stats" : formatted_data}) 組成字典格式測試
-        return Response(formatted_data)
+        return Response(aggregate_sales('day', descending=True))
 
 
 # ======================  前台 API  ====================== #
+# 訂單請求內容的雜湊 (整理後的欄位與商品項)，用來確認重送的請求與第一次相同
+def order_request_hash(order_fields, cart):
+    body = json.dumps({'order': order_fields, 'items': cart}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
 # 建立訂單
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+
+    # 商品單價、數量上限 (超過 SQLite 整數範圍的值寫入時會發生錯誤)
+    MAX_PRICE = 10_000_000
+    MAX_QUANTITY = 10_000
+    MAX_INTEGER = 2 ** 63 - 1
 
     def create(self, request):
+        # request.user 可能是由 JWT claims 建立的使用者 (ClaimsUser)，一律以 id 存取
         current_user = request.user
 
-        client_name = request.data['client_name']
-        email = request.data['email']
-        address = request.data['address']
-        phone = request.data['phone']
-        paid_amount = request.data['paid_amount']
-        items_data = request.data['items']
-
-        order = Order.objects.create(
-            user=current_user,
-            client_name=client_name,
-            email=email,
-            address=address,
-            phone=phone,
-            paid_amount=paid_amount,
-        )
-
-        # 建立訂單商品項
-        for item_data in items_data:
-            product_id = item_data['id']
-            price = item_data['price']
-            quantity = item_data['quantity']
-
-            # 取得關聯產品
-            product = Product.objects.get(pk=product_id)
-
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                price=price,
-                quantity=quantity,
-            )
-
-        # 序列化訂單回傳前端
-        order = Order.objects.get(pk=order.id)
-        serializer = OrderSerializer(order)
+        # 有 Idempotency-Key 時，重送的請求直接回傳第一次建立的結果
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None:
+            if not 0 < len(idempotency_key) <= 255:
+                return Response({"message": "Idempotency-Key 格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"message": "訂單已建立", "order": serializer.data}, status=status.HTTP_201_CREATED)
+        try:
+            order_fields = {
+                'client_name': request.data['client_name'],
+                'email': request.data['email'],
+                'address': request.data['address'],
+                'phone': request.data['phone'],
+                'paid_amount': int(request.data['paid_amount']),
+            }
+            items_data = request.data['items']
+
+            # 先整理所有商品項，資料不完整就不建立訂單
+            cart = [(int(item_data['id']), int(item_data['price']), int(item_data['quantity']))
+                    for item_data in items_data]
+        except (KeyError, TypeError, ValueError):
+            return Response({"message": "訂單資料不完整"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not cart:
+            return Response({"message": "購物車沒有商品"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if any(not 0 < product_id <= self.MAX_INTEGER or not 0 <= price <= self.MAX_PRICE
+               or not 0 < quantity <= self.MAX_QUANTITY for product_id, price, quantity in cart):
+            return Response({"message": "商品價格或數量錯誤"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if abs(order_fields['paid_amount']) > self.MAX_INTEGER:
+            return Response({"message": "付款金額錯誤"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if idempotency_key is not None:
+            request_hash = order_request_hash(order_fields, cart)
+            stored = IdempotencyKey.objects.filter(user_id=current_user.id, key=idempotency_key).first()
+            if stored is not None:
+                if stored.expires_at > timezone.now():
+                    return self.replay(stored, request_hash)
+                stored.delete()
+
+        # 一次查詢取得所有關聯產品
+        products = Product.objects.in_bulk({product_id for product_id, _, _ in cart})
+        missing_ids = sorted({product_id for product_id, _, _ in cart} - products.keys())
+        if missing_ids:
+            return Response({"message": "找不到商品", "product_ids": missing_ids},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # 排隊寫入模式：寫入日誌檔後立即回傳暫時的訂單編號，由背景批次寫入資料庫
+        # (帶 Idempotency-Key 的請求仍直接寫入，才能回傳第一次的結果)
+        if settings.ORDER_INGEST_MODE == 'queued' and idempotency_key is None:
+            order_id = get_ingest_queue().submit(current_user.id, order_fields, cart)
+            return Response({"message": "訂單處理中", "order_id": order_id, "status": "pending"},
+                            status=status.HTTP_202_ACCEPTED)
+
+        # 訂單與商品項在同一個交易中建立，任何一筆失敗就全部取消
+        duplicate = False
+        with transaction.atomic():
+            order, order_items = write_order(current_user.id, order_fields, cart, products)
+
+            # 直接使用記憶體中的商品項序列化，不用再查詢一次訂單
+            order._prefetched_objects_cache = {'items': order_items}
+            serializer = OrderSerializer(order, context={'request': request})
+            data = {"message": "訂單已建立", "order": serializer.data}
+
+            # 儲存冪等鍵
+            if idempotency_key is not None:
+                try:
+                    with transaction.atomic():
+                        IdempotencyKey.objects.create(
+                            user_id=current_user.id,
+                            key=idempotency_key,
+                            order=order,
+                            status_code=status.HTTP_201_CREATED,
+                            response=data,
+                            request_hash=request_hash,
+                            expires_at=timezone.now() + settings.ORDER_IDEMPOTENCY_KEY_TTL,
+                        )
+                except IntegrityError:
+                    # 同時送出的重複請求已先建立訂單，取消這次建立的訂單
+                    transaction.set_rollback(True)
+                    duplicate = True
+
+        if duplicate:
+            return self.replay(IdempotencyKey.objects.get(user_id=current_user.id, key=idempotency_key), request_hash)
+
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    # 回傳先前儲存的訂單結果，請求內容與第一次不同時回傳 422
+    def replay(self, stored, request_hash):
+        if stored.request_hash and stored.request_hash != request_hash:
+            return Response({"message": "Idempotency-Key 已用於內容不同的訂單"},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(stored.response, status=stored.status_code, headers={'Idempotent-Replayed': 'true'})
 
     # 取得一個使用者的訂單
     @action(detail=True, methods=['GET'])
+    @conditional(lambda request, user_id=None: watermarks((Order.objects.filter(user=user_id), 'created_at'),
+                                                          (Product.objects.all(), 'updated')))
     def user_orders(self, request, user_id=None):
         try:
             staff_id = user_id
 
-            # 取得使用者的訂單
-            orders = Order.objects.filter(user=staff_id)
+            # 取得使用者的訂單 (分頁)
+            orders = OrderSerializer.setup_eager_loading(Order.objects.filter(user=staff_id))
+            page = self.paginate_queryset(orders)
 
             # 序列化
-            serializer = OrderSerializer(orders, many=True)
+            serializer = OrderSerializer(page, many=True, context={'request': request})
 
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return self.get_paginated_response(serializer.data)
         except Order.DoesNotExist:
             raise APIException("客戶尚未購買商品", code=status.HTTP_404_NOT_FOUND)
 
 
+# 查詢訂單建立狀態 (排隊寫入模式使用)
+class OrderStatus(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, order_id):
+        order = OrderSerializer.setup_eager_loading(Order.objects.filter(order_id=order_id)).first()
+        if order is not None:
+            serializer = OrderSerializer(order, context={'request': request})
+            return Response({"status": "created", "order": serializer.data}, status=status.HTTP_200_OK)
+
+        state, message = ingest_status(order_id) if settings.ORDER_INGEST_MODE == 'queued' else (None, None)
+        if state == 'pending':
+            return Response({"status": "pending"}, status=status.HTTP_200_OK)
+        if state == 'failed':
+            return Response({"status": "failed", "message": message}, status=status.HTTP_200_OK)
+
+        return Response({"message": "找不到這筆訂單"}, status=status.HTTP_404_NOT_FOUND)
+
+
 # 統計訂單格式
 # [
 #     {
@@ -0,0 +1,41 @@
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import Product
+from .serializers import ProductSerializer
+
+# 前台商品目錄快取
+# 版本由商品最後更新時間與筆數組成，商品建立、更新、刪除、上下架時清除；
+# 其他途徑 (例如後台 admin) 的修改最晚在 CATALOG_VERSION_TIMEOUT 秒後生效
+CATALOG_CACHE_TIMEOUT = 60 * 60
+CATALOG_VERSION_TIMEOUT = 60
+CATALOG_VERSION_KEY = 'front_catalog_version'
+
+
+# 取得目錄版本，回傳 (版本字串, 最後更新時間 timestamp | None)
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        stats = Product.objects.aggregate(last_updated=Max('updated'), count=Count('id'))
+        last_modified = int(stats['last_updated'].timestamp()) if stats['last_updated'] else None
+        last_updated = stats['last_updated'].timestamp() if stats['last_updated'] else 0
+        version = (f"{stats['count']}-{int(last_updated * 1000000)}", last_modified)
+        cache.set(CATALOG_VERSION_KEY, version, CATALOG_VERSION_TIMEOUT)
+    return version
+
+
+# 前台上架商品 (圖片網址依請求的網域產生，所以快取也依網域區分)
+def front_catalog(request, version):
+    key = f"front_catalog:{version}:{request.build_absolute_uri('/')}"
+    catalog = cache.get(key)
+    if catalog is None:
+        products = Product.objects.filter(complete=True)
+        serializer = ProductSerializer(products, many=True, context={'request': request})
+        catalog = [dict(product) for product in serializer.data]
+        cache.set(key, catalog, CATALOG_CACHE_TIMEOUT)
+    return catalog
+
+
+# 商品有變動時清除目錄快取
+def invalidate_catalog():
+    cache.delete(CATALOG_VERSION_KEY)
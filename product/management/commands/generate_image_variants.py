@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from product.models import Product
+from server.images import current_variants, generate_variants
+from simple_jwt.models import Staff
+
+
+# 為既有的商品圖片、會員頭像產生縮圖
+# python manage.py generate_image_variants --force --workers 4
+class Command(BaseCommand):
+    help = '為既有的商品圖片與會員頭像產生縮圖'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='已有縮圖的圖片也重新產生')
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_VARIANT_WORKERS, help='同時處理的數量 (1 為依序處理)')
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model in (Product, Staff):
+            for instance in model.objects.exclude(image='').exclude(image__isnull=True).only('image', 'image_variants'):
+                if options['force'] or not current_variants(instance):
+                    jobs.append((model._meta.label, instance.pk))
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                results = list(executor.map(lambda job: self.generate_in_thread(*job), jobs))
+        else:
+            results = [generate_variants(*job) is not None for job in jobs]
+
+        failed = results.count(False)
+        self.stdout.write(self.style.SUCCESS(f'已產生 {len(jobs) - failed} 張圖片的縮圖'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} 張圖片產生失敗 (詳見 log)'))
+
+    def generate_in_thread(self, model_label, pk):
+        try:
+            return generate_variants(model_label, pk) is not None
+        finally:
+            connection.close()
@@ -0,0 +1,36 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from product.models import Product
+from server.images import delete_variant_files, generate_variants, image_in_use
+from server.storage import is_hashed_name
+from simple_jwt.models import Staff
+
+
+# 將既有的商品圖片、會員頭像改為內容雜湊檔名 (並重新產生縮圖)
+# python manage.py hash_media_names
+class Command(BaseCommand):
+    help = '將既有的商品圖片與會員頭像改為內容雜湊檔名'
+
+    def handle(self, *args, **options):
+        renamed = 0
+        for model in (Product, Staff):
+            storage = model._meta.get_field('image').storage
+            for instance in model.objects.exclude(image='').exclude(image__isnull=True).only('image', 'image_variants'):
+                old_name = instance.image.name
+                if is_hashed_name(old_name):
+                    continue
+                if not storage.exists(old_name):
+                    self.stdout.write(self.style.WARNING(f'找不到檔案 {old_name}'))
+                    continue
+
+                with storage.open(old_name) as file:
+                    new_name = storage.save(old_name, File(file, old_name))
+                model.objects.filter(pk=instance.pk).update(image=new_name)
+                delete_variant_files(storage, instance.image_variants)
+                if not image_in_use(old_name):
+                    storage.delete(old_name)
+                generate_variants(model._meta.label, instance.pk)
+                renamed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'已將 {renamed} 張圖片改為內容雜湊檔名'))
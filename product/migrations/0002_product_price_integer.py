@@ -0,0 +1,73 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:20
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+# 將字串價格轉成整數，無法轉換的資料列出後停止
+def parse_price(value):
+    try:
+        price = Decimal(str(value).strip().replace(',', ''))
+    except InvalidOperation:
+        return None
+    if price != price.to_integral_value() or price < 0:
+        return None
+    return int(price)
+
+
+def copy_prices(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+
+    products = list(Product.objects.only('id', 'price'))
+    invalid = []
+    for product in products:
+        product.price_int = parse_price(product.price)
+        if product.price_int is None:
+            invalid.append(f'{product.id}: {product.price!r}')
+
+    if invalid:
+        raise ValueError('商品價格無法轉換為整數 - ' + ', '.join(invalid))
+
+    Product.objects.bulk_update(products, ['price_int'], batch_size=500)
+
+
+def copy_prices_back(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    Product.objects.update(price=Cast('price_int', models.CharField(max_length=10)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='price_int',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.CharField(max_length=10, null=True),
+        ),
+        migrations.RunPython(copy_prices, copy_prices_back),
+        migrations.RemoveField(
+            model_name='product',
+            name='price',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='price_int',
+            new_name='price',
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.PositiveIntegerField(),
+        ),
+    ]
@@ -4,15 +4,24 @@ from django.db import models
 class Product(models.Model):
     category = models.CharField(max_length=50)
     name = models.CharField(max_length=50)
-    price = models.CharField(max_length=10)
+    price = models.PositiveIntegerField()
     description = models.TextField(null=True, blank=True)
     complete = models.BooleanField(default=False)
     image = models.ImageField(upload_to='images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)    # 縮圖 (背景產生)
     updated = models.DateTimeField(auto_now=True)
     created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering=['created']
+        indexes = [
+            models.Index(fields=['created'], name='product_created_idx'),
+            # 目錄版本 (最後更新時間)
+            models.Index(fields=['updated'], name='product_updated_idx'),
+            # 前台上架商品
+            models.Index(fields=['created'], name='product_complete_created_idx',
+                         condition=models.Q(complete=True)),
+        ]
 
     def __str__(self):
         return str(self.name)
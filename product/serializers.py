@@ -1,10 +1,23 @@
 from rest_framework import serializers
+from server.images import ImageVariantsField
 from .models import Product
 
 
+# 價格以整數儲存，API 仍以字串回傳 (維持原本格式)
+class PriceField(serializers.IntegerField):
+    def __init__(self, **kwargs):
+        kwargs.setdefault('min_value', 0)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return str(value)
+
+
 class ProductSerializer(serializers.HyperlinkedModelSerializer):
+    price = PriceField()
     image = serializers.ImageField(max_length=None, allow_empty_file=False, allow_null=False, use_url=True, required=False)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Product
-        fields = ('id', "name", 'category', "price", "description", 'image', 'complete')
+        fields = ('id', "name", 'category', "price", "description", 'image', 'image_variants', 'complete')
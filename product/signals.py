@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from server.images import delete_variants, schedule_variants
+from .models import Product
+
+
+# 商品圖片變更時重新產生縮圖
+@receiver(post_save, sender=Product)
+def update_product_image_variants(sender, instance, **kwargs):
+    schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Product)
+def delete_product_image_variants(sender, instance, **kwargs):
+    delete_variants(instance)
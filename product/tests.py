@@ -1,3 +1,326 @@
-from django.test import TestCase
+from io import BytesIO, StringIO
+from unittest import mock
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from server.images import run_generate_variants
+from server.storage import is_hashed_name
+from simple_jwt.models import Staff
+from .models import Product
+from .serializers import ProductSerializer
+
+
+def upload_image(name='cake.jpg', size=(1600, 1200)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class FrontProductCatalogTests(TestCase):
+    url = '/api/v1/front_products/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = Product.objects.create(category='粽子', name='鮮肉粽', price=100, complete=True)
+        Product.objects.create(category='粽子', name='未上架', price=80)
+
+    def test_catalog_is_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual([product['name'] for product in response.data], ['鮮肉粽'])
+        self.assertEqual(response.data[0]['price'], '100')
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(cached.data, response.data)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        not_modified = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_product_changes_invalidate_catalog(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.client.patch(f'/api/v1/product_show/{self.product.id}/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+        etag = response['ETag']
+        self.client.patch(f'/api/v1/product_show/{self.product.id}/')
+        self.client.delete(f'/api/v1/product_delete/{self.product.id}/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+
+class ProductListConditionalGetTests(TestCase):
+    def test_product_update_changes_etag(self):
+        client = APIClient()
+        product = Product.objects.create(category='粽子', name='鮮肉粽', price=100)
+        etag = client.get('/api/v1/products/')['ETag']
+        self.assertEqual(client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        product.price = 120
+        product.save()
+        self.assertEqual(client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ProductPriceTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, IMAGE_VARIANT_MODE='sync')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+
+    def test_price_is_serialized_as_string(self):
+        product = Product.objects.create(category='粽子', name='鮮肉粽', price=100)
+
+        self.assertEqual(ProductSerializer(product).data['price'], '100')
+
+    def test_create_rejects_invalid_price(self):
+        for price in ('abc', '12.5', '-1', ''):
+            response = self.client.post('/api/v1/product_set/', {
+                'name': '鮮肉粽', 'category': '粽子', 'price': price, 'description': '', 'image': upload_image(),
+            }, format='multipart')
+            self.assertEqual(response.status_code, 400, price)
+        self.assertFalse(Product.objects.exists())
+
+        response = self.client.post('/api/v1/product_set/', {
+            'name': '鮮肉粽', 'category': '粽子', 'price': '120', 'description': '', 'image': upload_image(),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Product.objects.get().price, 120)
+
+    def test_update_rejects_invalid_price(self):
+        product = Product.objects.create(category='粽子', name='鮮肉粽', price=100)
+
+        for price in ('abc', '-5'):
+            response = self.client.put(f'/api/v1/product_set/{product.id}/', {'price': price}, format='multipart')
+            self.assertEqual(response.status_code, 400, price)
+        product.refresh_from_db()
+        self.assertEqual(product.price, 100)
+
+        self.client.put(f'/api/v1/product_set/{product.id}/', {'price': '150'}, format='multipart')
+        product.refresh_from_db()
+        self.assertEqual(product.price, 150)
+
+
+# 字串價格轉成整數的資料遷移 (product 0002)
+class ProductPriceMigrationTests(TransactionTestCase):
+    before = [('product', '0001_initial')]
+    after = [('product', '0002_product_price_integer')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_prices_are_converted_and_reverted(self):
+        apps = self.migrate(self.before)
+        OldProduct = apps.get_model('product', 'Product')
+        product_id = OldProduct.objects.create(category='粽子', name='鮮肉粽', price=' 1,200 ').id
+
+        apps = self.migrate(self.after)
+        self.assertEqual(apps.get_model('product', 'Product').objects.get(id=product_id).price, 1200)
+
+        apps = self.migrate(self.before)
+        self.assertEqual(apps.get_model('product', 'Product').objects.get(id=product_id).price, '1200')
+
+    def test_invalid_price_stops_migration(self):
+        apps = self.migrate(self.before)
+        OldProduct = apps.get_model('product', 'Product')
+        product = OldProduct.objects.create(category='粽子', name='鮮肉粽', price='12.5')
+
+        with self.assertRaisesMessage(ValueError, '商品價格無法轉換為整數'):
+            self.migrate(self.after)
+
+        # 修正資料後可以重新執行
+        OldProduct.objects.filter(id=product.id).update(price='12')
+        apps = self.migrate(self.after)
+        self.assertEqual(apps.get_model('product', 'Product').objects.get(id=product.id).price, 12)
+
+
+class ProductImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, IMAGE_VARIANT_MODE='sync')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media_root = media_root
+        self.client = APIClient()
+
+    def create_product(self, **kwargs):
+        return Product.objects.create(category='鬆糕', name='桂花鬆糕', price=400, complete=True,
+                                      image=upload_image(), **kwargs)
+
+    def test_variants_are_resized(self):
+        product = self.create_product()
+
+        self.assertEqual(product.image_variants['source'], product.image.name)
+        with Image.open(os.path.join(self.media_root, product.image_variants['thumbnail'])) as thumbnail:
+            self.assertEqual(thumbnail.format, 'WEBP')
+            self.assertEqual(thumbnail.size, (200, 150))
+        with Image.open(os.path.join(self.media_root, product.image_variants['medium'])) as medium:
+            self.assertEqual(medium.size, (800, 600))
+
+        data = self.client.get(f'/api/v1/products/{product.id}/').data
+        self.assertEqual(set(data['image_variants']), {'thumbnail', 'medium'})
+        self.assertTrue(data['image_variants']['thumbnail'].startswith('http://testserver/media/images/variants/'))
+
+    def test_replacing_image_removes_old_variants(self):
+        product = self.create_product()
+        old_thumbnail = os.path.join(self.media_root, product.image_variants['thumbnail'])
+
+        response = self.client.put(f'/api/v1/product_set/{product.id}/', {'image': upload_image('new.png')},
+                                   format='multipart')
+        self.assertEqual(response.status_code, 200)
+
+        product.refresh_from_db()
+        self.assertFalse(os.path.exists(old_thumbnail))
+        self.assertEqual(product.image_variants['source'], product.image.name)
+
+        self.client.delete(f'/api/v1/product_delete/{product.id}/')
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'images', 'variants')), [])
+
+    def test_background_mode_runs_after_commit(self):
+        with override_settings(IMAGE_VARIANT_MODE='background'), \
+                mock.patch('server.images.get_image_executor') as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = self.create_product()
+            self.assertEqual(product.image_variants, {})
+
+        get_executor.return_value.submit.assert_called_once_with(run_generate_variants, 'product.Product', product.pk)
+
+    def test_backfill_command(self):
+        with override_settings(IMAGE_VARIANT_MODE='background'):
+            product = self.create_product()
+        self.assertEqual(self.client.get(f'/api/v1/products/{product.id}/').data['image_variants'], {})
+
+        out = StringIO()
+        call_command('generate_image_variants', '--workers', '1', stdout=out)
+
+        self.assertIn('已產生 1 張', out.getvalue())
+        product.refresh_from_db()
+        self.assertEqual(set(product.image_variants), {'source', 'thumbnail', 'medium'})
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root, IMAGE_VARIANT_MODE='sync')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media_root = media_root
+        self.product = Product.objects.create(category='鬆糕', name='桂花鬆糕', price=400, image=upload_image())
+        self.url = self.product.image.url
+        with open(self.product.image.path, 'rb') as file:
+            self.content = file.read()
+
+    def test_content_hashed_names_are_immutable(self):
+        self.assertTrue(is_hashed_name(self.product.image.name))
+        self.assertTrue(all(is_hashed_name(path) for name, path in self.product.image_variants.items()
+                            if name != 'source'))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_same_name_with_new_content_gets_new_name(self):
+        other = Product.objects.create(category='鬆糕', name='原味鬆糕', price=300,
+                                       image=upload_image(size=(10, 10)))
+
+        self.assertNotEqual(other.image.name, self.product.image.name)
+
+    def test_same_content_shares_file_until_last_delete(self):
+        other = Product.objects.create(category='鬆糕', name='原味鬆糕', price=300, image=upload_image())
+        self.assertEqual(other.image.name, self.product.image.name)
+
+        client = APIClient()
+        client.force_authenticate(Staff.objects.create_user(username='admin', password='pass'))
+        client.delete(f'/api/v1/product_delete/{self.product.id}/')
+
+        other.refresh_from_db()
+        self.assertTrue(os.path.exists(other.image.path))
+        self.assertTrue(all(os.path.exists(os.path.join(self.media_root, path))
+                            for name, path in other.image_variants.items() if name != 'source'))
+
+        client.delete(f'/api/v1/product_delete/{other.id}/')
+        self.assertFalse(os.path.exists(other.image.path))
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_offloaded_file_modes(self):
+        with override_settings(MEDIA_SERVE_MODE='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.product.image.name)
+        self.assertEqual(response.content, b'')
+
+        with override_settings(MEDIA_SERVE_MODE='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.product.image.path)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/media/images/missing.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/../server/settings.py').status_code, 404)
+
+    def test_hash_existing_media_names(self):
+        os.makedirs(os.path.join(self.media_root, 'avatar'))
+        with open(os.path.join(self.media_root, 'avatar', 'panda.jpg'), 'wb') as file:
+            file.write(upload_image().read())
+        Staff.objects.filter(pk=Staff.objects.create_user(username='staff', password='pass').pk).update(
+            image='avatar/panda.jpg')
+
+        call_command('hash_media_names', stdout=StringIO())
+
+        staff = Staff.objects.get(username='staff')
+        self.assertTrue(is_hashed_name(staff.image.name))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'avatar', 'panda.jpg')))
+        self.assertEqual(staff.image_variants['source'], staff.image.name)
@@ -11,6 +11,9 @@ from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.core.files.uploadedfile import InMemoryUploadedFile   # 檢查是否有新照片需要更新
+from server.conditional import conditional, watermarks
+from server.images import delete_image
+from .catalog import catalog_version, front_catalog, invalidate_catalog
 
 
 @api_view(['GET'])
@@ -30,10 +33,12 @@ def getRoutes(request):
             '更新帳號| PUT | api/v1/staff_set/:id/',                         # 更新帳號
             '上班打卡| POST | api/v1/clock-in/:id/',                         # 上班打卡
             '下班打卡| PUT | api/v1/clock-out/:id/',                         # 下班打卡
+            '批次同步打卡| POST | api/v1/clock_records_sync/',                 # 離線打卡機批次同步上下班紀錄
             '取得全部員工| GET | api/v1/staffs/',                             # 取得全部員工
             '搜尋員工| GET | api/v1/staffs/search/?search=query',            # 搜尋員工
             '取得每個月打卡紀錄| GET | api/v1/staff_clock_in_out_records/',    # 取得當年度員工每個月的上下班紀錄
             '查詢員工特定月份打卡紀錄| POST | api/v1/staff_one_month_clock_records/:id/',  # 查詢員工特定月份的上下班紀錄
+            '查詢多位員工多個月份打卡紀錄| POST | api/v1/staff_month_clock_records/',      # 查詢多位員工多個月份的上下班紀錄
 
             '將員工加入待刪除| PATCH | api/v1/staff_delete/:id/',             # 將員工 is_delete設為 True
             '取得待刪除所有員工| GET | api/v1/staff_wait_set/',               # 取得加入待刪除的所有員工
@@ -57,9 +62,10 @@ def getRoutes(request):
             '商品是否顯示於前台| PATCH | api/v1/product_show/:id/',       # 更新商品是否顯示於前台
         },
         {
-            '取得所有訂單| GET | api/v1/all_orders',                      # 取得所有訂單
+            '取得所有訂單| GET | api/v1/all_orders/?page_size=&cursor=',     # 取得所有訂單 (分頁)
             '刪除一筆訂單| DELETE | api/v1/delete_order/:id/',            # 刪除一筆訂單
-            '訂單查詢| GET | api/v1/order/search/?search=query/',        # 訂單查詢
+            '訂單查詢| GET | api/v1/order/search/?search=query&limit=&offset=',  # 訂單查詢
+            '匯出訂單| GET | api/v1/order_export/?type=csv|ndjson&flat=1&start=&end=',  # 匯出訂單
         },
         {
             # 取得所有日期訂單統計(未使用)
@@ -68,14 +74,17 @@ def getRoutes(request):
             '取得每月訂單統計| GET | /api/v1/monthly_order_stats/',           # 取得每月訂單統計
             '取得當年度訂單統計| GET | /api/v1/yearly_order_stats/',          # 取得當年度訂單統計
             '搜尋日期訂單統計| POST | /api/v1/search_date_order_stats/',      # 搜尋日期訂單統計
+            # 依查詢參數取得訂單統計
+            '查詢訂單統計| GET | /api/v1/order_stats/?granularity=day|week|month|year&start=&end=&category=',
         },
 
         '===================  前台使用  ====================',
         '會員註冊帳號| POST | api/v1/client_set/',                          # 會員註冊帳號
         '更新會員資料| PUT | api/v1/client_update/:id/',                    # 更新會員資料
         '取得所有商品| GET | api/v1/front_products/',                       # 取得所有商品
-        '建立商品訂單| POST | api/v1/front_order/',                         # 建立商品訂單
-        '取得單一客戶所有訂單| GET | api/v1/user_orders/:id/',               # 取得一個客戶所有訂單
+        '建立商品訂單| POST | api/v1/front_order/',                         # 建立商品訂單 (可帶 Idempotency-Key header)
+        '查詢訂單建立狀態| GET | api/v1/order_status/:order_id/',             # 查詢訂單建立狀態 (排隊寫入模式)
+        '取得單一客戶所有訂單| GET | api/v1/user_orders/:id/?page_size=&cursor=',  # 取得一個客戶所有訂單 (分頁)
     ]
     return Response(routes)
 
@@ -85,6 +94,31 @@ class ProductList(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    @conditional(lambda request: watermarks((Product.objects.all(), 'updated')))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_catalog()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_catalog()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        invalidate_catalog()
+
+
+# 價格轉成整數，格式錯誤回傳 None
+def parse_price(value):
+    try:
+        price = int(value)
+    except (TypeError, ValueError):
+        return None
+    return price if price >= 0 else None
+
 
 # 建立、更新產品
 class ProductViewSet(viewsets.ModelViewSet):
@@ -95,7 +129,9 @@ class ProductViewSet(viewsets.ModelViewSet):
     def create(self, request):
         name = request.data['name']
         category = request.data['category']
-        price = request.data['price']
+        price = parse_price(request.data['price'])
+        if price is None:
+            return Response({"message": "價格格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
         description = request.data['description']
         image = request.data['image']
         Product.objects.create(
@@ -105,6 +141,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             description=description,
             image=image,
         )
+        invalidate_catalog()
         return Response({"message": "商品已建立"}, status=status.HTTP_201_CREATED)
 
     def update(self, request, pk=None):
@@ -115,20 +152,23 @@ class ProductViewSet(viewsets.ModelViewSet):
 
         product.name = request.data.get('name', product.name)
         product.category = request.data.get('category', product.category)
-        product.price = request.data.get('price', product.price)
+        price = parse_price(request.data.get('price', product.price))
+        if price is None:
+            return Response({"message": "價格格式錯誤"}, status=status.HTTP_400_BAD_REQUEST)
+        product.price = price
         product.description = request.data.get(
             'description', product.description)
         if 'image' in request.data:
             new_image = request.data['image']
             if isinstance(new_image, InMemoryUploadedFile):
                 if new_image.size > 0:
-                    if product.image:
-                        product.image.delete()
+                    delete_image(product)
                     product.image = new_image
             else:
                 product.image = product.image
 
         product.save()
+        invalidate_catalog()
         return Response({"message": "商品已更新"}, status=status.HTTP_200_OK)
 
     def destroy(self, request, pk=None):
@@ -137,10 +177,10 @@ class ProductViewSet(viewsets.ModelViewSet):
         except Product.DoesNotExist:
             return Response({"message": "找不到商品"}, status=status.HTTP_404_NOT_FOUND)
 
-        if product.image:
-            product.image.delete()
+        delete_image(product)
 
         product.delete()
+        invalidate_catalog()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -161,6 +201,7 @@ class ProductShow(APIView):
 
         setattr(product, attribute, new_value)
         product.save()
+        invalidate_catalog()
 
         if product.complete == True:
             return Response({"message": "商品上架"}, status=status.HTTP_200_OK)
@@ -168,7 +209,12 @@ class ProductShow(APIView):
 
 
 # ======================  前台 API  ====================== #
-# 取得全部產品
+# 取得全部產品 (使用快取，並支援 ETag / Last-Modified 條件式請求)
 class FrontendProductList(viewsets.ModelViewSet):
     queryset = Product.objects.filter(complete=True)
     serializer_class = ProductSerializer
+
+    @conditional(lambda request: catalog_version())
+    def list(self, request, *args, **kwargs):
+        version, _ = catalog_version()
+        return Response(front_catalog(request, version))
@@ -0,0 +1,154 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# 統計、報表使用的唯讀資料庫 (主資料庫的 SQLite 快照)
+# 在 analytics_reads() 內的查詢改由快照讀取，避免大量掃描拖慢結帳；
+# 快照不存在或超過 ANALYTICS_MAX_STALENESS 秒時改用主資料庫，並在背景重新建立快照
+ANALYTICS_DB_ALIAS = 'analytics'
+
+# 目前讀取使用的資料庫 (None 表示不在 analytics_reads() 內)
+_read_alias = ContextVar('analytics_read_alias', default=None)
+
+
+# 快照檔案路徑，由 analytics 連線設定的 NAME (file:路徑?mode=ro) 取得
+# 測試時 analytics 連線指向測試資料庫 (TEST MIRROR)，路徑不存在，所以一律使用主資料庫
+def snapshot_path():
+    if ANALYTICS_DB_ALIAS not in settings.DATABASES:
+        return None
+    name = str(connections[ANALYTICS_DB_ALIAS].settings_dict['NAME'])
+    if name.startswith('file:'):
+        name = name[len('file:'):].split('?', 1)[0]
+    return name
+
+
+# 快照建立時間 (timestamp)，快照不存在時回傳 None
+def snapshot_time(path=None):
+    path = path or snapshot_path()
+    try:
+        return os.stat(path).st_mtime if path else None
+    except OSError:
+        return None
+
+
+# 目前統計查詢應使用的資料庫：快照在時限內時使用 analytics，否則使用主資料庫並在背景更新快照
+def analytics_alias():
+    created = snapshot_time()
+    if created is not None and time.time() - created <= settings.ANALYTICS_MAX_STALENESS:
+        return ANALYTICS_DB_ALIAS
+
+    if settings.ANALYTICS_AUTO_REFRESH and snapshot_path():
+        schedule_refresh()
+    return DEFAULT_DB_ALIAS
+
+
+# 統計資料的版本 (快照建立時間)，用於快取鍵與 ETag，快照更新後快取即失效
+def analytics_version():
+    alias = _read_alias.get() or analytics_alias()
+    if alias != ANALYTICS_DB_ALIAS:
+        return 'primary'
+    return f'snapshot-{snapshot_time()}'
+
+
+# 區塊內的讀取使用統計資料庫，可當 context manager 或 view 方法的裝飾器使用
+# 進入時決定一次使用的資料庫，同一個請求內的查詢都來自同一份資料
+@contextmanager
+def analytics_reads():
+    token = _read_alias.set(analytics_alias())
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+# 在統計資料庫中逐步產生串流內容 (StreamingHttpResponse 在 view 回傳後才讀取資料)
+def iter_analytics(iterator):
+    with analytics_reads():
+        yield from iterator
+
+
+class AnalyticsRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    # 從快照讀出的資料存檔時寫入主資料庫
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == ANALYTICS_DB_ALIAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, ANALYTICS_DB_ALIAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db == ANALYTICS_DB_ALIAS:
+            return False
+        return None
+
+
+# 以 SQLite online backup API 將主資料庫複製成快照，回傳快照路徑
+# 先寫入同一目錄中的暫存檔再取代，正在讀取舊快照的連線不受影響；快照時間為開始複製的時間
+# 每次更新使用不同的暫存檔，同時執行的更新 (背景執行緒與管理指令) 不會寫入同一個檔案
+def refresh_snapshot(source=None, target=None):
+    source = str(source or connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+    target = str(target or snapshot_path())
+    directory, filename = os.path.split(os.path.abspath(target))
+    descriptor, temporary = tempfile.mkstemp(prefix=f'{filename}.', suffix='.tmp', dir=directory)
+    os.close(descriptor)
+    started = time.time()
+
+    try:
+        source_connection = sqlite3.connect(source)
+        target_connection = sqlite3.connect(temporary)
+        try:
+            source_connection.backup(target_connection)
+            # 唯讀連線無法開啟 WAL 模式的資料庫
+            target_connection.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target_connection.close()
+            source_connection.close()
+
+        os.utime(temporary, (started, started))
+        os.replace(temporary, target)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return target
+
+
+_refresh_lock = threading.Lock()
+
+
+def run_refresh():
+    try:
+        path = refresh_snapshot()
+        logger.info('統計資料庫快照已更新 %s', path)
+    except Exception:
+        logger.exception('統計資料庫快照更新失敗')
+    finally:
+        _refresh_lock.release()
+
+
+# 在背景更新快照，已有更新在執行時不重複執行
+def schedule_refresh():
+    if connections[DEFAULT_DB_ALIAS].is_in_memory_db():
+        return False
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    threading.Thread(target=run_refresh, name='analytics-snapshot', daemon=True).start()
+    return True
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ServerConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'server'
+
+    def ready(self):
+        from . import sqlite  # noqa: F401
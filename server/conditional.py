@@ -0,0 +1,51 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+# 以資料表水位 (筆數、時間欄位最大值) 產生驗證值 (版本字串)，不需產生回應內容
+# sources 為 (queryset, 時間欄位, ...)
+# 刪除資料不會讓時間欄位的最大值變大，所以只產生 ETag 用的版本字串 (含筆數)，不提供最後修改時間
+def watermarks(*sources):
+    parts = []
+    for queryset, *fields in sources:
+        stats = queryset.order_by().aggregate(
+            count=Count('pk'), **{f'max_{field}': Max(field) for field in fields})
+        parts.append(str(stats['count']))
+        for field in fields:
+            value = stats[f'max_{field}']
+            parts.append(value.isoformat() if value else '')
+    return '|'.join(parts)
+
+
+# 支援條件式請求 (If-None-Match / If-Modified-Since) 的 view 方法裝飾器
+# get_validators(request, *args, **kwargs) 回傳版本字串，或 (版本字串, 最後修改時間 timestamp | None)
+# 最後修改時間只在能反映所有變動 (包含刪除) 時提供，否則只使用 ETag
+# 資料沒有變動時直接回傳 304，不執行 view 方法
+def conditional(get_validators):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            validators = get_validators(request, *args, **kwargs)
+            version, last_modified = (validators, None) if isinstance(validators, str) else validators
+            # 不同網址、不同格式 (Accept) 的回應內容不同
+            key = f"{version}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+            etag = f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # 瀏覽器每次都需重新驗證
+            patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
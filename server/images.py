@@ -0,0 +1,173 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# 上傳圖片的縮圖 (商品圖片、會員頭像)
+# 模型需有 image (ImageField)、image_variants (JSONField) 與 updated 欄位，
+# image_variants 為 {"source": 原圖檔名, "thumbnail": 縮圖檔名, ...}，source 與目前圖片不同時表示縮圖尚未產生
+
+
+# 縮圖檔名，例如 images/cake.jpg -> images/variants/cake_thumbnail.webp
+def variant_path(name, variant):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    extension = settings.IMAGE_VARIANT_FORMAT.lower()
+    return os.path.join(directory, 'variants', f'{stem}_{variant}.{extension}')
+
+
+# 目前圖片可用的縮圖 {名稱: 檔名}，尚未產生時回傳空 dict
+def current_variants(instance):
+    variants = instance.image_variants or {}
+    if not instance.image or variants.get('source') != instance.image.name:
+        return {}
+    return {name: path for name, path in variants.items() if name != 'source'}
+
+
+# 產生所有尺寸的縮圖並存檔，回傳 image_variants
+def render_variants(storage, name):
+    with storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    variants = {'source': name}
+    for variant, size in settings.IMAGE_VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        resized.save(buffer, settings.IMAGE_VARIANT_FORMAT, quality=settings.IMAGE_VARIANT_QUALITY)
+
+        path = variant_path(name, variant)
+        if storage.exists(path):
+            storage.delete(path)
+        variants[variant] = storage.save(path, ContentFile(buffer.getvalue()))
+    return variants
+
+
+# 內容相同的圖片共用同一個檔案 (server/storage.py)，刪除前需確認沒有其他資料使用
+def image_in_use(name, exclude=None):
+    for model in apps.get_models():
+        if not any(field.name == 'image_variants' for field in model._meta.get_fields()):
+            continue
+        rows = model.objects.filter(image=name)
+        if exclude is not None and isinstance(exclude, model):
+            rows = rows.exclude(pk=exclude.pk)
+        if rows.exists():
+            return True
+    return False
+
+
+# 刪除資料目前的圖片檔案 (其他資料使用相同檔案時保留)
+def delete_image(instance):
+    if instance.image and not image_in_use(instance.image.name, exclude=instance):
+        instance.image.delete(save=False)
+
+
+# 刪除縮圖檔案；相同的原圖仍有其他資料使用時，縮圖也是共用的，保留不刪
+def delete_variant_files(storage, variants, exclude=None):
+    variants = variants or {}
+    if variants.get('source') and image_in_use(variants['source'], exclude=exclude):
+        return
+    for name, path in variants.items():
+        if name != 'source' and storage.exists(path):
+            storage.delete(path)
+
+
+# 產生一筆資料的縮圖 (在背景執行緒中執行)，回傳 image_variants，沒有產生時回傳 None
+def generate_variants(model_label, pk):
+    model = apps.get_model(model_label)
+    storage = model._meta.get_field('image').storage
+    name = model.objects.filter(pk=pk).values_list('image', flat=True).first()
+    if not name:
+        return None
+
+    try:
+        variants = render_variants(storage, name)
+    except Exception:
+        logger.exception('%s %s 的圖片 %s 縮圖產生失敗', model_label, pk, name)
+        return None
+
+    # 產生期間圖片已被更換時，捨棄這次的縮圖；有更新時一併更新 updated 讓快取失效
+    updated = model.objects.filter(pk=pk, image=name).update(image_variants=variants, updated=timezone.now())
+    if not updated:
+        delete_variant_files(storage, variants)
+        return None
+    return variants
+
+
+def run_generate_variants(model_label, pk):
+    try:
+        generate_variants(model_label, pk)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# 取得共用的縮圖執行緒池
+def get_image_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants')
+    return _executor
+
+
+# 儲存後檢查圖片是否有變更：清除舊縮圖，並在交易完成後排入背景產生新縮圖
+# IMAGE_VARIANT_MODE = 'sync' 時直接在目前的執行緒產生 (測試、管理指令使用)
+def schedule_variants(instance):
+    variants = instance.image_variants or {}
+    name = instance.image.name if instance.image else ''
+    if variants.get('source', '') == name:
+        return
+
+    storage = instance._meta.get_field('image').storage
+    delete_variant_files(storage, variants, exclude=instance)
+    if not name:
+        instance.image_variants = {}
+        type(instance).objects.filter(pk=instance.pk).update(image_variants={})
+        return
+
+    model_label = instance._meta.label
+    if settings.IMAGE_VARIANT_MODE == 'sync':
+        instance.image_variants = generate_variants(model_label, instance.pk) or {}
+    else:
+        transaction.on_commit(lambda: get_image_executor().submit(run_generate_variants, model_label, instance.pk))
+
+
+# 刪除資料時一併刪除縮圖
+def delete_variants(instance):
+    delete_variant_files(instance._meta.get_field('image').storage, instance.image_variants)
+
+
+# 序列化縮圖網址 {"thumbnail": url, "medium": url}，縮圖尚未產生時為空 dict
+class ImageVariantsField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        storage = instance._meta.get_field('image').storage
+        request = self.context.get('request')
+        urls = {}
+        for name, path in current_variants(instance).items():
+            url = storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request is not None else url
+        return urls
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     "corsheaders",
     "rest_framework_simplejwt.token_blacklist",
 
+    "server",
     "simple_jwt",
     "product",
     "order",
@@ -53,9 +54,16 @@ AUTH_USER_MODEL = 'simple_jwt.Staff'
 
 
 # rest_framework_simplejwt (原本只使用一個身份驗證設定)
+# JWT 驗證模式 - 'claims' 由 token 與快取的使用者狀態建立請求使用者 (不需每次查詢資料庫)；
+# 'database' 每次請求都讀取 Staff (simplejwt 預設)
+JWT_AUTH_MODE = os.environ.get('JWT_AUTH_MODE', 'claims')
+JWT_USER_STATE_CACHE_SIZE = 1024     # 快取的使用者筆數
+JWT_USER_STATE_TTL = 60              # 秒，其他行程的使用者變更最晚在這段時間後生效
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'simple_jwt.authentication.ClaimsJWTAuthentication' if JWT_AUTH_MODE == 'claims'
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication',
     )
 }
 
@@ -92,13 +100,19 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
     "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    # 使用記憶體黑名單 (simple_jwt/blacklist.py)
+    "TOKEN_REFRESH_SERIALIZER": "simple_jwt.blacklist.BlacklistTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+# token 黑名單
+TOKEN_BLACKLIST_SYNC_INTERVAL = 1           # 秒，從資料表同步其他行程新增的黑名單
+TOKEN_BLACKLIST_PURGE_INTERVAL = 60 * 60    # 秒，在背景刪除過期 token 的間隔 (None 表示只用 purge_tokens 指令)
+TOKEN_BLACKLIST_PURGE_BATCH_SIZE = 1000
+
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
@@ -136,11 +150,61 @@ WSGI_APPLICATION = 'server.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite 設定檔 - 'production' 啟用 WAL、較大的快取與持久連線 (server/sqlite.py 在每個連線建立時設定)；
+# 'default' 使用 SQLite 預設值
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'production')
+SQLITE_PROFILES = {
+    'default': {
+        'PRAGMAS': {},
+        'CONN_MAX_AGE': 0,
+    },
+    'production': {
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),     # 毫秒
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,                                               # 負數為 KiB
+            'temp_store': 'MEMORY',
+        },
+        'CONN_MAX_AGE': 600,
+    },
+}
+SQLITE_PRAGMAS = SQLITE_PROFILES[SQLITE_PROFILE]['PRAGMAS']
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': SQLITE_PROFILES[SQLITE_PROFILE]['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # 統計、報表使用的唯讀快照 (server/analytics.py)，以 refresh_analytics_snapshot 指令或在背景自動更新
+    'analytics': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'analytics.sqlite3'}?mode=ro",
+        'OPTIONS': {'uri': True},
+        'CONN_MAX_AGE': 0,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_ROUTERS = ['server.analytics.AnalyticsRouter']
+
+# 快照最長可使用的時間 (秒)，超過時統計改用主資料庫，並在背景更新快照 (ANALYTICS_AUTO_REFRESH)
+ANALYTICS_MAX_STALENESS = int(os.environ.get('ANALYTICS_MAX_STALENESS', 5 * 60))
+ANALYTICS_AUTO_REFRESH = True
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/ref/settings/#caches
+
+# 預設為每個行程各自的記憶體快取；多個 worker 時請設定共用的快取 (例如 Redis)，
+# 排隊訂單的狀態與報表版本才會在所有 worker 一致
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
 }
 
 
@@ -183,6 +247,21 @@ STATIC_URL = '/static/'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / 'media/'
 
+# 上傳的檔案以內容雜湊命名 (server/storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'server.storage.HashedMediaStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# 媒體檔案回應方式 - 'django' 由應用程式回傳 (支援 Range)；
+# 'x-accel-redirect' (nginx，需設定 internal 的 MEDIA_ACCEL_REDIRECT_PREFIX 位置)、'x-sendfile' (Apache、lighttpd) 交由前端伺服器傳送
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
 STATICFILES_DIRS = [
     BASE_DIR / 'static'
 ]
@@ -193,3 +272,27 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
+
+# 訂單列表每頁筆數 (cursor 分頁)
+ORDER_PAGE_SIZE = 20
+ORDER_MAX_PAGE_SIZE = 100
+
+# 建立訂單的 Idempotency-Key 保留時間
+ORDER_IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# 建立訂單模式 - 'direct' 直接寫入資料庫；'queued' 先寫入日誌檔，由背景批次寫入 (節慶尖峰使用)
+ORDER_INGEST_MODE = os.environ.get('ORDER_INGEST_MODE', 'direct')
+# 每個 worker 行程使用自己的日誌檔，{pid} 會換成行程編號
+ORDER_INGEST_JOURNAL = BASE_DIR / 'order_journal.{pid}.ndjson'
+ORDER_INGEST_BATCH_SIZE = 200
+ORDER_INGEST_FLUSH_INTERVAL = 0.05      # 秒，等待湊成一批的時間
+
+# 上傳圖片縮圖 - 'background' 由背景執行緒池產生；'sync' 儲存時直接產生
+IMAGE_VARIANT_MODE = os.environ.get('IMAGE_VARIANT_MODE', 'background')
+IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANT_SIZES = {
+    'thumbnail': (200, 200),
+    'medium': (800, 800),
+}
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_QUALITY = 80
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.core import checks
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# PRAGMA 查詢時回傳的數值
+PRAGMA_VALUES = {
+    'synchronous': {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3},
+    'temp_store': {'DEFAULT': 0, 'FILE': 1, 'MEMORY': 2},
+}
+# 記憶體資料庫 (測試) 不支援的 PRAGMA
+FILE_ONLY_PRAGMAS = ('journal_mode', 'mmap_size')
+# 唯讀連線 (統計快照) 無法變更的 PRAGMA
+WRITE_PRAGMAS = ('journal_mode',)
+
+
+def is_read_only(connection):
+    return 'mode=ro' in str(connection.settings_dict['NAME'])
+
+
+# 連線要套用的 PRAGMA
+def connection_pragmas(connection):
+    if not is_read_only(connection):
+        return settings.SQLITE_PRAGMAS
+    return {name: value for name, value in settings.SQLITE_PRAGMAS.items() if name not in WRITE_PRAGMAS}
+
+
+# 每個 SQLite 連線建立時套用 SQLITE_PRAGMAS
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in connection_pragmas(connection).items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def expected_value(name, value):
+    if name == 'journal_mode':
+        return str(value).lower()
+    return PRAGMA_VALUES.get(name, {}).get(str(value).upper(), value)
+
+
+# 目前連線實際的 PRAGMA 值
+def effective_pragmas(connection):
+    with connection.cursor() as cursor:
+        pragmas = {}
+        for name in connection_pragmas(connection):
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            pragmas[name] = row[0] if row else None
+    return pragmas
+
+
+# 顯示 SQLite 實際的設定，與 SQLITE_PRAGMAS 不同時提出警告
+# 屬於資料庫檢查，只在 migrate 或 check --database 指定資料庫時執行，不會在每次啟動時連線
+@checks.register(checks.Tags.database)
+def check_sqlite_pragmas(app_configs, databases=None, **kwargs):
+    if not databases:
+        return []
+
+    messages = []
+    for alias in databases:
+        connection = connections[alias]
+        if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+            continue
+
+        try:
+            pragmas = effective_pragmas(connection)
+        except DatabaseError as error:
+            if not is_read_only(connection):
+                raise
+            # 統計快照尚未建立
+            messages.append(checks.Info(
+                f'SQLite ({alias}): 無法開啟唯讀資料庫 ({error})',
+                hint='執行 python manage.py refresh_analytics_snapshot 建立快照',
+                id='server.I002',
+            ))
+            continue
+
+        messages.append(checks.Info(
+            f"SQLite ({alias}, {settings.SQLITE_PROFILE}): "
+            + ', '.join(f'{name}={value}' for name, value in pragmas.items()),
+            id='server.I001',
+        ))
+
+        for name, value in connection_pragmas(connection).items():
+            if name in FILE_ONLY_PRAGMAS and connection.is_in_memory_db():
+                continue
+            if pragmas[name] != expected_value(name, value):
+                messages.append(checks.Warning(
+                    f'SQLite PRAGMA {name} 為 {pragmas[name]}，設定為 {value}',
+                    hint='檢查資料庫檔案是否可寫入，或其他程式是否鎖住資料庫',
+                    id='server.W001',
+                ))
+    return messages
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# 檔名中的內容雜湊，例如 images/cake.3f2a9c0d1b7e.jpg
+HASH_LENGTH = 12
+HASHED_NAME = re.compile(r'\.[0-9a-f]{%d}\.[^./]+$' % HASH_LENGTH)
+
+
+def is_hashed_name(name):
+    return bool(HASHED_NAME.search(name))
+
+
+# 移除檔名中的內容雜湊 (images/cake.3f2a9c0d1b7e.jpg -> images/cake.jpg)
+def strip_hash(name):
+    match = HASHED_NAME.search(name)
+    if match is None:
+        return name
+    return name[:match.start()] + os.path.splitext(name)[1]
+
+
+def content_hash(content):
+    sha = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()[:HASH_LENGTH]
+
+
+# 以內容雜湊命名的媒體檔案儲存 (images/cake.jpg -> images/cake.3f2a9c0d1b7e.jpg)
+# 同一個檔名的內容永遠不會改變，瀏覽器與 CDN 可以長期快取
+# 檔名已含雜湊時也一律移除後依內容重新計算；相同內容的檔案已存在時直接沿用，不另存一份
+class HashedMediaStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        root, extension = os.path.splitext(strip_hash(name))
+        suffix = f'.{content_hash(content)}{extension}'
+        # 檔名過長時截短原檔名，保留雜湊
+        if max_length and len(root) + len(suffix) > max_length:
+            root = root[:max_length - len(suffix)]
+        name = root + suffix
+
+        if self.exists(name):
+            return name
+
+        saved = super().save(name, content, max_length)
+        if saved != name and self.exists(name):
+            # 同時儲存相同內容時另一個請求已先寫入，改用已存在的檔案
+            self.delete(saved)
+            return name
+        return saved
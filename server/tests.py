@@ -0,0 +1,532 @@
+from unittest import mock
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from order.models import Order, OrderItem
+from order.stats import rebuild_daily_stats, record_order_items
+from product.models import Product
+from simple_jwt.attendance import clock_in
+from simple_jwt.blacklist import CachedBlacklistRefreshToken, token_blacklist
+from simple_jwt.models import Shift, Staff
+from .analytics import (ANALYTICS_DB_ALIAS, AnalyticsRouter, analytics_reads, analytics_version,
+                        refresh_snapshot)
+from .sqlite import check_sqlite_pragmas, effective_pragmas
+from .storage import HashedMediaStorage, content_hash
+
+
+class SQLitePragmaTests(TestCase):
+    databases = {'default', 'analytics'}
+
+    def test_pragmas_applied_on_connect(self):
+        pragmas = effective_pragmas(connection)
+
+        self.assertEqual(pragmas['synchronous'], 1)
+        self.assertEqual(pragmas['busy_timeout'], 5000)
+        self.assertEqual(pragmas['temp_store'], 2)
+        self.assertEqual(pragmas['cache_size'], -65536)
+
+    def test_startup_check_reports_pragmas(self):
+        messages = check_sqlite_pragmas(None, databases=['default', 'analytics'])
+
+        self.assertEqual([message.id for message in messages], ['server.I001', 'server.I001'])
+        self.assertIn('busy_timeout=5000', messages[0].msg)
+
+    def test_startup_check_warns_on_mismatch(self):
+        with override_settings(SQLITE_PRAGMAS={'busy_timeout': 1000}):
+            messages = check_sqlite_pragmas(None, databases=['default', 'analytics'])
+
+        self.assertEqual([message.id for message in messages],
+                         ['server.I001', 'server.W001', 'server.I001', 'server.W001'])
+
+    def test_check_skipped_without_databases(self):
+        self.assertEqual(check_sqlite_pragmas(None), [])
+
+
+class HashedMediaStorageTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.storage = HashedMediaStorage(location=location)
+
+    def test_existing_hash_is_replaced_by_content_hash(self):
+        content = ContentFile(b'cake')
+        name = self.storage.save('images/cake.000000000000.jpg', content)
+
+        self.assertEqual(name, f'images/cake.{content_hash(content)}.jpg')
+
+    def test_same_content_reuses_file(self):
+        first = self.storage.save('images/cake.jpg', ContentFile(b'cake'))
+        second = self.storage.save('images/cake.jpg', ContentFile(b'cake'))
+
+        self.assertEqual(first, second)
+        self.assertEqual(os.listdir(os.path.join(self.storage.location, 'images')), [os.path.basename(first)])
+
+
+class AnalyticsSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source = os.path.join(directory.name, 'db.sqlite3')
+        self.target = os.path.join(directory.name, 'analytics.sqlite3')
+
+        source = sqlite3.connect(self.source)
+        source.execute('PRAGMA journal_mode = WAL')
+        source.execute('CREATE TABLE stats (total INTEGER)')
+        source.execute('INSERT INTO stats VALUES (42)')
+        source.commit()
+        self.addCleanup(source.close)
+
+    def test_refresh_copies_database_readable_read_only(self):
+        started = time.time()
+        refresh_snapshot(self.source, self.target)
+
+        snapshot = sqlite3.connect(f'file:{self.target}?mode=ro', uri=True)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(snapshot.execute('SELECT total FROM stats').fetchall(), [(42,)])
+        self.assertEqual(snapshot.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+        self.assertGreaterEqual(os.stat(self.target).st_mtime, int(started))
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.target))),
+                         ['analytics.sqlite3', 'db.sqlite3', 'db.sqlite3-shm', 'db.sqlite3-wal'])
+
+    def test_concurrent_refreshes_use_separate_temporary_files(self):
+        threads = [threading.Thread(target=refresh_snapshot, args=(self.source, self.target)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        snapshot = sqlite3.connect(f'file:{self.target}?mode=ro', uri=True)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(snapshot.execute('SELECT total FROM stats').fetchall(), [(42,)])
+        self.assertFalse([name for name in os.listdir(os.path.dirname(self.target)) if name.endswith('.tmp')])
+
+    def test_fresh_snapshot_used_for_reads(self):
+        refresh_snapshot(self.source, self.target)
+        router = AnalyticsRouter()
+
+        with mock.patch('server.analytics.snapshot_path', return_value=self.target):
+            self.assertIsNone(router.db_for_read(Staff))
+            with analytics_reads():
+                self.assertEqual(router.db_for_read(Staff), ANALYTICS_DB_ALIAS)
+                self.assertTrue(analytics_version().startswith('snapshot-'))
+            self.assertIsNone(router.db_for_read(Staff))
+
+    @override_settings(ANALYTICS_MAX_STALENESS=60)
+    def test_stale_snapshot_falls_back_and_refreshes(self):
+        refresh_snapshot(self.source, self.target)
+        an_hour_ago = time.time() - 60 * 60
+        os.utime(self.target, (an_hour_ago, an_hour_ago))
+
+        with mock.patch('server.analytics.snapshot_path', return_value=self.target), \
+                mock.patch('server.analytics.schedule_refresh') as schedule_refresh:
+            with analytics_reads():
+                self.assertEqual(AnalyticsRouter().db_for_read(Staff), DEFAULT_DB_ALIAS)
+                self.assertEqual(analytics_version(), 'primary')
+
+        schedule_refresh.assert_called()
+
+    def test_missing_snapshot_falls_back(self):
+        with mock.patch('server.analytics.snapshot_path', return_value=self.target), \
+                mock.patch('server.analytics.schedule_refresh'):
+            with analytics_reads():
+                self.assertEqual(AnalyticsRouter().db_for_read(Staff), DEFAULT_DB_ALIAS)
+
+    def test_snapshot_is_never_migrated_or_written(self):
+        router = AnalyticsRouter()
+        staff = Staff(username='analyst')
+        staff._state.db = ANALYTICS_DB_ALIAS
+
+        self.assertFalse(router.allow_migrate(ANALYTICS_DB_ALIAS, 'order'))
+        self.assertIsNone(router.allow_migrate(DEFAULT_DB_ALIAS, 'order'))
+        self.assertEqual(router.db_for_write(Staff, instance=staff), DEFAULT_DB_ALIAS)
+
+
+# 每個端點的查詢都需使用索引，不可退化成整張資料表掃描 (EXPLAIN QUERY PLAN 出現 SCAN 資料表 且沒有 USING INDEX)
+class QueryPlanTests(TestCase):
+    # 必須掃描的查詢：{網址: 資料表}
+    ALLOWED_SCANS = {
+        '/api/v1/client/search/': 'simple_jwt_staff',     # 會員姓名、帳號、email 的部分字串搜尋
+    }
+
+    def setUp(self):
+        self.admin = Staff.objects.create_user(username='admin', password='pass', email='admin@example.com',
+                                               backend=True)
+        self.staff = Staff.objects.create_user(username='staff', password='pass', email='staff@example.com',
+                                               is_office_staff=True)
+        self.client_user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        product = Product.objects.create(category='粽子', name='鮮肉粽', price=100, complete=True)
+        self.order = Order.objects.create(user=self.client_user, client_name='王小明', address='台北市',
+                                          phone='0912345678', paid_amount=100)
+        OrderItem.objects.create(order=self.order, product=product, price=100, quantity=1)
+        record_order_items(self.order, self.order.items.all())
+        clock_in(self.staff.id, timezone.now())
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def full_scans(self, queries):
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                for row in cursor.fetchall():
+                    match = re.fullmatch(r'SCAN (\w+)', row[3])
+                    if match:
+                        scans.append((match.group(1), query['sql']))
+        return scans
+
+    def request(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400, url)
+        return queries
+
+    def test_endpoints_use_indexes(self):
+        today = timezone.localdate()
+        endpoints = [
+            ('get', '/api/v1/products/', None),
+            ('get', '/api/v1/front_products/', None),
+            ('get', '/api/v1/all_orders/', None),
+            ('get', f'/api/v1/user_orders/{self.client_user.id}/', None),
+            ('get', f'/api/v1/order_status/{self.order.order_id}/', None),
+            ('get', '/api/v1/order/search/', {'search': '0912'}),
+            ('get', '/api/v1/order_export/', {'start': '2023-01-01', 'end': today.isoformat()}),
+            ('get', '/api/v1/order_stats/', {'start': '2023-01-01', 'category': '粽子'}),
+            ('get', '/api/v1/daily_order_stats/', None),
+            ('get', '/api/v1/monthly_order_stats/', None),
+            ('get', '/api/v1/yearly_order_stats/', None),
+            ('get', '/api/v1/all_daily_order_stats/', None),
+            ('post', '/api/v1/search_date_order_stats/', {'search': today.isoformat()}),
+            ('get', '/api/v1/staffs/', None),
+            ('get', '/api/v1/staffs/search/', {'search': 'staff'}),
+            ('get', '/api/v1/staff_set/', None),
+            ('get', '/api/v1/staff_wait_set/', None),
+            ('get', '/api/v1/back_client_set/', None),
+            ('get', '/api/v1/client_black_set/', None),
+            ('get', '/api/v1/client/search/', {'search': 'client'}),
+            ('get', f'/api/v1/client_profile/{self.client_user.id}/', None),
+            ('get', '/api/v1/staff_clock_in_out_records/', None),
+            ('post', f'/api/v1/staff_one_month_clock_records/{self.staff.id}/', {'data': today.month}),
+            ('post', '/api/v1/staff_month_clock_records/', {'periods': [{'year': today.year, 'month': today.month}]}),
+        ]
+
+        for method, url, data in endpoints:
+            with self.subTest(url=url):
+                scans = [
+                    (table, sql) for table, sql in self.full_scans(self.request(method, url, data))
+                    if self.ALLOWED_SCANS.get(url) != table
+                ]
+                self.assertEqual(scans, [])
+
+
+# 每個路由的查詢次數與回應時間預算
+# 以不同資料量執行同一組請求：查詢次數不可超過預算，也不可隨資料量增加 (N+1)；
+# 回應時間不可超過預算 × ENDPOINT_BUDGET_TOLERANCE (環境變數，預設 2，較慢的機器可調高)
+ENDPOINT_BUDGET_TOLERANCE = float(os.environ.get('ENDPOINT_BUDGET_TOLERANCE', 2))
+
+
+def walk_routes(patterns, prefix=''):
+    for pattern in patterns:
+        route = str(pattern.pattern)
+        # 與 ResolverMatch.route 相同，串接時去掉子路由開頭的 ^
+        if prefix and route.startswith('^'):
+            route = route[1:]
+        if hasattr(pattern, 'url_patterns'):
+            yield from walk_routes(pattern.url_patterns, prefix + route)
+        else:
+            yield prefix + route
+
+
+class EndpointBudgetTests(TestCase):
+    DATASET_SIZES = (10, 40)
+
+    # 不測試的路由與原因
+    SKIPPED_ROUTES = {
+        'api/v1/$': '被 getRoutes (api/v1/) 遮蔽',
+        'api/v1/staffs/search/': '被 StaffList 的 search action 路由遮蔽',
+        'api/v1/front_order/(?P<pk>[^/.]+)/user_orders/$': 'router 產生的重複路由 (參數名稱為 pk，請使用 user_orders/<user_id>/)',
+    }
+
+    # {路由: (最多查詢次數, 時間預算 ms)}，建立帳號、登入需計算密碼雜湊所以時間較長
+    BUDGETS = {
+        'api/v1/': (0, 100),
+        'api/v1/products/$': (2, 100),
+        'api/v1/products/(?P<pk>[^/.]+)/$': (1, 100),
+        'api/v1/product_set/$': (1, 100),
+        'api/v1/product_set/(?P<pk>[^/.]+)/$': (2, 100),
+        'api/v1/front_products/$': (2, 100),
+        'api/v1/front_products/(?P<pk>[^/.]+)/$': (1, 100),
+        'api/v1/product_delete/<int:pk>/': (4, 100),
+        'api/v1/product_show/<int:pk>/': (2, 100),
+
+        'api/v1/token/': (2, 1000),
+        'api/v1/token/refresh/': (6, 100),
+
+        'api/v1/staffs/$': (1, 100),
+        'api/v1/staffs/search/$': (1, 100),
+        'api/v1/staffs/(?P<pk>[^/.]+)/$': (4, 100),
+        'api/v1/staff_set/$': (2, 1000),
+        'api/v1/staff_set/(?P<pk>[^/.]+)/$': (2, 100),
+        'api/v1/staff_wait_set/$': (1, 100),
+        'api/v1/staff_wait_set/(?P<pk>[^/.]+)/$': (2, 100),
+        'api/v1/client_set/$': (2, 1000),
+        'api/v1/client_set/(?P<pk>[^/.]+)/$': (5, 100),
+        'api/v1/client_set/(?P<pk>[^/.]+)/client_profile/$': (8, 100),
+        'api/v1/back_client_set/$': (1, 100),
+        'api/v1/back_client_set/(?P<pk>[^/.]+)/$': (5, 100),
+        'api/v1/client_black_set/$': (1, 100),
+        'api/v1/client_black_set/(?P<pk>[^/.]+)/$': (2, 100),
+        'api/v1/clock-in/<int:pk>/': (2, 100),
+        'api/v1/clock-out/<int:pk>/': (2, 100),
+        'api/v1/clock_records_sync/': (5, 100),
+        'api/v1/staff_clock_in_out_records/': (2, 250),
+        'api/v1/staff_one_month_clock_records/<int:pk>/': (2, 100),
+        'api/v1/staff_month_clock_records/': (2, 100),
+        'api/v1/staff_delete/<int:pk>/': (2, 100),
+        'api/v1/staff_delete_from_db/<int:pk>/': (9, 100),
+        'api/v1/client/search/': (1, 100),
+        'api/v1/client_delete/<int:pk>/': (2, 100),
+        'api/v1/client_delete_from_db/<int:pk>/': (9, 100),
+        'api/v1/client_profile/<int:pk>/': (8, 100),
+        'api/v1/client_update/<int:pk>/': (2, 100),
+
+        'api/v1/front_order/$': (7, 100),
+        'api/v1/front_order/(?P<pk>[^/.]+)/$': (2, 100),
+        'api/v1/all_orders/$': (4, 100),
+        'api/v1/all_orders/(?P<pk>[^/.]+)/$': (2, 100),
+        'api/v1/user_orders/<int:user_id>/': (4, 100),
+        'api/v1/order_status/<uuid:order_id>/': (2, 100),
+        'api/v1/delete_order/<int:pk>/': (8, 100),
+        'api/v1/order/search/': (2, 100),
+        'api/v1/order_export/': (3, 100),
+        'api/v1/order_stats/': (4, 100),
+        'api/v1/daily_order_stats/': (4, 100),
+        'api/v1/monthly_order_stats/': (4, 100),
+        'api/v1/yearly_order_stats/': (4, 100),
+        'api/v1/search_date_order_stats/': (1, 100),
+        'api/v1/all_daily_order_stats/': (4, 100),
+
+        '^media/(?P<path>.*)$': (0, 100),
+    }
+
+    def setUp(self):
+        self.password = make_password('pass')
+        self.admin = Staff.objects.create(username='admin', password=self.password, email='admin@example.com',
+                                          backend=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.seeded = 0
+        self.created = 0
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        with open(os.path.join(media_root, 'sample.txt'), 'w') as file:
+            file.write('sample')
+
+    def make_staff(self, **fields):
+        self.created += 1
+        username = f'new{self.created}'
+        return Staff.objects.create(username=username, email=f'{username}@example.com', password=self.password,
+                                    **fields)
+
+    def make_order(self, user):
+        order = Order.objects.create(user=user, client_name=user.username, address='台北市',
+                                     phone='0912345678', paid_amount=300)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, price=product.price, quantity=1)
+            for product in self.products[:3]
+        ])
+        return order
+
+    # 新增資料到 size 筆：員工、離職員工、會員、黑名單會員、商品、訂單 (每筆 3 個商品項) 各 size 筆，
+    # 第一位員工的出勤天數與第一位會員的訂單數也隨資料量增加
+    def seed(self, size):
+        indexes = range(self.seeded, size)
+        users = []
+        for index in indexes:
+            for prefix, fields in [
+                ('staff', {'is_office_staff': True}),
+                ('former', {'is_delete': True}),
+                ('client', {}),
+                ('blocked', {'is_delete_client': True}),
+            ]:
+                username = f'{prefix}{index}'
+                users.append(Staff(username=username, name=username, email=f'{username}@example.com',
+                                   password=self.password, **fields))
+        Staff.objects.bulk_create(users)
+        Product.objects.bulk_create([
+            Product(category=f'分類{index % 3}', name=f'商品{index}', price=100 + index, complete=True)
+            for index in indexes
+        ])
+
+        self.staff = list(Staff.objects.filter(is_office_staff=True).order_by('id'))
+        self.clients = list(Staff.objects.filter(username__startswith='client').order_by('id'))
+        self.products = list(Product.objects.order_by('id'))
+
+        orders = Order.objects.bulk_create([
+            Order(user=self.clients[0] if index % 2 == 0 else self.clients[index], client_name=f'客戶{index}',
+                  address='台北市', phone=f'09{index:08d}', paid_amount=300)
+            for index in indexes
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.products[(index - offset) % size],
+                      price=self.products[(index - offset) % size].price, quantity=1 + offset)
+            for order, index in zip(orders, indexes)
+            for offset in range(3)
+        ])
+        rebuild_daily_stats()
+
+        today = timezone.localdate()
+        now = timezone.now()
+        Shift.objects.bulk_create([
+            Shift(staff=staff, date=today - timedelta(days=days), clock_in_time=now - timedelta(days=days, hours=8))
+            for staff in self.staff
+            for days in range(size if staff == self.staff[0] else 3)
+        ], ignore_conflicts=True)
+        self.seeded = size
+
+    def request(self, method, url, data=None, content_format='json'):
+        cache.clear()
+        token_blacklist.reset()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, data, format=content_format)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - started) * 1000
+        self.assertLess(response.status_code, 400, f'{method.upper()} {url}: {response.status_code}')
+        return resolve(url.split('?')[0]).route, len(queries), elapsed
+
+    # 每個路由一個請求 (method, url, data, format)；會修改資料的請求使用新建立的資料
+    def endpoint_requests(self):
+        today = timezone.localdate()
+        staff = self.staff[0]
+        client = self.clients[0]
+        product = self.products[0]
+        order = Order.objects.filter(user=client).first()
+        refresh = CachedBlacklistRefreshToken.for_user(self.admin)
+        period = {'year': today.year, 'month': today.month}
+        return [
+            ('get', '/api/v1/', None, 'json'),
+            ('get', '/api/v1/products/', None, 'json'),
+            ('get', f'/api/v1/products/{product.id}/', None, 'json'),
+            ('post', '/api/v1/product_set/', {'name': '新商品', 'category': '分類0', 'price': '100',
+                                              'description': '', 'image': ''}, 'multipart'),
+            ('put', f'/api/v1/product_set/{product.id}/', {'name': product.name, 'price': '120'}, 'multipart'),
+            ('get', '/api/v1/front_products/', None, 'json'),
+            ('get', f'/api/v1/front_products/{product.id}/', None, 'json'),
+            ('delete', f'/api/v1/product_delete/{Product.objects.create(category="分類0", name="下架", price=1).id}/',
+             None, 'json'),
+            ('patch', f'/api/v1/product_show/{Product.objects.create(category="分類0", name="上架", price=1).id}/',
+             None, 'json'),
+
+            ('post', '/api/v1/token/', {'username': 'admin', 'password': 'pass'}, 'json'),
+            ('post', '/api/v1/token/refresh/', {'refresh': str(refresh)}, 'json'),
+
+            ('get', '/api/v1/staffs/', None, 'json'),
+            ('get', '/api/v1/staffs/search/', {'search': 'staff'}, None),
+            ('get', f'/api/v1/staffs/{staff.id}/', None, 'json'),
+            ('post', '/api/v1/staff_set/', {'username': f'hired{self.seeded}', 'password1': 'pass', 'name': '',
+                                            'email': f'hired{self.seeded}@example.com'}, 'json'),
+            ('put', f'/api/v1/staff_set/{staff.id}/', {'username': staff.username, 'password1': '', 'name': '員工',
+                                                       'email': staff.email}, 'json'),
+            ('get', '/api/v1/staff_wait_set/', None, 'json'),
+            ('put', f'/api/v1/staff_wait_set/{self.make_staff(is_delete=True).id}/', None, 'json'),
+            ('post', '/api/v1/client_set/', {'username': f'joined{self.seeded}', 'password1': 'pass', 'name': '',
+                                             'email': f'joined{self.seeded}@example.com'}, 'json'),
+            ('get', f'/api/v1/client_set/{client.id}/', None, 'json'),
+            ('get', f'/api/v1/client_set/{client.id}/client_profile/', None, 'json'),
+            ('get', '/api/v1/back_client_set/', None, 'json'),
+            ('get', f'/api/v1/back_client_set/{client.id}/', None, 'json'),
+            ('get', '/api/v1/client_black_set/', None, 'json'),
+            ('put', f'/api/v1/client_black_set/{self.make_staff(is_delete_client=True).id}/', None, 'json'),
+
+            ('post', f'/api/v1/clock-in/{self.make_staff(is_office_staff=True).id}/', None, 'json'),
+            ('put', f'/api/v1/clock-out/{staff.id}/', None, 'json'),
+            ('post', '/api/v1/clock_records_sync/', {'punches': [
+                {'staff_id': self.staff[1].id, 'type': 'in',
+                 'time': (timezone.now() - timedelta(minutes=minutes)).isoformat()}
+                for minutes in (30, 20, 10)
+            ]}, 'json'),
+            ('get', '/api/v1/staff_clock_in_out_records/', None, 'json'),
+            ('post', f'/api/v1/staff_one_month_clock_records/{staff.id}/', {'data': today.month}, 'json'),
+            ('post', '/api/v1/staff_month_clock_records/', {'periods': [period]}, 'json'),
+            ('patch', f'/api/v1/staff_delete/{self.make_staff(is_office_staff=True).id}/', None, 'json'),
+            ('delete', f'/api/v1/staff_delete_from_db/{self.make_staff(is_delete=True).id}/', None, 'json'),
+            ('get', '/api/v1/client/search/', {'search': 'client'}, None),
+            ('patch', f'/api/v1/client_delete/{self.make_staff().id}/', None, 'json'),
+            ('delete', f'/api/v1/client_delete_from_db/{self.make_staff(is_delete_client=True).id}/', None, 'json'),
+            ('get', f'/api/v1/client_profile/{client.id}/', None, 'json'),
+            ('put', f'/api/v1/client_update/{client.id}/', {'newPassword': '', 'updatName': '會員'}, 'multipart'),
+
+            ('post', '/api/v1/front_order/', {
+                'client_name': '王小明', 'email': '', 'address': '台北市', 'phone': '0912345678', 'paid_amount': 300,
+                'items': [{'id': product.id, 'price': product.price, 'quantity': 1} for product in self.products[:3]],
+            }, 'json'),
+            ('get', f'/api/v1/front_order/{order.id}/', None, 'json'),
+            ('get', '/api/v1/all_orders/', None, 'json'),
+            ('get', f'/api/v1/all_orders/{order.id}/', None, 'json'),
+            ('get', f'/api/v1/user_orders/{client.id}/', None, 'json'),
+            ('get', f'/api/v1/order_status/{order.order_id}/', None, 'json'),
+            ('delete', f'/api/v1/delete_order/{self.make_order(client).id}/', None, 'json'),
+            ('get', '/api/v1/order/search/', {'search': '0900'}, None),
+            ('get', '/api/v1/order_export/', {'type': 'ndjson'}, None),
+            ('get', '/api/v1/order_stats/', {'granularity': 'month'}, None),
+            ('get', '/api/v1/daily_order_stats/', None, 'json'),
+            ('get', '/api/v1/monthly_order_stats/', None, 'json'),
+            ('get', '/api/v1/yearly_order_stats/', None, 'json'),
+            ('post', '/api/v1/search_date_order_stats/', {'search': today.isoformat()}, 'json'),
+            ('get', '/api/v1/all_daily_order_stats/', None, 'json'),
+
+            ('get', '/media/sample.txt', None, None),
+        ]
+
+    def test_every_route_has_a_budget(self):
+        routes = {
+            route for route in walk_routes(get_resolver().url_patterns)
+            if not route.startswith('admin/') and '(?P<format>' not in route
+        }
+
+        self.assertEqual(routes - self.BUDGETS.keys() - self.SKIPPED_ROUTES.keys(), set())
+        self.assertEqual(self.BUDGETS.keys() - routes, set())
+
+    def test_query_counts_and_latency(self):
+        measured = {}
+        for size in self.DATASET_SIZES:
+            self.seed(size)
+            for method, url, data, content_format in self.endpoint_requests():
+                route, queries, elapsed = self.request(method, url, data, content_format)
+                measured.setdefault(route, []).append((queries, elapsed))
+
+        for route, results in measured.items():
+            max_queries, budget = self.BUDGETS[route]
+            counts = [queries for queries, _ in results]
+            with self.subTest(route=route):
+                self.assertLessEqual(max(counts), max_queries, f'查詢次數 {counts}')
+                self.assertLessEqual(counts[-1], counts[0], f'查詢次數隨資料量增加 {counts}')
+                # 以最大的資料量計時
+                self.assertLessEqual(results[-1][1], budget * ENDPOINT_BUDGET_TOLERANCE)
@@ -1,7 +1,11 @@
 from django.contrib import admin
-from .models import Staff, ClockInRecord, ClockOutRecord
+from .models import Staff, Shift
 
-admin.site.register(Staff)
-admin.site.register(ClockInRecord)
-admin.site.register(ClockOutRecord)
 
+# 在後台admin資料庫中顯示員工每日出勤
+class ShiftAdmin(admin.ModelAdmin):
+    list_display = ('staff', 'date', 'clock_in_time', 'clock_out_time', 'worked_minutes')
+
+
+admin.site.register(Staff)
+admin.site.register(Shift, ShiftAdmin)
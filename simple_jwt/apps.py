@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SimpleJwtConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'simple_jwt'
+
+    def ready(self):
+        from . import signals  # noqa: F401
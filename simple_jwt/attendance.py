@@ -0,0 +1,270 @@
+from calendar import monthrange
+from datetime import date
+import time
+
+from django.core.cache import cache
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from server.analytics import analytics_version
+
+from .models import Staff, Shift
+
+# 年度打卡統計快取
+# 版本不會過期，只在打卡或員工資料變更時更新 (invalidate_attendance_reports)；
+# 多個 worker 時需設定共用的快取 (CACHES)，版本更新才會在所有 worker 生效
+REPORT_CACHE_TIMEOUT = 60 * 60
+REPORT_VERSION_KEY = 'attendance_report_version'
+
+
+# SQLite 的單一語句打卡 (INSERT ... ON CONFLICT ... RETURNING，需要 SQLite 3.35 以上)
+# 沒有紀錄時新增、有紀錄時在同一個語句中更新，不需先查詢或鎖定；其他資料庫使用 ORM 寫法
+# 上班分鐘數與 Shift.update_worked_minutes 相同 (以毫秒計算)
+SQLITE_WORKED_MINUTES = (
+    'CASE WHEN julianday({clock_out}) > julianday({clock_in}) '
+    'THEN CAST(ROUND((julianday({clock_out}) - julianday({clock_in})) * 86400000) AS INTEGER) / 60000 END'
+)
+
+# 當天沒有紀錄時新增；已有紀錄 (例如先打了下班卡) 且尚未有上班時間時補上
+SQLITE_CLOCK_IN = (
+    'INSERT INTO {table} (staff_id, date, clock_in_time, clock_out_time, worked_minutes) '
+    'VALUES (%s, %s, %s, NULL, NULL) '
+    'ON CONFLICT (staff_id, date) DO UPDATE SET clock_in_time = excluded.clock_in_time, worked_minutes = '
+    + SQLITE_WORKED_MINUTES.format(clock_in='excluded.clock_in_time', clock_out='clock_out_time')
+    + ' WHERE {table}.clock_in_time IS NULL RETURNING id'
+)
+
+# 曾經打過上班卡時才新增或覆蓋當天的下班時間
+SQLITE_CLOCK_OUT = (
+    'INSERT INTO {table} (staff_id, date, clock_in_time, clock_out_time, worked_minutes) '
+    'SELECT %s, %s, NULL, %s, NULL '
+    'WHERE EXISTS (SELECT 1 FROM {table} WHERE staff_id = %s AND clock_in_time IS NOT NULL) '
+    'ON CONFLICT (staff_id, date) DO UPDATE SET clock_out_time = excluded.clock_out_time, worked_minutes = '
+    + SQLITE_WORKED_MINUTES.format(clock_in='clock_in_time', clock_out='excluded.clock_out_time')
+    + ' RETURNING id'
+)
+
+
+def supports_sqlite_upsert(connection):
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+# 執行單一語句打卡，回傳是否有寫入
+def sqlite_punch(connection, sql, staff_id, day, when, *params):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            sql.format(table=connection.ops.quote_name(Shift._meta.db_table)),
+            [staff_id, connection.ops.adapt_datefield_value(day), connection.ops.adapt_datetimefield_value(when),
+             *params],
+        )
+        return cursor.fetchone() is not None
+
+
+# 員工上班打卡，一天只記錄第一次，回傳是否有寫入
+def clock_in(staff_id, when):
+    day = timezone.localtime(when).date()
+    connection = connections[router.db_for_write(Shift)]
+    if supports_sqlite_upsert(connection):
+        return sqlite_punch(connection, SQLITE_CLOCK_IN, staff_id, day, when)
+
+    try:
+        with transaction.atomic(using=connection.alias):
+            Shift.objects.create(staff_id=staff_id, date=day, clock_in_time=when)
+        return True
+    except IntegrityError:
+        pass
+
+    # 當天已有出勤紀錄 (例如先打了下班卡)，尚未有上班時間時補上
+    with transaction.atomic(using=connection.alias):
+        shift = Shift.objects.select_for_update().get(staff_id=staff_id, date=day)
+        if shift.clock_in_time is not None:
+            return False
+        shift.clock_in_time = when
+        shift.update_worked_minutes()
+        shift.save(update_fields=['clock_in_time', 'worked_minutes'])
+    return True
+
+
+# 員工下班打卡，同一天重複打卡時覆蓋，回傳是否有寫入 (從未打過上班卡時不寫入)
+def clock_out(staff_id, when):
+    day = timezone.localtime(when).date()
+    connection = connections[router.db_for_write(Shift)]
+    if supports_sqlite_upsert(connection):
+        return sqlite_punch(connection, SQLITE_CLOCK_OUT, staff_id, day, when, staff_id)
+
+    with transaction.atomic(using=connection.alias):
+        shift = Shift.objects.select_for_update().filter(staff_id=staff_id, date=day).first()
+        if shift is None:
+            if not Shift.objects.filter(staff_id=staff_id, clock_in_time__isnull=False).exists():
+                return False
+            shift, _ = Shift.objects.get_or_create(staff_id=staff_id, date=day)
+        shift.clock_out_time = when
+        shift.update_worked_minutes()
+        shift.save(update_fields=['clock_out_time', 'worked_minutes'])
+    return True
+
+
+# 批次同步打卡 (離線打卡機重新連線時使用)，規則與單筆打卡相同：上班取最早、下班取最晚
+# punches 為 [(staff_id, 'in' | 'out', 時間), ...]，回傳每筆的結果：
+# clock_in、clock_out (寫入)、duplicate (重複)、already_clocked_in、no_clock_in、superseded (已有較晚的下班卡)
+def sync_punches(punches):
+    staff_ids = {staff_id for staff_id, _, _ in punches}
+    days = {timezone.localtime(when).date() for _, _, when in punches}
+    results = [None] * len(punches)
+
+    with transaction.atomic():
+        shifts = {
+            (shift.staff_id, shift.date): shift
+            for shift in Shift.objects.select_for_update().filter(staff_id__in=staff_ids, date__in=days)
+        }
+        clocked_in = set(
+            Shift.objects.filter(staff_id__in=staff_ids, clock_in_time__isnull=False)
+            .values_list('staff_id', flat=True).distinct()
+        )
+
+        # 依打卡時間先後處理，同一時間先處理上班卡
+        seen = set()
+        changed = set()
+        for index in sorted(range(len(punches)), key=lambda i: (punches[i][2], punches[i][1] != 'in')):
+            staff_id, kind, when = punches[index]
+            if (staff_id, kind, when) in seen:
+                results[index] = 'duplicate'
+                continue
+            seen.add((staff_id, kind, when))
+
+            key = (staff_id, timezone.localtime(when).date())
+            shift = shifts.get(key)
+            if kind == 'in':
+                if shift is not None and shift.clock_in_time is not None and shift.clock_in_time <= when:
+                    results[index] = 'already_clocked_in'
+                    continue
+                clocked_in.add(staff_id)
+            else:
+                if staff_id not in clocked_in:
+                    results[index] = 'no_clock_in'
+                    continue
+                if shift is not None and shift.clock_out_time is not None and shift.clock_out_time > when:
+                    results[index] = 'superseded'
+                    continue
+
+            if shift is None:
+                shift = shifts[key] = Shift(staff_id=staff_id, date=key[1])
+            setattr(shift, 'clock_in_time' if kind == 'in' else 'clock_out_time', when)
+            changed.add(key)
+            results[index] = 'clock_in' if kind == 'in' else 'clock_out'
+
+        new_shifts = []
+        updated_shifts = []
+        for key in changed:
+            shift = shifts[key]
+            shift.update_worked_minutes()
+            (updated_shifts if shift.pk else new_shifts).append(shift)
+
+        Shift.objects.bulk_create(new_shifts)
+        Shift.objects.bulk_update(updated_shifts, ['clock_in_time', 'clock_out_time', 'worked_minutes'])
+
+    return results
+
+
+# 查詢多段期間所有員工的上下班紀錄 (一次查詢)
+# ranges 為當地日期 [(開始, 結束), ...] (含開始、不含結束)
+# 回傳 {(staff_id, date): 時間字串} 的上班、下班紀錄
+def clock_records_between(staff_ids, ranges):
+    date_range = Q()
+    for start, end in ranges:
+        date_range |= Q(date__gte=start, date__lt=end)
+
+    clock_ins = {}
+    clock_outs = {}
+    shifts = Shift.objects.filter(date_range, staff_id__in=staff_ids).values_list(
+        'staff_id', 'date', 'clock_in_time', 'clock_out_time')
+    for staff_id, day, clock_in_time, clock_out_time in shifts:
+        if clock_in_time:
+            clock_ins[(staff_id, day)] = timezone.localtime(clock_in_time).isoformat()
+        if clock_out_time:
+            clock_outs[(staff_id, day)] = timezone.localtime(clock_out_time).isoformat()
+    return clock_ins, clock_outs
+
+
+# 一個月每天的上下班時間
+def month_clock_records(staff_id, year, month, clock_ins, clock_outs):
+    records = []
+    for day in range(1, monthrange(year, month)[1] + 1):
+        key = (staff_id, date(year, month, day))
+        records.append({
+            "clock_in_time": clock_ins.get(key),
+            "clock_out_time": clock_outs.get(key),
+        })
+    return records
+
+
+# 年度每位員工每月每日的上下班紀錄
+def build_yearly_report(year):
+    staff = list(
+        Staff.objects.filter(backend=False, is_delete=False, is_office_staff=True)
+        .values('id', 'username', 'name')
+    )
+    clock_ins, clock_outs = clock_records_between(
+        [employee['id'] for employee in staff], [(date(year, 1, 1), date(year + 1, 1, 1))])
+
+    monthly_records = []
+    for employee in staff:
+        monthly_records.append({
+            "staff": employee['username'],
+            "staff_id": employee['id'],
+            "staff_name": employee['name'],
+            "monthly_records": [
+                {"clock_records": month_clock_records(employee['id'], year, month, clock_ins, clock_outs)}
+                for month in range(1, 13)
+            ],
+        })
+    return monthly_records
+
+
+# 指定員工、指定月份的每日上下班紀錄
+# staff 為員工資料 (id、username、name)，periods 為 [(年, 月), ...]
+def build_monthly_reports(staff, periods):
+    ranges = [
+        (date(year, month, 1), date(year + month // 12, month % 12 + 1, 1))
+        for year, month in periods
+    ]
+    clock_ins, clock_outs = clock_records_between([employee['id'] for employee in staff], ranges)
+
+    return [
+        {
+            "staff": employee['username'],
+            "staff_id": employee['id'],
+            "staff_name": employee['name'],
+            "year": year,
+            "month": month,
+            "monthly_records": month_clock_records(employee['id'], year, month, clock_ins, clock_outs),
+        }
+        for employee in staff
+        for year, month in periods
+    ]
+
+
+# 打卡統計版本 (打卡或員工資料變更時更新)
+def report_version():
+    return cache.get_or_set(REPORT_VERSION_KEY, time.time_ns, None)
+
+
+# 報表由統計快照產生時，快照更新後也需重新產生
+def report_cache_key(year):
+    return f'attendance_report:{report_version()}:{analytics_version()}:{year}'
+
+
+# 年度打卡統計 (使用快取)
+def yearly_report(year):
+    key = report_cache_key(year)
+    report = cache.get(key)
+    if report is None:
+        report = build_yearly_report(year)
+        cache.set(key, report, REPORT_CACHE_TIMEOUT)
+    return report
+
+
+# 打卡或員工資料變更時清除所有年度的快取
+def invalidate_attendance_reports():
+    cache.set(REPORT_VERSION_KEY, time.time_ns(), None)
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Staff
+
+# 請求使用者需要的欄位 (與 MyTokenObtainPairSerializer 放入 token 的 claims 相同，另加上帳號狀態)
+USER_STATE_FIELDS = ('username', 'admin', 'name', 'is_office_staff', 'is_vip_client',
+                     'is_active', 'is_delete', 'is_delete_client')
+
+
+# 使用者狀態的 LRU 快取 (每個行程各自一份)
+# 筆數超過 max_size 時移除最久沒用到的，超過 ttl 秒重新讀取，讓其他行程的變更也會生效
+class UserStateCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, state):
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + self.ttl, state)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_states = UserStateCache(settings.JWT_USER_STATE_CACHE_SIZE, settings.JWT_USER_STATE_TTL)
+
+
+# 取得使用者狀態，快取中沒有時讀取資料庫，使用者不存在時回傳 None
+def get_user_state(user_id):
+    state = user_states.get(user_id)
+    if state is None:
+        state = Staff.objects.filter(pk=user_id).values(*USER_STATE_FIELDS).first()
+        if state is not None:
+            user_states.set(user_id, state)
+    return state
+
+
+# 使用者資料變更時清除快取 (simple_jwt/signals.py)
+def invalidate_user_state(user_id):
+    user_states.delete(user_id)
+
+
+# 由 token 與快取的使用者狀態建立的請求使用者，不是 Staff 實體 (需要時以 id 查詢)
+class ClaimsUser(TokenUser):
+    def __init__(self, token, state):
+        super().__init__(token)
+        self.state = state
+
+    @property
+    def username(self):
+        return self.state['username']
+
+    def __getattr__(self, attr):
+        # 目前的帳號狀態優先於 token 內容 (token 內容在重新登入前不會更新)
+        if attr != 'state' and attr in self.state:
+            return self.state[attr]
+        return super().__getattr__(attr)
+
+
+# 不需每次請求都讀取 Staff 的 JWT 驗證 (JWT_AUTH_MODE = 'claims')
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        state = get_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not state['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return ClaimsUser(validated_token, state)
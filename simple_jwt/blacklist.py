@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+logger = logging.getLogger(__name__)
+
+
+# 記憶體中的 token 黑名單 (每個行程各自一份)
+# 第一次使用時從資料表載入尚未過期的黑名單，之後每隔 TOKEN_BLACKLIST_SYNC_INTERVAL 秒只讀取新增的資料列，
+# 檢查 token 時不需查詢越來越大的黑名單資料表
+class TokenBlacklist:
+    def __init__(self, sync_interval):
+        self.sync_interval = sync_interval
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.jtis = {}          # {jti: 過期時間 timestamp}
+            self.last_id = None     # 已載入的最大 BlacklistedToken.id
+            self.synced_at = 0
+
+    def contains(self, jti):
+        self.sync()
+        return jti in self.jtis
+
+    def add(self, jti, expires_at):
+        with self.lock:
+            self.jtis[jti] = expires_at
+
+    def sync(self, force=False):
+        with self.lock:
+            if not force and time.monotonic() - self.synced_at < self.sync_interval:
+                return
+
+            now = time.time()
+            rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            if self.last_id is not None:
+                rows = rows.filter(id__gt=self.last_id)
+            for row_id, jti, expires_at in rows.order_by('id').values_list('id', 'token__jti', 'token__expires_at'):
+                self.jtis[jti] = expires_at.timestamp()
+                self.last_id = row_id
+            if self.last_id is None:
+                self.last_id = 0
+
+            # 移除已過期的 token (過期的 token 本來就無法通過驗證)
+            self.jtis = {jti: expires_at for jti, expires_at in self.jtis.items() if expires_at > now}
+            self.synced_at = time.monotonic()
+
+
+token_blacklist = TokenBlacklist(settings.TOKEN_BLACKLIST_SYNC_INTERVAL)
+
+
+# 使用記憶體黑名單的 refresh token
+class CachedBlacklistRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        if token_blacklist.contains(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    # 回傳 (BlacklistedToken, 是否為這次加入黑名單)
+    def blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        exp = self.payload['exp']
+
+        token, created = OutstandingToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                'token': str(self),
+                'expires_at': datetime_from_epoch(exp),
+            },
+        )
+        blacklisted = BlacklistedToken.objects.get_or_create(token=token)
+        token_blacklist.add(jti, exp)
+        return blacklisted
+
+
+# token/refresh/ 使用的序列化
+# 輪替時以資料表的唯一限制確認 refresh token 只被使用一次 (其他行程的記憶體黑名單尚未同步時也不會重複使用)
+class BlacklistTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedBlacklistRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                blacklisted, created = refresh.blacklist()
+                if not created:
+                    raise InvalidToken(_('Token is blacklisted'))
+
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        schedule_purge()
+        return data
+
+
+# 刪除已過期的 token (分批刪除)，回傳刪除筆數、剩餘筆數與花費時間
+def purge_expired_tokens(batch_size=None):
+    batch_size = batch_size or settings.TOKEN_BLACKLIST_PURGE_BATCH_SIZE
+    started = time.monotonic()
+    expired = OutstandingToken.objects.filter(expires_at__lte=timezone.now())
+
+    outstanding_deleted = 0
+    blacklisted_deleted = 0
+    while True:
+        ids = list(expired.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        blacklisted_deleted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+        outstanding_deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+
+    return {
+        'outstanding_deleted': outstanding_deleted,
+        'blacklisted_deleted': blacklisted_deleted,
+        'outstanding_remaining': OutstandingToken.objects.count(),
+        'blacklisted_remaining': BlacklistedToken.objects.count(),
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+
+_purge_lock = threading.Lock()
+_purged_at = time.monotonic()
+
+
+def run_purge():
+    try:
+        stats = purge_expired_tokens()
+        logger.info('已刪除過期 token: %s', stats)
+    except Exception:
+        logger.exception('刪除過期 token 失敗')
+    finally:
+        close_old_connections()
+
+
+# 每隔 TOKEN_BLACKLIST_PURGE_INTERVAL 秒在背景刪除過期的 token (None 表示只使用 purge_tokens 指令)
+def schedule_purge():
+    global _purged_at
+
+    interval = settings.TOKEN_BLACKLIST_PURGE_INTERVAL
+    if interval is None:
+        return
+    with _purge_lock:
+        if time.monotonic() - _purged_at < interval:
+            return
+        _purged_at = time.monotonic()
+    threading.Thread(target=run_purge, name='token-purge', daemon=True).start()
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from simple_jwt.blacklist import purge_expired_tokens
+
+
+# 刪除過期的 token 與黑名單資料 (建議以排程每小時執行)
+# python manage.py purge_tokens --batch-size 5000
+class Command(BaseCommand):
+    help = '刪除過期的 OutstandingToken 與 BlacklistedToken，並顯示資料表筆數與花費時間'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='每次刪除的筆數')
+        parser.add_argument('--stats', action='store_true', help='只顯示資料表筆數，不刪除')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(f'OutstandingToken: {OutstandingToken.objects.count()} 筆')
+            self.stdout.write(f'BlacklistedToken: {BlacklistedToken.objects.count()} 筆')
+            return
+
+        stats = purge_expired_tokens(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"已刪除 {stats['outstanding_deleted']} 筆過期 token "
+            f"(黑名單 {stats['blacklisted_deleted']} 筆)，花費 {stats['seconds']} 秒"))
+        self.stdout.write(f"剩餘 OutstandingToken: {stats['outstanding_remaining']} 筆、"
+                          f"BlacklistedToken: {stats['blacklisted_remaining']} 筆")
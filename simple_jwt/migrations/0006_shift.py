@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+# 將上班、下班打卡紀錄依當地日期合併成每日出勤
+# 同一天有多筆時，上班取最早、下班取最晚
+def copy_clock_records(apps, schema_editor):
+    ClockInRecord = apps.get_model('simple_jwt', 'ClockInRecord')
+    ClockOutRecord = apps.get_model('simple_jwt', 'ClockOutRecord')
+    Shift = apps.get_model('simple_jwt', 'Shift')
+
+    shifts = {}
+    for staff_id, clock_in_time in ClockInRecord.objects.order_by('-clock_in_time').values_list(
+            'staff_id', 'clock_in_time').iterator():
+        key = (staff_id, timezone.localtime(clock_in_time).date())
+        shifts.setdefault(key, Shift(staff_id=staff_id, date=key[1])).clock_in_time = clock_in_time
+
+    for staff_id, clock_out_time in ClockOutRecord.objects.order_by('clock_out_time').values_list(
+            'staff_id', 'clock_out_time').iterator():
+        key = (staff_id, timezone.localtime(clock_out_time).date())
+        shifts.setdefault(key, Shift(staff_id=staff_id, date=key[1])).clock_out_time = clock_out_time
+
+    for shift in shifts.values():
+        if shift.clock_in_time and shift.clock_out_time and shift.clock_out_time > shift.clock_in_time:
+            shift.worked_minutes = int((shift.clock_out_time - shift.clock_in_time).total_seconds() // 60)
+
+    Shift.objects.bulk_create(shifts.values(), batch_size=1000)
+
+
+def restore_clock_records(apps, schema_editor):
+    ClockInRecord = apps.get_model('simple_jwt', 'ClockInRecord')
+    ClockOutRecord = apps.get_model('simple_jwt', 'ClockOutRecord')
+    Shift = apps.get_model('simple_jwt', 'Shift')
+
+    shifts = list(Shift.objects.values_list('staff_id', 'clock_in_time', 'clock_out_time'))
+    ClockInRecord.objects.bulk_create([
+        ClockInRecord(staff_id=staff_id, clock_in_time=clock_in_time)
+        for staff_id, clock_in_time, _ in shifts if clock_in_time
+    ], batch_size=1000)
+    ClockOutRecord.objects.bulk_create([
+        ClockOutRecord(staff_id=staff_id, clock_out_time=clock_out_time)
+        for staff_id, _, clock_out_time in shifts if clock_out_time
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_jwt', '0005_staff_is_delete_client'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Shift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('clock_in_time', models.DateTimeField(blank=True, null=True)),
+                ('clock_out_time', models.DateTimeField(blank=True, null=True)),
+                ('worked_minutes', models.PositiveIntegerField(blank=True, null=True)),
+                ('staff', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shifts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shift',
+            constraint=models.UniqueConstraint(fields=('staff', 'date'), name='unique_staff_shift'),
+        ),
+        migrations.RunPython(copy_clock_records, restore_clock_records),
+        migrations.DeleteModel(
+            name='ClockInRecord',
+        ),
+        migrations.DeleteModel(
+            name='ClockOutRecord',
+        ),
+    ]
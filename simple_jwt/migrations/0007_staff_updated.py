@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_jwt', '0006_shift'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_jwt', '0007_staff_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staff',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_jwt', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(condition=models.Q(('backend', False), ('is_office_staff', True)), fields=['id'], name='staff_office_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(condition=models.Q(('backend', False), ('is_delete', True)), fields=['id'], name='staff_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(condition=models.Q(('backend', False), ('is_delete_client', False)), fields=['id'], name='staff_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staff',
+            index=models.Index(condition=models.Q(('backend', False), ('is_delete_client', True)), fields=['id'], name='staff_blacklist_idx'),
+        ),
+    ]
@@ -13,32 +13,47 @@ class Staff(AbstractUser):
     is_vip_client = models.BooleanField(default=False)
     is_delete_client = models.BooleanField(default=False)
     image = models.ImageField(upload_to='avatar/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)    # 頭像縮圖 (背景產生)
+    updated = models.DateTimeField(auto_now=True)
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = []
 
+    class Meta(AbstractUser.Meta):
+        # 後台的員工、離職員工、會員、黑名單列表以固定的布林條件篩選前台帳號 (backend=False)，
+        # 布林條件 (WHERE NOT backend) 無法使用一般索引比對，所以依各列表的條件建立部分索引
+        indexes = [
+            models.Index(fields=['id'], name='staff_office_idx',
+                         condition=models.Q(backend=False, is_office_staff=True)),
+            models.Index(fields=['id'], name='staff_deleted_idx',
+                         condition=models.Q(backend=False, is_delete=True)),
+            models.Index(fields=['id'], name='staff_client_idx',
+                         condition=models.Q(backend=False, is_delete_client=False)),
+            models.Index(fields=['id'], name='staff_blacklist_idx',
+                         condition=models.Q(backend=False, is_delete_client=True)),
+        ]
+
+
+# 員工每日出勤 (一位員工每個當地日期一筆，上班取第一次打卡、下班取最後一次打卡)
+class Shift(models.Model):
+    staff = models.ForeignKey(Staff, related_name='shifts', on_delete=models.CASCADE)
+    date = models.DateField()
+    clock_in_time = models.DateTimeField(null=True, blank=True)
+    clock_out_time = models.DateTimeField(null=True, blank=True)
+    worked_minutes = models.PositiveIntegerField(null=True, blank=True)
 
-class ClockInRecord(models.Model):
-    staff = models.ForeignKey(Staff, on_delete=models.CASCADE)
-    clock_in_time = models.DateTimeField()
-    
     class Meta:
-        ordering = ['-clock_in_time']
-        
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['staff', 'date'], name='unique_staff_shift'),
+        ]
 
     def __str__(self):
-        clockInTime = self.clock_in_time.astimezone(timezone.get_current_timezone()).strftime('%Y-%m-%d %H:%M:%S')
-        return f"{self.staff.username} 上班時間 - {clockInTime}"
-
-
-class ClockOutRecord(models.Model):
-    staff = models.ForeignKey(Staff, on_delete=models.CASCADE)
-    clock_out_time = models.DateTimeField()
-
-    class Meta:
-        ordering = ['-clock_out_time']
-
-    def __str__(self):
-        clockOutTime = self.clock_out_time.astimezone(timezone.get_current_timezone()).strftime('%Y-%m-%d %H:%M:%S')
-        return f"{self.staff.username} 下班時間 - {clockOutTime}"
-
+        return f"{self.staff.username} {self.date}"
+
+    # 計算上班分鐘數 (上下班都有打卡時)
+    def update_worked_minutes(self):
+        if self.clock_in_time and self.clock_out_time and self.clock_out_time > self.clock_in_time:
+            self.worked_minutes = int((self.clock_out_time - self.clock_in_time).total_seconds() // 60)
+        else:
+            self.worked_minutes = None
@@ -1,21 +1,33 @@
 from rest_framework import serializers
-from .models import Staff, ClockInRecord, ClockOutRecord
+from .models import Staff, Shift
+from order.models import Order
 from order.serializers import OrderSerializer
+from server.images import ImageVariantsField
+from django.db.models import Prefetch
 from django.utils import timezone
 
 
 class ClockInSerializer(serializers.ModelSerializer):
     class Meta:
-        model = ClockInRecord
+        model = Shift
         fields = ('id', 'clock_in_time')
 
 
 class ClockOutSerializer(serializers.ModelSerializer):
     class Meta:
-        model = ClockOutRecord
+        model = Shift
         fields = ('id', 'clock_out_time')
 
 
+# 一次取得員工的上班、下班打卡紀錄 (新到舊)，放在 clock_in_shifts、clock_out_shifts
+CLOCK_RECORD_PREFETCHES = (
+    Prefetch('shifts', queryset=Shift.objects.filter(clock_in_time__isnull=False).order_by('-clock_in_time'),
+             to_attr='clock_in_shifts'),
+    Prefetch('shifts', queryset=Shift.objects.filter(clock_out_time__isnull=False).order_by('-clock_out_time'),
+             to_attr='clock_out_shifts'),
+)
+
+
 # 處理上下班打卡紀錄合併統計
 class MonthlyClockInOutSerializer(serializers.Serializer):
     staff = serializers.CharField()
@@ -49,20 +61,34 @@ class StaffSerializer(serializers.HyperlinkedModelSerializer):
 
     image = serializers.ImageField(
         max_length=None, allow_empty_file=False, allow_null=False, use_url=True, required=False)
+    image_variants = ImageVariantsField()
 
     orders = OrderSerializer(many=True, read_only=True)  # 引用訂單序列化，加到每個 staff裡
 
     class Meta:
         model = Staff
         fields = ('id', 'backend', 'name', 'username', 'email', 'password', 'admin', 'is_delete', 'is_office_staff',
-                  'is_vip_client', 'clock_in_records', 'clock_out_records', 'image', 'orders', 'is_delete_client')
+                  'is_vip_client', 'clock_in_records', 'clock_out_records', 'image', 'image_variants', 'orders',
+                  'is_delete_client')
+
+    # 一次取得訂單 (含商品項) 與打卡紀錄，避免每筆訂單各查詢一次
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(
+            Prefetch('orders', queryset=OrderSerializer.setup_eager_loading(Order.objects.all())),
+            *CLOCK_RECORD_PREFETCHES,
+        )
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
 
-        # 查詢員工上下班的打卡紀錄
-        clock_in_records = ClockInRecord.objects.filter(staff=instance)
-        clock_out_records = ClockOutRecord.objects.filter(staff=instance)
+        # 查詢員工上下班的打卡紀錄 (有 prefetch 時直接使用)
+        if hasattr(instance, 'clock_in_shifts'):
+            clock_in_records = instance.clock_in_shifts
+            clock_out_records = instance.clock_out_shifts
+        else:
+            clock_in_records = instance.shifts.filter(clock_in_time__isnull=False).order_by('-clock_in_time')
+            clock_out_records = instance.shifts.filter(clock_out_time__isnull=False).order_by('-clock_out_time')
 
         # 序列化上下班打卡時間
         clock_in_serializer = ClockInSerializer(
@@ -74,3 +100,55 @@ class StaffSerializer(serializers.HyperlinkedModelSerializer):
         data['clock_out_records'] = clock_out_serializer
 
         return data
+
+
+# 取得查詢參數中以逗號分隔的值，例如 ?expand=orders,clock_records
+def query_param_list(request, name):
+    if request is None:
+        return set()
+    return {value.strip() for value in request.query_params.get(name, '').split(',') if value.strip()}
+
+
+# 員工、會員列表使用的精簡序列化 (不含訂單與打卡紀錄)
+# ?fields=id,name 只回傳指定欄位；?expand=orders,clock_records 才附上訂單、打卡紀錄
+class StaffListSerializer(serializers.HyperlinkedModelSerializer):
+    EXPANDABLE = ('orders', 'clock_records')
+
+    image = serializers.ImageField(
+        max_length=None, allow_empty_file=False, allow_null=False, use_url=True, required=False)
+    image_variants = ImageVariantsField()
+
+    class Meta:
+        model = Staff
+        fields = ('id', 'backend', 'name', 'username', 'email', 'admin', 'is_delete', 'is_office_staff',
+                  'is_vip_client', 'image', 'image_variants', 'is_delete_client')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+        expand = query_param_list(request, 'expand')
+        if 'orders' in expand:
+            self.fields['orders'] = OrderSerializer(many=True, read_only=True)
+        if 'clock_records' in expand:
+            self.fields['clock_in_records'] = ClockInSerializer(
+                source='clock_in_shifts', many=True, read_only=True)
+            self.fields['clock_out_records'] = ClockOutSerializer(
+                source='clock_out_shifts', many=True, read_only=True)
+
+        fields = query_param_list(request, 'fields')
+        if fields:
+            expanded = {'orders', 'clock_in_records', 'clock_out_records'}
+            for name in set(self.fields) - fields - expanded:
+                self.fields.pop(name)
+
+    # 依 expand 參數一次取得訂單、打卡紀錄
+    @staticmethod
+    def setup_eager_loading(queryset, request):
+        expand = query_param_list(request, 'expand')
+        if 'orders' in expand:
+            queryset = queryset.prefetch_related(
+                Prefetch('orders', queryset=OrderSerializer.setup_eager_loading(Order.objects.all())))
+        if 'clock_records' in expand:
+            queryset = queryset.prefetch_related(*CLOCK_RECORD_PREFETCHES)
+        return queryset
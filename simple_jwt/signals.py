@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from server.images import delete_variants, schedule_variants
+from .authentication import invalidate_user_state
+from .models import Staff
+
+
+# 頭像變更時重新產生縮圖
+@receiver(post_save, sender=Staff)
+def update_avatar_variants(sender, instance, **kwargs):
+    schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Staff)
+def delete_avatar_variants(sender, instance, **kwargs):
+    delete_variants(instance)
+
+
+# 員工、會員資料變更 (例如 StaffViewSet.update、DeleteStaff、DeleteClientToBlack) 時清除 JWT 使用者狀態快取
+@receiver(post_save, sender=Staff)
+@receiver(post_delete, sender=Staff)
+def invalidate_jwt_user_state(sender, instance, **kwargs):
+    invalidate_user_state(instance.pk)
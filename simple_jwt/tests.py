@@ -1,4 +1,456 @@
-# from django.test import TestCase
-# from django.apps import apps
-# apps.clear_cache()
-# Create your tests here.
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+import time
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from order.models import Order, OrderItem
+from product.models import Product
+from .models import Staff, Shift
+from .attendance import clock_in, clock_out, report_version
+from .blacklist import token_blacklist
+from .authentication import UserStateCache, get_user_state, user_states
+
+
+def local_time(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class YearlyClockRecordsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def create_staff(self, username):
+        return Staff.objects.create_user(username=username, password='pass', email=f'{username}@example.com',
+                                         name=username, is_office_staff=True)
+
+    def get_report(self, year=2023):
+        return self.client.get('/api/v1/staff_clock_in_out_records/', {'year': year})
+
+    def test_report_version_does_not_expire(self):
+        version = report_version()
+
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 24 * 60 * 60):
+            self.assertEqual(report_version(), version)
+
+    def test_report_buckets_by_local_day(self):
+        staff = self.create_staff('staff')
+        # 台北時間 1/2 早上 7 點 (UTC 1/1 23:00) 要算在 1/2
+        clock_in(staff.id, local_time(2023, 1, 2, 7, 0))
+        clock_out(staff.id, local_time(2023, 1, 2, 17, 0))
+        clock_out(staff.id, local_time(2023, 1, 2, 18, 30))
+
+        report = self.get_report().data
+
+        self.assertEqual(len(report), 1)
+        months = report[0]['monthly_records']
+        self.assertEqual([len(month['clock_records']) for month in months],
+                         [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+        self.assertEqual(months[0]['clock_records'][1], {
+            'clock_in_time': '2023-01-02T07:00:00+08:00',
+            'clock_out_time': '2023-01-02T18:30:00+08:00',
+        })
+        self.assertEqual(months[0]['clock_records'][0], {'clock_in_time': None, 'clock_out_time': None})
+
+    def test_query_count_does_not_grow_with_staff(self):
+        self.create_staff('staff0')
+        with CaptureQueriesContext(connection) as one_staff:
+            self.get_report()
+
+        cache.clear()
+        for i in range(1, 10):
+            self.create_staff(f'staff{i}')
+        with CaptureQueriesContext(connection) as ten_staff:
+            self.get_report()
+
+        self.assertEqual(len(one_staff), len(ten_staff))
+
+    def test_punch_invalidates_cached_report(self):
+        staff = self.create_staff('staff')
+        self.client.force_authenticate(staff)
+        year = timezone.localdate().year
+        self.get_report(year)
+
+        with CaptureQueriesContext(connection) as queries:
+            etag = self.get_report(year)['ETag']
+        self.assertEqual(len(queries), 0)
+        not_modified = self.client.get('/api/v1/staff_clock_in_out_records/', {'year': year},
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+        self.client.post(f'/api/v1/clock-in/{staff.id}/')
+        response = self.get_report(year)
+        self.assertNotEqual(response['ETag'], etag)
+        months = response.data[0]['monthly_records']
+        clock_ins = [day['clock_in_time'] for month in months for day in month['clock_records'] if day['clock_in_time']]
+        self.assertEqual(len(clock_ins), 1)
+
+    def test_year_out_of_range(self):
+        for year in (0, 9999, 'abc'):
+            self.assertEqual(self.get_report(year).status_code, 400)
+
+
+class ShiftPunchTests(TestCase):
+    def setUp(self):
+        self.staff = Staff.objects.create_user(username='staff', password='pass', email='staff@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_one_shift_per_local_day(self):
+        self.assertTrue(clock_in(self.staff.id, local_time(2023, 1, 2, 7, 0)))
+        self.assertFalse(clock_in(self.staff.id, local_time(2023, 1, 2, 9, 0)))
+        self.assertTrue(clock_out(self.staff.id, local_time(2023, 1, 2, 17, 0)))
+        self.assertTrue(clock_out(self.staff.id, local_time(2023, 1, 2, 18, 30)))
+
+        shift = Shift.objects.get()
+        self.assertEqual(shift.date.isoformat(), '2023-01-02')
+        self.assertEqual(shift.clock_in_time, local_time(2023, 1, 2, 7, 0))
+        self.assertEqual(shift.clock_out_time, local_time(2023, 1, 2, 18, 30))
+        self.assertEqual(shift.worked_minutes, 11 * 60 + 30)
+
+    def test_clock_out_requires_clock_in(self):
+        self.assertFalse(clock_out(self.staff.id, local_time(2023, 1, 2, 17, 0)))
+        self.assertFalse(Shift.objects.exists())
+
+        # 前一天有上班卡，今天只打下班卡仍會記錄
+        clock_in(self.staff.id, local_time(2023, 1, 1, 8, 0))
+        self.assertTrue(clock_out(self.staff.id, local_time(2023, 1, 2, 17, 0)))
+        self.assertIsNone(Shift.objects.get(date='2023-01-02').worked_minutes)
+
+    def test_clock_in_fills_shift_started_by_clock_out(self):
+        clock_in(self.staff.id, local_time(2023, 1, 1, 8, 0))
+        clock_out(self.staff.id, local_time(2023, 1, 2, 17, 0))
+
+        self.assertTrue(clock_in(self.staff.id, local_time(2023, 1, 2, 8, 30)))
+        self.assertFalse(clock_in(self.staff.id, local_time(2023, 1, 2, 9, 0)))
+
+        shift = Shift.objects.get(date='2023-01-02')
+        self.assertEqual(shift.clock_in_time, local_time(2023, 1, 2, 8, 30))
+        self.assertEqual(shift.worked_minutes, 8 * 60 + 30)
+
+    def test_punch_endpoints(self):
+        response = self.client.put(f'/api/v1/clock-out/{self.staff.id}/')
+        self.assertEqual(response.data['message'], '新卡，請先打上班卡')
+
+        response = self.client.post(f'/api/v1/clock-in/{self.staff.id}/')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(f'/api/v1/clock-in/{self.staff.id}/')
+        self.assertEqual(response.data['message'], '已打過上班卡')
+        response = self.client.put(f'/api/v1/clock-out/{self.staff.id}/')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(Shift.objects.count(), 1)
+        self.assertEqual(self.client.post('/api/v1/clock-in/0/').status_code, 404)
+
+
+# 不支援 INSERT ... ON CONFLICT 的資料庫使用 ORM 寫法，規則相同
+class ShiftPunchORMTests(ShiftPunchTests):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('simple_jwt.attendance.supports_sqlite_upsert', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class SyncClockRecordsTests(TestCase):
+    def setUp(self):
+        self.staff = [
+            Staff.objects.create_user(username=f'staff{i}', password='pass', email=f'staff{i}@example.com')
+            for i in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff[0])
+
+    def sync(self, punches):
+        return self.client.post('/api/v1/clock_records_sync/', {'punches': punches}, format='json')
+
+    def test_first_in_last_out(self):
+        first, second = self.staff
+        response = self.sync([
+            {'staff_id': first.id, 'type': 'out', 'time': '2023-01-02T18:00:00+08:00'},
+            {'staff_id': first.id, 'type': 'in', 'time': '2023-01-02T09:00:00+08:00'},
+            {'staff_id': first.id, 'type': 'in', 'time': '2023-01-02T08:00:00+08:00'},
+            {'staff_id': first.id, 'type': 'out', 'time': '2023-01-02T17:00:00+08:00'},
+            {'staff_id': first.id, 'type': 'out', 'time': '2023-01-02T18:00:00+08:00'},
+            {'staff_id': second.id, 'type': 'out', 'time': '2023-01-02T18:00:00'},
+            {'staff_id': 0, 'type': 'in', 'time': '2023-01-02T08:00:00+08:00'},
+            {'staff_id': first.id, 'type': 'lunch', 'time': '2023-01-02T12:00:00+08:00'},
+        ])
+
+        self.assertEqual([result['result'] for result in response.data['results']], [
+            'clock_out', 'already_clocked_in', 'clock_in', 'clock_out', 'duplicate',
+            'no_clock_in', 'unknown_staff', 'invalid',
+        ])
+        shift = Shift.objects.get()
+        self.assertEqual(shift.clock_in_time, local_time(2023, 1, 2, 8, 0))
+        self.assertEqual(shift.clock_out_time, local_time(2023, 1, 2, 18, 0))
+        self.assertEqual(shift.worked_minutes, 600)
+
+    def test_merges_with_existing_shifts(self):
+        staff = self.staff[0]
+        clock_in(staff.id, local_time(2023, 1, 2, 8, 30))
+        clock_out(staff.id, local_time(2023, 1, 2, 18, 0))
+
+        response = self.sync([
+            {'staff_id': staff.id, 'type': 'in', 'time': '2023-01-02T08:00:00+08:00'},
+            {'staff_id': staff.id, 'type': 'out', 'time': '2023-01-02T17:00:00+08:00'},
+            {'staff_id': staff.id, 'type': 'out', 'time': '2023-01-03T17:00:00+08:00'},
+        ])
+
+        self.assertEqual([result['result'] for result in response.data['results']],
+                         ['clock_in', 'superseded', 'clock_out'])
+        self.assertEqual(Shift.objects.get(date='2023-01-02').clock_in_time, local_time(2023, 1, 2, 8, 0))
+        self.assertEqual(Shift.objects.count(), 2)
+
+    def test_query_count_does_not_grow_with_punches(self):
+        def punches(days):
+            return [
+                {'staff_id': staff.id, 'type': kind, 'time': f'2023-03-{day:02d}T{hour}:00:00+08:00'}
+                for staff in self.staff for day in range(1, days + 1) for kind, hour in (('in', '08'), ('out', '17'))
+            ]
+
+        self.sync(punches(1))
+        with CaptureQueriesContext(connection) as few:
+            self.sync(punches(2))
+        with CaptureQueriesContext(connection) as many:
+            self.sync(punches(20))
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Shift.objects.count(), 40)
+
+    def test_rejects_future_and_oversized_batches(self):
+        response = self.sync([{'staff_id': self.staff[0].id, 'type': 'in', 'time': '2999-01-01T08:00:00+08:00'}])
+        self.assertEqual(response.data['results'][0]['result'], 'future')
+
+        self.assertEqual(self.sync([]).status_code, 400)
+        self.assertEqual(self.sync([{}] * 1001).status_code, 400)
+
+
+class MonthClockRecordsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = [
+            Staff.objects.create_user(username=f'staff{i}', password='pass', email=f'staff{i}@example.com',
+                                      is_office_staff=True)
+            for i in range(3)
+        ]
+        for staff in self.staff:
+            clock_in(staff.id, local_time(2022, 12, 31, 8, 0))
+            clock_in(staff.id, local_time(2023, 2, 1, 8, 0))
+
+    def test_one_staff_month_uses_requested_year(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/v1/staff_one_month_clock_records/{self.staff[0].id}/',
+                                        {'data': 12, 'year': 2022}, format='json')
+
+        records = response.data['monthly_records']
+        self.assertEqual(len(records), 31)
+        self.assertEqual(records[30]['clock_in_time'], '2022-12-31T08:00:00+08:00')
+        self.assertEqual(len(queries), 2)
+
+    def test_several_staff_and_months_in_one_call(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/staff_month_clock_records/', {
+                'staff_ids': [self.staff[0].id, self.staff[1].id],
+                'periods': [{'year': 2022, 'month': 12}, {'year': 2023, 'month': 2}],
+            }, format='json')
+
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(queries), 2)
+        february = [report for report in response.data if report['month'] == 2]
+        self.assertTrue(all(report['monthly_records'][0]['clock_in_time'] for report in february))
+
+    def test_invalid_month(self):
+        response = self.client.post(f'/api/v1/staff_one_month_clock_records/{self.staff[0].id}/',
+                                    {'data': 13}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_period_year_out_of_range(self):
+        response = self.client.post('/api/v1/staff_month_clock_records/', {
+            'periods': [{'year': 9999, 'month': 12}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_staff_ids(self):
+        for staff_ids in (5, '1,2', [1, 'a'], [True]):
+            response = self.client.post('/api/v1/staff_month_clock_records/', {
+                'staff_ids': staff_ids,
+                'periods': [{'year': 2023, 'month': 2}],
+            }, format='json')
+
+            self.assertEqual(response.status_code, 400)
+
+
+class StaffListSerializationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.product = Product.objects.create(category='粽子', name='鮮肉粽', price=100)
+
+    def seed_clients(self, count):
+        start = Staff.objects.count()
+        for i in range(start, start + count):
+            client = Staff.objects.create_user(username=f'client{i}', password='pass', email=f'client{i}@example.com')
+            order = Order.objects.create(user=client, client_name='王小明', address='台北市',
+                                         phone='0912345678', paid_amount=100)
+            OrderItem.objects.create(order=order, product=self.product, price=100, quantity=1)
+            clock_in(client.id, local_time(2023, 1, 2, 8, 0))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_list_is_compact_by_default(self):
+        self.seed_clients(1)
+
+        response, _ = self.count_queries('/api/v1/back_client_set/')
+
+        self.assertNotIn('orders', response.data[0])
+        self.assertNotIn('password', response.data[0])
+
+    def test_sparse_fieldset(self):
+        self.seed_clients(1)
+
+        response, _ = self.count_queries('/api/v1/back_client_set/?fields=id,username')
+
+        self.assertEqual(set(response.data[0]), {'id', 'username'})
+
+    def test_expand_query_count_does_not_grow(self):
+        url = '/api/v1/back_client_set/?expand=orders,clock_records'
+        self.seed_clients(1)
+        response, few = self.count_queries(url)
+        self.seed_clients(5)
+        _, many = self.count_queries(url)
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.data[0]['orders'][0]['items']), 1)
+        self.assertEqual(len(response.data[0]['clock_in_records']), 1)
+
+
+class ClientProfileConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.url = f'/api/v1/client_profile/{self.user.id}/'
+
+    def assert_changed(self, change):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_profile_changes_update_etag(self):
+        def update_profile():
+            self.user.name = '王小明'
+            self.user.save()
+
+        self.assert_changed(update_profile)
+        self.assert_changed(lambda: Order.objects.create(user=self.user, client_name='王小明', address='台北市',
+                                                         phone='0912345678', paid_amount=100))
+        self.assert_changed(lambda: clock_in(self.user.id, local_time(2023, 1, 2, 8, 0)))
+        self.assert_changed(lambda: clock_out(self.user.id, local_time(2023, 1, 2, 17, 0)))
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        user_states.clear()
+        self.user = Staff.objects.create_user(username='client', password='pass', email='client@example.com',
+                                              name='王小明')
+        self.client = APIClient()
+        access = self.client.post('/api/v1/token/', {'username': 'client', 'password': 'pass'}).data['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.url = f'/api/v1/user_orders/{self.user.id}/'
+
+    def staff_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [query for query in queries if 'simple_jwt_staff' in query['sql']]
+
+    def test_user_state_is_cached(self):
+        self.assertEqual(len(self.staff_queries()), 1)
+        self.assertEqual(self.staff_queries(), [])
+
+    def test_user_changes_invalidate_state(self):
+        self.staff_queries()
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_request_user_from_claims(self):
+        product = Product.objects.create(category='粽子', name='鮮肉粽', price=100)
+        response = self.client.post('/api/v1/front_order/', {
+            'client_name': '王小明', 'email': 'client@example.com', 'address': '台北市', 'phone': '0912345678',
+            'paid_amount': 100, 'items': [{'id': product.id, 'price': 100, 'quantity': 1}],
+        }, format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().user_id, self.user.id)
+
+        state = get_user_state(self.user.id)
+        self.assertEqual(state['name'], '王小明')
+
+    def test_cache_is_bounded(self):
+        cache = UserStateCache(max_size=2, ttl=60)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+
+        self.assertEqual(cache.get(1), 'a')
+        self.assertIsNone(cache.get(2))
+
+
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        token_blacklist.reset()
+        Staff.objects.create_user(username='client', password='pass', email='client@example.com')
+        self.client = APIClient()
+        self.refresh = self.client.post('/api/v1/token/', {'username': 'client', 'password': 'pass'}).data['refresh']
+
+    def refresh_token(self, refresh):
+        return self.client.post('/api/v1/token/refresh/', {'refresh': refresh})
+
+    def test_rotated_token_cannot_be_reused(self):
+        response = self.refresh_token(self.refresh)
+        self.assertEqual(response.status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            reused = self.refresh_token(self.refresh)
+        self.assertEqual(reused.status_code, 401)
+        self.assertFalse(any('token_blacklist_blacklistedtoken' in query['sql'] for query in queries))
+
+        self.assertEqual(self.refresh_token(response.data['refresh']).status_code, 200)
+
+    def test_other_process_blacklist_is_enforced(self):
+        self.refresh_token(self.refresh)
+        # 模擬其他行程 (記憶體黑名單尚未同步)
+        token_blacklist.reset()
+        token_blacklist.synced_at = time.monotonic() + 60
+
+        self.assertEqual(self.refresh_token(self.refresh).status_code, 401)
+
+    def test_purge_expired_tokens(self):
+        self.refresh_token(self.refresh)
+        OutstandingToken.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.refresh = self.client.post('/api/v1/token/', {'username': 'client', 'password': 'pass'}).data['refresh']
+
+        out = StringIO()
+        call_command('purge_tokens', '--batch-size', '1', stdout=out)
+
+        self.assertIn('已刪除 1 筆過期 token (黑名單 1 筆)', out.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+        self.assertFalse(BlacklistedToken.objects.exists())
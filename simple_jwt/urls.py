@@ -25,10 +25,14 @@ urlpatterns = [
          name='clock_in'),                                                               # 上班打卡
     path('clock-out/<int:pk>/', views.ClockOutViewSet.as_view({'put': 'update'}),
          name='clock_out'),                                                              # 下班打卡
+    path('clock_records_sync/', views.SyncClockRecords.as_view(),
+         name='clock_records_sync'),                                                     # 批次同步離線打卡紀錄
     path('staff_clock_in_out_records/', views.ClockInAndOutRecords.as_view(),
          name='clock-in-out-records'),                                                   # 當年每月上下班打卡統計
     path('staff_one_month_clock_records/<int:pk>/', views.OneStaffMonthClockRecords.as_view(),
          name='staff_one_month_clock_records'),                                          # 取得一個員工特定月份打卡紀錄
+    path('staff_month_clock_records/', views.StaffMonthClockRecords.as_view(),
+         name='staff_month_clock_records'),                                              # 取得多位員工多個月份打卡紀錄
 
     path('staffs/search/', views.StaffList.as_view({'get': 'search'}),
          name='staff_search'),                                                           # 查詢員工
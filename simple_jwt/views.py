@@ -1,7 +1,10 @@
 from django.shortcuts import render
-from .models import Staff, ClockInRecord, ClockOutRecord
-from .serializers import StaffSerializer, ClockInSerializer, ClockOutSerializer, MonthlyClockInOutSerializer
-from datetime import datetime, timedelta
+from .models import Staff, Shift
+from .serializers import (StaffSerializer, StaffListSerializer, ClockInSerializer, ClockOutSerializer,
+                          MonthlyClockInOutSerializer)
+from .attendance import (yearly_report, build_monthly_reports, invalidate_attendance_reports,
+                         clock_in, clock_out, sync_punches, report_version)
+from datetime import timedelta
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -10,20 +13,27 @@ from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from order.models import Order
+from server.conditional import conditional, watermarks
+from server.images import delete_image
+from server.analytics import analytics_reads, analytics_version
 
 # 統計每個月員工的上下班打卡記錄
 from rest_framework import generics
 from django.utils import timezone
-from calendar import monthrange
+from django.utils.dateparse import parse_datetime
 from rest_framework.generics import CreateAPIView
 
 
 # Simple JWT
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
+from .blacklist import CachedBlacklistRefreshToken
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = CachedBlacklistRefreshToken
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
@@ -41,9 +51,28 @@ class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
 
+# 列表使用精簡序列化 StaffListSerializer，需要時以 ?expand= 附上訂單、打卡紀錄
+# 單筆資料使用 StaffSerializer，一次取得訂單與打卡紀錄
+class StaffListMixin:
+    list_actions = ('list', 'search')
+
+    def get_serializer_class(self):
+        if self.action in self.list_actions:
+            return StaffListSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.list_actions:
+            queryset = StaffListSerializer.setup_eager_loading(queryset, self.request)
+        elif self.action == 'retrieve':
+            queryset = StaffSerializer.setup_eager_loading(queryset)
+        return queryset
+
+
 # ======================  員工管理 API   ====================== #
 # 取得全部員工資料
-class StaffList(viewsets.ModelViewSet):
+class StaffList(StaffListMixin, viewsets.ModelViewSet):
     queryset = Staff.objects.filter(backend=False).filter(
         is_delete=False).filter(is_office_staff=True)
     serializer_class = StaffSerializer
@@ -54,8 +83,7 @@ class StaffList(viewsets.ModelViewSet):
         query_params = self.request.query_params
 
         search = query_params.get('search')
-        queryset = Staff.objects.filter(backend=False).filter(
-            is_delete=False).filter(is_office_staff=True)
+        queryset = self.get_queryset()
 
         email = queryset.filter(email__icontains=search)
         username = queryset.filter(username__icontains=search)
@@ -68,7 +96,7 @@ class StaffList(viewsets.ModelViewSet):
         elif name:
             queryset = name
 
-        serializer = StaffSerializer(queryset, many=True)
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -94,6 +122,7 @@ class StaffViewSet(viewsets.ModelViewSet):
         # 建立帳號
         user = get_user_model().objects.create_user(
             username=username, password=password1, name=name, email=email, is_office_staff=True)
+        invalidate_attendance_reports()
 
         return Response({"message": "註冊成功"}, status=status.HTTP_201_CREATED)
 
@@ -117,6 +146,7 @@ class StaffViewSet(viewsets.ModelViewSet):
         staff.email = request.data['email']
 
         staff.save()
+        invalidate_attendance_reports()
         return Response({"message": "帳號已更新"}, status=status.HTTP_200_OK)
 
 
@@ -134,11 +164,12 @@ class DeleteStaff(APIView):
         staff.is_office_staff = False
 
         staff.save()
+        invalidate_attendance_reports()
         return Response({"message": "已加入待刪除名單"}, status=status.HTTP_200_OK)
 
 
 # 處理加入待刪除的員工
-class StaffWaitSetViewSet(viewsets.ModelViewSet):
+class StaffWaitSetViewSet(StaffListMixin, viewsets.ModelViewSet):
     # 取得全部待刪除員工
     queryset = Staff.objects.filter(backend=False).filter(
         is_office_staff=False).filter(is_delete=True)
@@ -155,6 +186,7 @@ class StaffWaitSetViewSet(viewsets.ModelViewSet):
         staff.is_office_staff = True
 
         staff.save()
+        invalidate_attendance_reports()
         return Response({"message": "已將員工取回"}, status=status.HTTP_200_OK)
 
     def destroy(self, request, pk=None):
@@ -163,8 +195,7 @@ class StaffWaitSetViewSet(viewsets.ModelViewSet):
         except Staff.DoesNotExist:
             return Response({"message": "查無此員工"}, status=status.HTTP_404_NOT_FOUND)
 
-        if staff.image:
-            staff.image.delete()
+        delete_image(staff)
 
         staff.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -172,186 +203,213 @@ class StaffWaitSetViewSet(viewsets.ModelViewSet):
 
 # 員工上班打卡(一天只可紀錄一次)
 class ClockInViewSet(viewsets.ModelViewSet):
-    queryset = ClockInRecord.objects.all().order_by('-clock_in_time')
+    queryset = Shift.objects.filter(clock_in_time__isnull=False).order_by('-clock_in_time')
     serializer_class = ClockInSerializer
     permission_classes = [IsAuthenticated]
 
     def create(self, request, pk=None):
-        staff = Staff.objects.get(id=pk)
-
-        # 檢查是否有打卡記錄
-        today = datetime.now().date()
-        existing_clock_in = ClockInRecord.objects.filter(
-            staff=staff, clock_in_time__date=today).first()
+        if not Staff.objects.filter(id=pk).exists():
+            return Response({"message": "查無此員工"}, status=status.HTTP_404_NOT_FOUND)
 
-        if existing_clock_in:
+        if not clock_in(pk, timezone.now()):
             return Response({"message": "已打過上班卡"})
 
-        clock_in_time = datetime.now()
-        clockIn = ClockInRecord(staff=staff, clock_in_time=clock_in_time)
-        clockIn.save()
-
+        invalidate_attendance_reports()
         return Response({"message": "上班打卡成功"}, status=status.HTTP_201_CREATED)
 
 
 # 員工下班打卡(重複更新紀錄)
 class ClockOutViewSet(viewsets.ModelViewSet):
-    queryset = ClockOutRecord.objects.all().order_by('-clock_out_time')
+    queryset = Shift.objects.filter(clock_out_time__isnull=False).order_by('-clock_out_time')
     serializer_class = ClockOutSerializer
     permission_classes = [IsAuthenticated]
 
     def update(self, request, pk=None):
-        staff = Staff.objects.get(id=pk)
+        if not Staff.objects.filter(id=pk).exists():
+            return Response({"message": "查無此員工"}, status=status.HTTP_404_NOT_FOUND)
 
-        clockIn = ClockInRecord.objects.filter(staff=staff).last()
-        if not clockIn:
+        if not clock_out(pk, timezone.now()):
             return Response({"message": "新卡，請先打上班卡"})
 
-        # 取得最後一次下班卡紀錄
-        last_clockOutRecord = ClockOutRecord.objects.filter(
-            staff=staff).first()
-
-        # 目前時間(字串格式)
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        # 最後要儲存的格式
-        current_datetime = datetime.strptime(current_time, '%Y-%m-%d %H:%M:%S')
-
-        # 與最後一次打卡時間做比較用 (將字串格式目前時間，轉回時間格式)
-        current_strTime = datetime.now().strftime('%Y-%m-%d')
-        current_date_time = datetime.strptime(current_strTime, '%Y-%m-%d')
-
-        if last_clockOutRecord:
-            # 轉換成字串
-            new_time = last_clockOutRecord.clock_out_time + timedelta(hours=8)
-            last_clockOutRecord_strTime = new_time.strftime('%Y-%m-%d')
-            # 轉回時間格式取年月日判斷
-            last_clockOutRecord_datetime = datetime.strptime(
-                last_clockOutRecord_strTime, '%Y-%m-%d')
-
-            if current_date_time != last_clockOutRecord_datetime:
-                # 建立新下班打卡紀錄
-                new_clockOutRecord = ClockOutRecord(
-                    staff=staff, clock_out_time=current_datetime)
-                new_clockOutRecord.save()
-                return Response({"message": "下班打卡成功"}, status=status.HTTP_200_OK)
-            else:
-                # 覆蓋下班打卡記錄
-                last_clockOutRecord.clock_out_time = current_datetime
-                last_clockOutRecord.save()
-                return Response({"message": "下班打卡成功"}, status=status.HTTP_200_OK)
-        else:
-            # 如果是新的下班卡就沒有前一次最後一次紀錄
-            new_clockOutRecord = ClockOutRecord(
-                staff=staff, clock_out_time=current_datetime)
-            new_clockOutRecord.save()
-            return Response({"message": "下班打卡成功"}, status=status.HTTP_200_OK)
+        invalidate_attendance_reports()
+        return Response({"message": "下班打卡成功"}, status=status.HTTP_200_OK)
 
 
-# 更改格式合併每月每日的員工上下班打卡紀錄
-class ClockInAndOutRecords(generics.ListAPIView):
-    queryset = []
+# 批次同步離線打卡機的打卡紀錄 (整批在同一個交易中寫入)
+# {"punches": [{"staff_id": 1, "type": "in" | "out", "time": "2023-05-01T08:00:00+08:00"}, ...]}
+class SyncClockRecords(APIView):
+    permission_classes = [IsAuthenticated]
 
-    def list(self, request):
-        staff = Staff.objects.filter(
-            backend=False, is_delete=False, is_office_staff=True)
-        monthly_records = []
-
-        for employee in staff:
-            employee_records = {
-                "staff": employee.username,
-                "staff_id": employee.id,
-                "staff_name": employee.name,
-                "monthly_records": [],
-            }
-
-            for month in range(1, 13):
-                records = {
-                    "clock_records": [],
+    MAX_PUNCHES = 1000
+    # 容許打卡機時間比伺服器快的秒數
+    MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+    MESSAGES = {
+        'clock_in': '上班打卡成功',
+        'clock_out': '下班打卡成功',
+        'duplicate': '重複的打卡紀錄',
+        'already_clocked_in': '已打過上班卡',
+        'no_clock_in': '新卡，請先打上班卡',
+        'superseded': '已有較晚的下班卡',
+        'unknown_staff': '查無此員工',
+        'invalid': '打卡資料格式錯誤',
+        'future': '打卡時間不可晚於現在',
+    }
+
+    def post(self, request):
+        punches = request.data.get('punches')
+        if not isinstance(punches, list) or not punches:
+            return Response({'message': '請提供打卡紀錄'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(punches) > self.MAX_PUNCHES:
+            return Response({'message': f'一次最多同步 {self.MAX_PUNCHES} 筆打卡紀錄'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        parsed = [self.parse_punch(punch) for punch in punches]
+        staff_ids = set(Staff.objects.filter(
+            id__in={punch[0] for punch in parsed if not isinstance(punch, str)}).values_list('id', flat=True))
+
+        results = []
+        valid = []
+        for punch in parsed:
+            if isinstance(punch, str):
+                results.append(punch)
+            elif punch[0] not in staff_ids:
+                results.append('unknown_staff')
+            else:
+                results.append(None)
+                valid.append(punch)
+
+        synced = iter(sync_punches(valid) if valid else [])
+        results = [result or next(synced) for result in results]
+
+        accepted = sum(result in ('clock_in', 'clock_out') for result in results)
+        if accepted:
+            invalidate_attendance_reports()
+
+        return Response({
+            'accepted': accepted,
+            'results': [
+                {
+                    'index': index,
+                    'result': result,
+                    'ok': result in ('clock_in', 'clock_out'),
+                    'message': self.MESSAGES[result],
                 }
+                for index, result in enumerate(results)
+            ],
+        }, status=status.HTTP_200_OK)
+
+    # 回傳 (staff_id, 'in' | 'out', 時間)，格式錯誤時回傳錯誤代碼
+    def parse_punch(self, punch):
+        if not isinstance(punch, dict) or punch.get('type') not in ('in', 'out'):
+            return 'invalid'
+        try:
+            staff_id = int(punch.get('staff_id'))
+            when = parse_datetime(str(punch.get('time')))
+        except (TypeError, ValueError):
+            return 'invalid'
+        if when is None:
+            return 'invalid'
 
-                year = datetime.now().year             # 取得當前的年份
-                num_days = monthrange(year, month)[1]  # 取得每個月的天數
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        if when > timezone.now() + self.MAX_CLOCK_SKEW:
+            return 'future'
+        return staff_id, punch['type'], when
 
-                clock_in_records = ClockInRecord.objects.filter(
-                    staff=employee, clock_in_time__year=year, clock_in_time__month=month)
-                clock_out_records = ClockOutRecord.objects.filter(
-                    staff=employee, clock_out_time__year=year, clock_out_time__month=month)
 
-                for day in range(1, num_days + 1):
-                    clock_in_data = clock_in_records.filter(
-                        clock_in_time__day=day)
-                    clock_out_data = clock_out_records.filter(
-                        clock_out_time__day=day)
+# 報表會用到下一年的 1 月 1 日，年份最大為 9998
+MAX_REPORT_YEAR = 9998
 
-                    clock_in_time = clock_in_data[0].clock_in_time.astimezone(
-                        timezone.get_current_timezone()).isoformat() if clock_in_data else None
-                    clock_out_time = clock_out_data[0].clock_out_time.astimezone(
-                        timezone.get_current_timezone()).isoformat() if clock_out_data else None
 
-                    records["clock_records"].append({
-                        "clock_in_time": clock_in_time,
-                        "clock_out_time": clock_out_time,
-                    })
+# 更改格式合併每月每日的員工上下班打卡紀錄 (?year= 預設為今年)
+class ClockInAndOutRecords(generics.ListAPIView):
+    queryset = []
 
-                employee_records["monthly_records"].append(records)
+    # 使用快取的統計版本做為驗證值 (不需查詢資料庫)
+    @analytics_reads()
+    @conditional(lambda request: f'{report_version()}|{analytics_version()}|{timezone.localdate().year}')
+    def list(self, request):
+        try:
+            year = int(request.query_params.get('year', timezone.localdate().year))
+        except ValueError:
+            return Response({'message': '年份格式錯誤'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= year <= MAX_REPORT_YEAR:
+            return Response({'message': '年份格式錯誤'}, status=status.HTTP_400_BAD_REQUEST)
 
-            monthly_records.append(employee_records)
+        return Response(yearly_report(year), status=status.HTTP_200_OK)
 
-        return Response(monthly_records, status=status.HTTP_200_OK)
 
+# 檢查查詢的年份、月份，格式錯誤回傳 None
+def parse_period(year, month):
+    try:
+        year, month = int(year), int(month)
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= month <= 12 or not 1 <= year <= MAX_REPORT_YEAR:
+        return None
+    return year, month
 
-# 取得一個員工特定月份的上下班打卡紀錄
+
+# 取得一個員工特定月份的上下班打卡紀錄 (data: 月份、year: 年份，預設為今年)
 class OneStaffMonthClockRecords(CreateAPIView):
     serializer_class = MonthlyClockInOutSerializer
 
+    @analytics_reads()
     def create(self, request, pk):
         month = request.data.get('data')
 
         if month is None:
             return Response({'message': '請選擇要查詢的月份'}, status=400)
 
-        staff = Staff.objects.filter(
-            backend=False, is_delete=False, is_office_staff=True, id=pk).first()
+        period = parse_period(request.data.get('year', timezone.localdate().year), month)
+        if period is None:
+            return Response({'message': '年份或月份格式錯誤'}, status=400)
+
+        staff = list(Staff.objects.filter(
+            backend=False, is_delete=False, is_office_staff=True, id=pk).values('id', 'username', 'name'))
 
         if not staff:
             return Response({'message': '查無此員工'}, status=404)
 
-        employee_records = {
-            "staff": staff.username,
-            "staff_id": staff.id,
-            "staff_name": staff.name,
-            "monthly_records": [],
-        }
-
-        year = timezone.now().year                  # 取得當前的年份
-        num_days = monthrange(year, month)[1]       # 取得指定月份的天數
+        employee_records = build_monthly_reports(staff, [period])[0]
+        return Response(employee_records, status=status.HTTP_200_OK)
 
-        clock_in_records = ClockInRecord.objects.filter(
-            staff=staff, clock_in_time__year=year, clock_in_time__month=month)
-        clock_out_records = ClockOutRecord.objects.filter(
-            staff=staff, clock_out_time__year=year, clock_out_time__month=month)
 
-        for day in range(1, num_days + 1):
-            clock_in_data = clock_in_records.filter(clock_in_time__day=day)
-            clock_out_data = clock_out_records.filter(clock_out_time__day=day)
+# 一次取得多位員工、多個月份的上下班打卡紀錄
+# {"staff_ids": [1, 2], "periods": [{"year": 2023, "month": 5}, ...]}，未指定 staff_ids 時為所有員工
+class StaffMonthClockRecords(APIView):
+    MAX_PERIODS = 24
 
-            clock_in_time = clock_in_data[0].clock_in_time.astimezone(
-                timezone.get_current_timezone()).isoformat() if clock_in_data else None
-            clock_out_time = clock_out_data[0].clock_out_time.astimezone(
-                timezone.get_current_timezone()).isoformat() if clock_out_data else None
+    @analytics_reads()
+    def post(self, request):
+        periods = []
+        for period in request.data.get('periods') or []:
+            period = parse_period(period.get('year'), period.get('month')) if isinstance(period, dict) else None
+            if period is None:
+                return Response({'message': '年份或月份格式錯誤'}, status=status.HTTP_400_BAD_REQUEST)
+            periods.append(period)
 
-            records = {
-                "clock_in_time": clock_in_time,
-                "clock_out_time": clock_out_time,
-            }
+        if not periods:
+            return Response({'message': '請選擇要查詢的月份'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(periods) > self.MAX_PERIODS:
+            return Response({'message': f'一次最多查詢 {self.MAX_PERIODS} 個月份'}, status=status.HTTP_400_BAD_REQUEST)
 
-            employee_records["monthly_records"].append(records)
+        staff = Staff.objects.filter(backend=False, is_delete=False, is_office_staff=True)
+        staff_ids = request.data.get('staff_ids')
+        if staff_ids is not None:
+            if not isinstance(staff_ids, list) or not all(
+                    isinstance(staff_id, int) and not isinstance(staff_id, bool) for staff_id in staff_ids):
+                return Response({'message': 'staff_ids 必須是員工編號的陣列'}, status=status.HTTP_400_BAD_REQUEST)
+        if staff_ids:
+            staff = staff.filter(id__in=staff_ids)
 
-        return Response(employee_records, status=status.HTTP_200_OK)
+        records = build_monthly_reports(list(staff.values('id', 'username', 'name')), periods)
+        return Response(records, status=status.HTTP_200_OK)
 
 
 # ======================  會員管理 API  ====================== #
-class backendClientViewSet(viewsets.ModelViewSet):
+class backendClientViewSet(StaffListMixin, viewsets.ModelViewSet):
     # 取得全部會員資料
     queryset = Staff.objects.filter(
         backend=False).filter(is_delete_client=False)
@@ -376,7 +434,7 @@ class DeleteClientToBlack(APIView):
 
 
 # 取得查詢的會員
-class SearchClientViewSet(viewsets.ModelViewSet):
+class SearchClientViewSet(StaffListMixin, viewsets.ModelViewSet):
     queryset = Staff.objects.all()
     serializer_class = StaffSerializer
 
@@ -387,7 +445,7 @@ class SearchClientViewSet(viewsets.ModelViewSet):
 
         search = query_params.get('search').strip('/')
 
-        queryset = Staff.objects.filter(backend=False)
+        queryset = self.get_queryset().filter(backend=False)
 
         username = queryset.filter(username__icontains=search)
         name = queryset.filter(name__icontains=search)
@@ -400,12 +458,12 @@ class SearchClientViewSet(viewsets.ModelViewSet):
         elif email:
             queryset = email
 
-        serializer = StaffSerializer(queryset, many=True)
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 # 處理加入黑名單的會員
-class ClientBlackViewSet(viewsets.ModelViewSet):
+class ClientBlackViewSet(StaffListMixin, viewsets.ModelViewSet):
     # 取得全部會員 is_delete_client= True 資料
     queryset = Staff.objects.filter(
         backend=False).filter(is_delete_client=True)
@@ -429,8 +487,7 @@ class ClientBlackViewSet(viewsets.ModelViewSet):
         except Staff.DoesNotExist:
             return Response({"message": "查無此會員"}, status=status.HTTP_404_NOT_FOUND)
 
-        if client.image:
-            client.image.delete()
+        delete_image(client)
 
         client.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -443,6 +500,12 @@ class ClientViewSet(viewsets.ModelViewSet):
     serializer_class = StaffSerializer
     permission_classes = [AllowAny]              # 權限配置 - 全線允許訪問
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = StaffSerializer.setup_eager_loading(queryset)
+        return queryset
+
     def create(self, request):
         username = request.data['username']
         password1 = request.data['password1']
@@ -463,14 +526,19 @@ class ClientViewSet(viewsets.ModelViewSet):
 
     # 取得一個會員資料
     @action(detail=True, methods=['GET'])
+    @conditional(lambda request, pk=None: watermarks(
+        (Staff.objects.filter(id=pk), 'updated'),
+        (Order.objects.filter(user=pk), 'created_at'),
+        (Shift.objects.filter(staff=pk), 'clock_in_time', 'clock_out_time'),
+    ))
     def client_profile(self, request, pk=None):
         try:
-            client = Staff.objects.get(id=pk)
+            client = StaffSerializer.setup_eager_loading(Staff.objects.all()).get(id=pk)
         except Staff.DoesNotExist:
             return Response({"message": "無此會員"}, status=status.HTTP_404_NOT_FOUND)
 
         # 序列化
-        serializer = StaffSerializer(client)
+        serializer = StaffSerializer(client, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -500,8 +568,7 @@ class ClientUpdateViewSet(viewsets.ModelViewSet):
             new_image = request.data['image']
             if isinstance(new_image, InMemoryUploadedFile):
                 if new_image.size > 0:
-                    if client.image:
-                        client.image.delete()
+                    delete_image(client)
                     client.image = new_image
             else:
                 client.image = client.image